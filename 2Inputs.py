@@ -9,8 +9,10 @@ Created on Tue Sep 16 11:29:11 2025
 
 
 from dash import Dash, dcc, html, Input, Output
+from serve import launch
 
 app = Dash(__name__)
+server = app.server
 
 app.layout = html.Div([
     html.H2("Basic Dashboard2"),
@@ -60,9 +62,4 @@ def update_output(selected_var1, selected_var2):
 
 
 if __name__ == "__main__":
-    url = "http://127.0.0.1:9000/"
-    print(f"Your Dash app is running at: {url}")
-    
-    import webbrowser
-    webbrowser.open(url)
-    app.run(debug=True, port=9000)   
+    launch(app, port=9000)
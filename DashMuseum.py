@@ -8,6 +8,7 @@ Created on Wed Sep 10 11:09:46 2025
 import dash
 from dash import dcc, html
 import plotly.express as px
+from serve import launch
 
 # Example graph using Plotly Express
 fig = px.scatter(
@@ -19,6 +20,7 @@ fig = px.scatter(
 
 ##START OF APP
 app = dash.Dash(__name__)
+server = app.server
 
 app.layout = html.Div([
     html.H1("Dash Components Showcase"),
@@ -130,12 +132,7 @@ app.layout = html.Div([
 
 #Running the app 
 if __name__ == "__main__":
-    url = "http://127.0.0.1:9000/"
-    print(f"Your Dash app is running at: {url}")
-    
-    import webbrowser
-    webbrowser.open(url)
-    app.run(debug=True, port=9000) 
+    launch(app, port=9000)
     
 ###@app-callback used for interactive asepct 
 #ie. @app.callback(
@@ -5,13 +5,23 @@ Created on Wed Oct 29 12:57:07 2025
 
 @author: katedamato
 """
-import pandas as pd
+import os
 import dash
-from dash import Dash, dcc, html, Input, Output
+from dash import Dash, dcc, html, Input, Output, State, DiskcacheManager
 import dash_bootstrap_components as dbc
 import plotly.express as px
-import webbrowser
 import plotly.io as pio
+from functools import lru_cache
+from weo_data import (load_weo, add_twin_deficits, add_transforms, format_report, file_hash, prune_cache,
+                      WEO_PATH, WEO_SMALL_PATH, CACHE_DIR)
+from weo_index import WideIndex
+from weo_cube import WeoCube, shared_cube
+from weo_stats import PairCorrelations, grouped_pearson
+from weo_reload import DatasetManager
+from weo_figures import add_trendlines, resolve_render_mode, show_markers, decimate_traces, figure_patch
+from figure_cache import FigureCache, normalize_selection, serialize
+from dash_metrics import instrument, stage
+from serve import launch
 
 pio.renderers.default = "browser"
 
@@ -19,190 +29,215 @@ pio.renderers.default = "browser"
 # Load data
 # -------------------------------------------------------------
 debug = True
-if debug: 
-    df = pd.read_csv(
-        "/Users/katedamato/Downloads/WEO_data_small.csv",
-        index_col=0,
-        engine='python',
-        on_bad_lines='skip'
-    )
-else:
-    df = pd.read_csv(
-        "/Users/katedamato/Downloads/WEO_data-2.csv",
-        index_col=0,
-        engine='python',
-        on_bad_lines='skip'
-    )
+use_cube = True  # dense numpy cube backend instead of pandas row lookups
+render_mode = "auto"  # "svg", "webgl", or "auto" (WebGL for large figures)
+background_traces = 150  # uncached figures with more traces than this are built by a background job
+data_path = WEO_SMALL_PATH if debug else WEO_PATH
+calculated_columns = ["Net_Exports_Goods_Services", "Capital_Account_Balance"]
 
+def load_dataset(path):
+    """Everything the dashboard derives from the WEO file; rebuilt when it changes."""
+    df, df_wide, load_report = load_weo(path, compact=True, return_report=True)
+    print(format_report(load_report))
 
-#return 
-df = df[pd.to_numeric(df["OBS_VALUE"], errors="coerce").notna()]
-df = df[~df["STRUCTURE_ID"].str.contains("Start/end months", na=False)]
+    # Twin deficits variables, and per-country first differences so "First Differences" is a column switch
+    df_wide = add_transforms(add_twin_deficits(df_wide))
 
-df_wide = df.pivot(
-    index=["REF_AREA_ID", "REF_AREA_NAME", "TIME_PERIOD"],
-    columns="INDICATOR_NAME",
-    values=["OBS_VALUE", "COMMENT_OBS"]
-)
+    # Row lookups by country, or the dense cube, memory-mapped once for every worker.
+    # With the cube, df_wide is dropped once the options are read from it
+    backend = shared_cube(df_wide, path) if use_cube else WideIndex(df_wide)
 
-df_wide.columns = [f"{val}_{col}" for val, col in df_wide.columns]
-df_wide = df_wide.reset_index()
+    # Per-country correlations of every indicator pair, filled in the background
+    pair_corr = PairCorrelations(backend if use_cube else WeoCube.from_wide(df_wide)).start()
 
-# -------------------------------------------------------------
-# Create Twin Deficits Variables
-# -------------------------------------------------------------
-df_wide['Net_Exports_Goods_Services'] = (
-    df_wide.get('OBS_VALUE_Volume of exports of goods and services, Percent change', 0) -
-    df_wide.get('OBS_VALUE_Volume of imports of goods and services, Percent change', 0)
-)
+    # Dropdown options: regular indicators, then the calculated columns
+    obs_columns = [col for col in df_wide.columns if col.startswith("OBS_VALUE_")]
+    variable_options = [{"label": col.replace("OBS_VALUE_", ""), "value": col} for col in obs_columns]
+    variable_options += [{"label": col.replace("_", " "), "value": col} for col in calculated_columns]
+    country_options = [{"label": c, "value": c} for c in sorted(df_wide["REF_AREA_NAME"].unique())]
 
-df_wide['Capital_Account_Balance'] = (
-    df_wide.get('OBS_VALUE_Current account balance, Percent of GDP', 0) -
-    df_wide['Net_Exports_Goods_Services']
-)
+    return {
+        "content": file_hash(path),  # sha1 of the csv: stable across restarts, unlike the version
+        "backend": backend, "pair_corr": pair_corr,
+        "obs_columns": obs_columns, "variable_options": variable_options, "country_options": country_options,
+    }
 
-# -------------------------------------------------------------
-# Dropdown Options
-# -------------------------------------------------------------
-obs_columns = [col for col in df_wide.columns if col.startswith("OBS_VALUE_")]
-clean_names = [col.replace("OBS_VALUE_", "") for col in obs_columns]
-
-# Regular indicators
-variable_options = [
-    {"label": clean, "value": col}
-    for clean, col in zip(clean_names, obs_columns)
-]
-
-# Add calculated columns
-calculated_columns = ["Net_Exports_Goods_Services", "Capital_Account_Balance"]
-variable_options += [
-    {"label": col.replace("_", " "), "value": col} for col in calculated_columns
-]
-
-# Country options
-country_options = [{"label": c, "value": c} for c in sorted(df_wide["REF_AREA_NAME"].unique())]
+# The current data, reloaded in the background when the csv changes
+dataset = DatasetManager(data_path, load_dataset).start()
 
 # -------------------------------------------------------------
 # Initialize Dash app
 # -------------------------------------------------------------
-app = Dash(__name__, external_stylesheets=[dbc.themes.FLATLY])
-app.layout = dbc.Container(
-    fluid=True,
-    children=[
-        dbc.Row(dbc.Col(html.H2("Economic Indicators Dashboard", className="text-center text-primary my-4"), width=12)),
-
-        dbc.Row([
-            dbc.Col(
-                dbc.Card(dbc.CardBody([
-                    html.Label("Select Countries:", className="fw-bold"),
-                    dcc.Dropdown(id="country_selector", options=country_options, multi=True)
-                ])), width=6
-            ),
-            dbc.Col(
-                dbc.Card(dbc.CardBody([
-                    html.Label("Select Indicators:", className="fw-bold"),
-                    dcc.Dropdown(id="variable_selector", options=variable_options, multi=True, value=[obs_columns[0]])
-                ])), width=6
-            )
-        ]),
-
-        dbc.Row(
-            dbc.Col(
-                dbc.Card(dbc.CardBody([
-                    html.Label("Data Type:", className="fw-bold"),
-                    dcc.RadioItems(
-                        id="data_type_selector",
-                        options=[{"label": "Level", "value": "level"}, {"label": "First Differences", "value": "diff"}],
-                        value="level",
-                        inline=True
-                    )
-                ])), width=6
-            )
-        ),
-
-        dbc.Row([
-            dbc.Col(
-                dbc.Card(dbc.CardBody([
-                    dcc.Tabs(id="tabs", value="tab1", children=[
-                        dcc.Tab(label="By Variable", value="tab1"),
-                        dcc.Tab(label="By Country", value="tab2"),
-                    ]),
-                    html.Div(id="tab_description", className="mb-3", style={"fontStyle": "italic", "color": "#555"}),
-                    dcc.Graph(id="line_graph", style={"height": "80vh"})
-                ])), width=6
+# Background jobs run in subprocesses with results in a local SQLite store
+# (pip install "dash[diskcache]"); without it every figure is built in the request.
+# The store outlives the process and is shared by the workers, so results are
+# keyed on the csv's contents rather than on the per-process version counter.
+# Jobs also leave their figures in it for the parent's plot cache (peek_plot)
+try:
+    import diskcache
+    job_store = diskcache.Cache(os.path.join(CACHE_DIR, "background_jobs"))
+    background_manager = DiskcacheManager(job_store, cache_by=[lambda: dataset.current.content], expire=3600)
+except ImportError:
+    job_store = background_manager = None
+
+app = Dash(__name__, external_stylesheets=[dbc.themes.FLATLY], background_callback_manager=background_manager)
+metrics = instrument(app)  # callback timings at /metrics
+server = app.server  # WSGI entry point, e.g. gunicorn --preload -c python:serve module:server
+
+HIDDEN, SHOWN = {"display": "none"}, {"display": "block", "width": "100%"}
+
+def serve_layout():
+    # Built per page load, so a new page gets the current dropdown options
+    data = dataset.current
+    return dbc.Container(
+        fluid=True,
+        children=[
+            dbc.Row(dbc.Col(html.H2("Economic Indicators Dashboard", className="text-center text-primary my-4"), width=12)),
+
+            dbc.Row([
+                dbc.Col(
+                    dbc.Card(dbc.CardBody([
+                        html.Label("Select Countries:", className="fw-bold"),
+                        dcc.Dropdown(id="country_selector", options=data.country_options, multi=True)
+                    ])), width=6
+                ),
+                dbc.Col(
+                    dbc.Card(dbc.CardBody([
+                        html.Label("Select Indicators:", className="fw-bold"),
+                        dcc.Dropdown(id="variable_selector", options=data.variable_options, multi=True,
+                                     value=[data.obs_columns[0]])
+                    ])), width=6
+                )
+            ]),
+
+            dbc.Row(
+                dbc.Col(
+                    dbc.Card(dbc.CardBody([
+                        html.Label("Data Type:", className="fw-bold"),
+                        dcc.RadioItems(
+                            id="data_type_selector",
+                            options=[{"label": "Level", "value": "level"}, {"label": "First Differences", "value": "diff"}],
+                            value="level",
+                            inline=True
+                        )
+                    ])), width=6
+                )
             ),
-            dbc.Col(
-                dbc.Card(dbc.CardBody([
-                    html.Label("Correlation Graph", className="fw-bold"),
-                    html.Div(id="corr_message", style={"marginBottom": "10px", "color": "#555"}),
-                    dcc.Graph(id="corr_graph", style={"height": "80vh"})
-                ])), width=6
-            )
-        ])
-    ]
-)
-
-# -------------------------------------------------------------
-# Plot Generator
-# -------------------------------------------------------------
-def generate_all_plots(selected_countries, selected_variables, data_type="level"):
-    plots = {}
 
-    if not selected_countries or not selected_variables:
-        empty_fig = px.line(title="Please select at least one country and one indicator")
-        empty_scatter = px.scatter(title="Select exactly two indicators")
-        plots['by_country'] = {"plot": empty_fig, "descr": ""}
-        plots['by_variable'] = {"plot": empty_fig, "descr": ""}
-        plots['scatterplot'] = {"plot": empty_scatter, "descr": ""}
-        return plots
-
-    dff = df_wide[df_wide["REF_AREA_NAME"].isin(selected_countries)].copy()
-    dff["TIME_PERIOD"] = pd.to_numeric(dff["TIME_PERIOD"], errors="coerce")
-    dff = dff.sort_values(["REF_AREA_NAME", "TIME_PERIOD"])
-
-    # Ensure all selected variables exist and numeric
-    for col in selected_variables:
-        if col not in dff.columns:
-            dff[col] = pd.to_numeric(dff[col], errors="coerce")
-
-    if data_type == "diff":
-        dff[selected_variables] = dff[selected_variables].apply(pd.to_numeric, errors="coerce")
-        dff[selected_variables] = dff.groupby("REF_AREA_NAME")[selected_variables].transform('diff')
-
-    dff_melt = dff.melt(
-        id_vars=["REF_AREA_NAME", "TIME_PERIOD"],
-        value_vars=selected_variables,
-        var_name="Indicator",
-        value_name="Value"
+            dbc.Row([
+                dbc.Col(
+                    dbc.Card(dbc.CardBody([
+                        dcc.Tabs(id="tabs", value="tab1", children=[
+                            dcc.Tab(label="By Variable", value="tab1"),
+                            dcc.Tab(label="By Country", value="tab2"),
+                        ]),
+                        html.Div(id="tab_description", className="mb-3", style={"fontStyle": "italic", "color": "#555"}),
+                        html.Progress(id="line_progress", max="3", style=HIDDEN),
+                        dcc.Store(id="line_job"),
+                        dcc.Graph(id="line_graph", style={"height": "80vh"}),
+                        dcc.Store(id="line_graph_state")
+                    ])), width=6
+                ),
+                dbc.Col(
+                    dbc.Card(dbc.CardBody([
+                        html.Label("Correlation Graph", className="fw-bold"),
+                        html.Div(id="corr_message", style={"marginBottom": "10px", "color": "#555"}),
+                        dcc.RadioItems(
+                            id="trendline_selector",
+                            options=[{"label": "OLS", "value": "ols"}, {"label": "Robust (Huber)", "value": "huber"},
+                                     {"label": "LOWESS", "value": "lowess"}],
+                            value="ols",
+                            inline=True
+                        ),
+                        html.Progress(id="corr_progress", max="3", style=HIDDEN),
+                        dcc.Store(id="corr_job"),
+                        dcc.Graph(id="corr_graph", style={"height": "80vh"})
+                    ])), width=6
+                )
+            ])
+        ]
     )
 
-    # Clean indicator names
-    dff_melt["Indicator"] = dff_melt["Indicator"].str.replace("OBS_VALUE_", "", regex=False)
-    dff_melt["Indicator"] = dff_melt["Indicator"].str.replace("_", " ")
+app.layout = serve_layout
+
+# -------------------------------------------------------------
+# Shared selection frame
+# -------------------------------------------------------------
+base_colors = px.colors.qualitative.Dark24
+def get_color(i): return base_colors[i % len(base_colors)]
+
+def build_selection(selected_countries, selected_variables, data_type="level", data=None):
+    """Filtered frame, melted frame and colour maps used by every figure builder."""
+    with stage("filter"):
+        dff = (data or dataset.get().backend).select(selected_countries, selected_variables, data_type)
+
+    with stage("transform"):
+        dff_melt = dff.melt(
+            id_vars=["REF_AREA_NAME", "TIME_PERIOD"],
+            value_vars=selected_variables,
+            var_name="Indicator",
+            value_name="Value"
+        )
 
-    base_colors = px.colors.qualitative.Dark24
-    def get_color(i): return base_colors[i % len(base_colors)]
+        # Clean indicator names
+        dff_melt["Indicator"] = dff_melt["Indicator"].str.replace("OBS_VALUE_", "", regex=False)
+        dff_melt["Indicator"] = dff_melt["Indicator"].str.replace("_", " ")
 
     country_colors = {c: get_color(i) for i, c in enumerate(selected_countries)}
     indicator_names = dff_melt["Indicator"].unique()
     indicator_colors = {v: get_color(i) for i, v in enumerate(indicator_names)}
 
-    # By Variable
+    return {"dff": dff, "melt": dff_melt, "country_colors": country_colors, "indicator_colors": indicator_colors}
+
+@lru_cache(maxsize=16)
+def _cached_selection(vintage, countries, variables, data_type):
+    return build_selection(list(countries), list(variables), data_type, vintage.backend)
+
+def get_selection(selected_countries, selected_variables, data_type="level", data=None):
+    # One filtered frame per selection and data version, shared by the builders of each callback
+    if data is not None:
+        return build_selection(selected_countries, selected_variables, data_type, data)
+    return _cached_selection(dataset.get(), tuple(selected_countries), tuple(selected_variables), data_type)
+
+# -------------------------------------------------------------
+# Figure builders
+# -------------------------------------------------------------
+@stage("figure")
+def build_by_variable(selected_countries, selected_variables, data_type="level", data=None, render_mode="auto"):
+    if not selected_countries or not selected_variables:
+        return {"plot": px.line(title="Please select at least one country and one indicator"), "descr": ""}
+    sel = get_selection(selected_countries, selected_variables, data_type, data)
+    n_points = len(sel["melt"])
+    render_mode = resolve_render_mode(render_mode, n_points)
+
     fig_var = px.line(
-        dff_melt, x="TIME_PERIOD", y="Value", color="REF_AREA_NAME", facet_row="Indicator",
-        markers=True, title="Economic Indicators Over Time (By Variable)", color_discrete_map=country_colors
+        sel["melt"], x="TIME_PERIOD", y="Value", color="REF_AREA_NAME", facet_row="Indicator",
+        markers=show_markers(n_points), render_mode=render_mode,
+        title="Economic Indicators Over Time (By Variable)", color_discrete_map=sel["country_colors"]
     )
+    if render_mode == "webgl":
+        decimate_traces(fig_var)
     fig_var.update_yaxes(matches=None)
     fig_var.update_layout(height=400 + 300 * len(selected_variables), template="plotly_white", legend_title_text="Country")
     fig_var.for_each_annotation(lambda a: a.update(text=a.text.split("=")[-1]))
 
-    plots["by_variable"] = {"plot": fig_var, "descr": "Each subplot shows one indicator."}
+    return {"plot": fig_var, "descr": "Each subplot shows one indicator."}
+
+@stage("figure")
+def build_by_country(selected_countries, selected_variables, data_type="level", data=None, render_mode="auto"):
+    if not selected_countries or not selected_variables:
+        return {"plot": px.line(title="Please select at least one country and one indicator"), "descr": ""}
+    sel = get_selection(selected_countries, selected_variables, data_type, data)
+    n_points = len(sel["melt"])
+    render_mode = resolve_render_mode(render_mode, n_points)
 
-    # By Country
     fig_country = px.line(
-        dff_melt, x="TIME_PERIOD", y="Value", color="Indicator", facet_row="REF_AREA_NAME",
-        markers=True, title="Economic Indicators Over Time (By Country)", color_discrete_map=indicator_colors
+        sel["melt"], x="TIME_PERIOD", y="Value", color="Indicator", facet_row="REF_AREA_NAME",
+        markers=show_markers(n_points), render_mode=render_mode,
+        title="Economic Indicators Over Time (By Country)", color_discrete_map=sel["indicator_colors"]
     )
+    if render_mode == "webgl":
+        decimate_traces(fig_country)
     fig_country.update_yaxes(matches=None)
     fig_country.update_layout(
         height=400 + 300 * len(selected_countries),
@@ -219,63 +254,224 @@ def generate_all_plots(selected_countries, selected_variables, data_type="level"
     )
     fig_country.for_each_annotation(lambda a: a.update(text=a.text.split("=")[-1]))
 
-    plots["by_country"] = {"plot": fig_country, "descr": "Each subplot shows one country."}
-
-    # Scatter Correlation
-    if len(selected_variables) == 2:
-        var_x, var_y = selected_variables
-        df_scatter = dff[["REF_AREA_NAME", var_x, var_y]].dropna()
-        fig_scatter = px.scatter(df_scatter, x=var_x, y=var_y, color="REF_AREA_NAME",
-                                 trendline="ols", color_discrete_map=country_colors,
-                                 title="Correlation Between Selected Indicators")
-
-        start_y = 0.80
-        spacing = 0.07
-
-        for idx, country in enumerate(selected_countries):
-            temp = df_scatter[df_scatter["REF_AREA_NAME"] == country]
-            if not temp.empty:
-                r = temp[var_x].corr(temp[var_y])
-                fig_scatter.add_annotation(
-                    text=f"{country}: r = {r:.2f}",
-                    xref="paper", yref="paper",
-                    x=1.25, y=start_y - idx * spacing,
-                    showarrow=False,
-                    font=dict(size=14, color="black"),
-                    align="left",
-                    bgcolor="white",
-                    bordercolor="black",
-                    borderpad=4
-                )
+    return {"plot": fig_country, "descr": "Each subplot shows one country."}
+
+@stage("figure")
+def build_scatterplot(selected_countries, selected_variables, data_type="level", data=None, trendline="ols",
+                      render_mode="auto"):
+    if not selected_countries or not selected_variables or len(selected_variables) != 2:
+        return {"plot": px.scatter(title="Select exactly two indicators"), "descr": ""}
+    sel = get_selection(selected_countries, selected_variables, data_type, data)
+
+    var_x, var_y = selected_variables
+    df_scatter = sel["dff"][["REF_AREA_NAME", var_x, var_y]].dropna()
+    render_mode = resolve_render_mode(render_mode, len(df_scatter))
+    fig_scatter = px.scatter(df_scatter, x=var_x, y=var_y, color="REF_AREA_NAME",
+                             color_discrete_map=sel["country_colors"], render_mode=render_mode,
+                             title="Correlation Between Selected Indicators")
+    if render_mode == "webgl":
+        decimate_traces(fig_scatter)
+
+    # Fitted lines for every country from one grouped fit
+    add_trendlines(fig_scatter, df_scatter["REF_AREA_NAME"], df_scatter[var_x], df_scatter[var_y],
+                   trendline, sel["country_colors"])
+
+    start_y = 0.80
+    spacing = 0.07
+
+    # Per-country r from the precomputed pair matrix, or one grouped pass
+    corr = dataset.get().pair_corr.lookup(selected_countries, var_x, var_y, data_type) if data is None else None
+    if corr is None:
+        corr = grouped_pearson(df_scatter["REF_AREA_NAME"], df_scatter[var_x], df_scatter[var_y])
+
+    for idx, country in enumerate(selected_countries):
+        if country in corr.index:
+            r = corr.at[country, "r"]
+            fig_scatter.add_annotation(
+                text=f"{country}: r = {r:.2f}",
+                xref="paper", yref="paper",
+                x=1.25, y=start_y - idx * spacing,
+                showarrow=False,
+                font=dict(size=14, color="black"),
+                align="left",
+                bgcolor="white",
+                bordercolor="black",
+                borderpad=4
+            )
 
-        plots["scatterplot"] = {"plot": fig_scatter, "descr": ""}
-    else:
-        plots["scatterplot"] = {"plot": px.scatter(title="Select exactly two indicators"), "descr": ""}
+    return {"plot": fig_scatter, "descr": ""}
 
-    return plots
+PLOT_BUILDERS = {
+    "by_variable": build_by_variable,
+    "by_country": build_by_country,
+    "scatterplot": build_scatterplot,
+}
 
+def generate_all_plots(selected_countries, selected_variables, data_type="level", data=None):
+    return {
+        name: build(selected_countries, selected_variables, data_type, data)
+        for name, build in PLOT_BUILDERS.items()
+    }
+
+# -------------------------------------------------------------
+# Figure cache: repeat selections skip the builders
 # -------------------------------------------------------------
+plot_cache = FigureCache(max_bytes=128 * 1024 * 1024, ttl=3600)
+
+def plot_key(name, selected_countries, selected_variables, data_type="level", **options):
+    selection = normalize_selection(selected_countries, selected_variables, data_type)
+    return (dataset.get().version, name) + selection + tuple(sorted(options.items()))
+
+def cached_plot(name, selected_countries, selected_variables, data_type="level", **options):
+    countries, variables, data_type = normalize_selection(selected_countries, selected_variables, data_type)
+    return plot_cache.get_or_build(
+        plot_key(name, countries, variables, data_type, **options),
+        lambda: PLOT_BUILDERS[name](list(countries), list(variables), data_type, **options)
+    )
+
+def job_key(name, selected_countries, selected_variables, data_type="level", **options):
+    # Jobs run in other processes (and may outlive this one): keyed on the data's contents
+    selection = normalize_selection(selected_countries, selected_variables, data_type)
+    return ("plot", dataset.get().content, name) + selection + tuple(sorted(options.items()))
+
+def peek_plot(name, selected_countries, selected_variables, data_type="level", **options):
+    """Cached plot, or one a background job built, or None without building it."""
+    key = plot_key(name, selected_countries, selected_variables, data_type, **options)
+    plot = plot_cache.get(key)
+    if plot is None and job_store is not None:
+        entry = job_store.get(job_key(name, selected_countries, selected_variables, data_type, **options))
+        if entry is not None:
+            plot, size = entry
+            plot_cache.put(key, plot, size)
+    return plot
+
+def in_background(name, selected_countries, selected_variables, data_type="level", **options):
+    # Large figures not built yet in this process go to a background job
+    if background_manager is None:
+        return False
+    per_country = 2 if name == "scatterplot" else len(selected_variables or [])
+    if len(set(selected_countries or [])) * per_country <= background_traces:
+        return False
+    return peek_plot(name, selected_countries, selected_variables, data_type, **options) is None
+
+@dataset.on_swap
+def clear_caches(new, old):
+    # Figures and selections of the old data are never asked for again
+    _cached_selection.cache_clear()
+    plot_cache.clear()
+
+@dataset.on_release
+def prune_files(old):
+    # Once no callback reads the old vintage, its cached tables and cube files can go
+    prune_cache(data_path, keep=[dataset.current.stamp[1]])
+
+@app.server.route("/cache-stats")
+def cache_stats():
+    return plot_cache.stats()
+
+# -------------------------------------------------------------
+# Callbacks: the tab only drives the line graph
+# -------------------------------------------------------------
+LINE_INPUTS = [Input("country_selector", "value"), Input("variable_selector", "value"),
+               Input("tabs", "value"), Input("data_type_selector", "value")]
+CORR_INPUTS = [Input("country_selector", "value"), Input("variable_selector", "value"),
+               Input("data_type_selector", "value"), Input("trendline_selector", "value")]
+
 @app.callback(
     Output("line_graph", "figure"),
     Output("tab_description", "children"),
+    Output("line_graph_state", "data"),
+    Output("line_job", "data"),
+    *LINE_INPUTS,
+    State("line_graph_state", "data")
+)
+@dataset.pin()
+def update_line_graph(selected_countries, selected_variables, selected_tab, data_type, shown):
+    name = "by_variable" if selected_tab == "tab1" else "by_country"
+    # Normalized, so a reordered selection is the same job (and cache_by entry)
+    job = [name, *map(list, normalize_selection(selected_countries, selected_variables)[:2]), data_type]
+    if in_background(*job, render_mode=render_mode):
+        return dash.no_update, "Building the figure…", dash.no_update, job
+
+    plot = cached_plot(*job, render_mode=render_mode)
+    state = job + [dataset.get().version]
+    return line_figure(plot, state, shown), plot['descr'], state, dash.no_update
+
+def line_figure(plot, state, shown):
+    """What to send for plot: a patch from the cached figure the page shows (per its state), else the figure."""
+    same_data = shown and shown[0] == state[0] and shown[4:] == state[4:]
+    old = peek_plot(*shown[:4], render_mode=render_mode) if same_data else None
+    if old is not None:
+        with stage("patch"):
+            patch = figure_patch(old['plot'], plot['plot'])
+        if patch is not None:
+            return patch
+    return plot['plot']
+
+@app.callback(
     Output("corr_graph", "figure"),
     Output("corr_message", "children"),
-    Input("country_selector", "value"),
-    Input("variable_selector", "value"),
-    Input("tabs", "value"),
-    Input("data_type_selector", "value")
+    Output("corr_job", "data"),
+    *CORR_INPUTS
 )
-def update_all(selected_countries, selected_variables, selected_tab, data_type):
-    plots = generate_all_plots(selected_countries, selected_variables, data_type)
+@dataset.pin()
+def update_corr(selected_countries, selected_variables, data_type, trendline):
+    job = ["scatterplot", *map(list, normalize_selection(selected_countries, selected_variables)[:2]), data_type]
+    if in_background(*job, trendline=trendline, render_mode=render_mode):
+        return dash.no_update, "Building the figure…", job + [trendline]
+    plot = cached_plot(*job, trendline=trendline, render_mode=render_mode)
+    return plot['plot'], plot['descr'], dash.no_update
 
-    if selected_tab == "tab1":
-        return plots['by_variable']['plot'], plots['by_variable']['descr'], plots['scatterplot']['plot'], plots['scatterplot']['descr']
-    else:
-        return plots['by_country']['plot'], plots['by_country']['descr'], plots['scatterplot']['plot'], plots['scatterplot']['descr']
+# -------------------------------------------------------------
+# Background builds: a progress bar while running, cancelled by a new selection
+# -------------------------------------------------------------
+def build_in_steps(set_progress, name, countries, variables, data_type, **options):
+    # Runs in the job's subprocess, whose plot_cache dies with it: the figure goes to the
+    # shared job store instead, where peek_plot in the serving process finds it, so the
+    # next change of selection is sent as a patch against it
+    countries, variables, data_type = normalize_selection(countries, variables, data_type)
+    set_progress(("1", "3"))
+    get_selection(list(countries), list(variables), data_type)
+    set_progress(("2", "3"))
+    plot, size = serialize(PLOT_BUILDERS[name](list(countries), list(variables), data_type, **options))
+    job_store.set(job_key(name, countries, variables, data_type, **options), (plot, size), expire=3600)
+    return plot
+
+if background_manager is not None:
+    @app.callback(
+        Output("line_graph", "figure", allow_duplicate=True),
+        Output("tab_description", "children", allow_duplicate=True),
+        Output("line_graph_state", "data", allow_duplicate=True),
+        Input("line_job", "data"),
+        State("line_graph_state", "data"),
+        background=True,
+        progress=[Output("line_progress", "value"), Output("line_progress", "max")],
+        running=[(Output("line_progress", "style"), SHOWN, HIDDEN)],
+        cancel=LINE_INPUTS,
+        prevent_initial_call=True
+    )
+    @dataset.pin()
+    def build_line_graph(set_progress, job, shown):
+        plot = build_in_steps(set_progress, *job, render_mode=render_mode)
+        state = job + [dataset.get().version]
+        return line_figure(plot, state, shown), plot['descr'], state
+
+    @app.callback(
+        Output("corr_graph", "figure", allow_duplicate=True),
+        Output("corr_message", "children", allow_duplicate=True),
+        Input("corr_job", "data"),
+        background=True,
+        progress=[Output("corr_progress", "value"), Output("corr_progress", "max")],
+        running=[(Output("corr_progress", "style"), SHOWN, HIDDEN)],
+        cancel=CORR_INPUTS,
+        prevent_initial_call=True
+    )
+    @dataset.pin()
+    def build_corr(set_progress, job):
+        *selection, trendline = job
+        plot = build_in_steps(set_progress, *selection, trendline=trendline, render_mode=render_mode)
+        return plot['plot'], plot['descr']
 
 # -------------------------------------------------------------
 if __name__ == "__main__":
-    url = "http://127.0.0.1:9000/"
-    print(f"Your Dash app is running at: {url}")
-    webbrowser.open(url)
-    app.run(debug=True, port=9000)
+    launch(app, port=9000, wait_for=[dataset.current.pair_corr.ready])
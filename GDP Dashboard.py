@@ -4,30 +4,21 @@ from dash import Dash, dcc, html, Input, Output
 import dash_bootstrap_components as dbc
 import plotly.express as px
 import plotly.colors as pc
-import webbrowser
+from weo_data import load_weo, add_transforms, WEO_V1_PATH
+from weo_figures import add_trendlines
+from dash_metrics import instrument, stage
+from serve import launch
 
 # -------------------------------------------------------------
 # Load data
 # -------------------------------------------------------------
-df = pd.read_csv("/Users/katedamato/Downloads/WEO_data.csv", index_col=0, engine='python',
-                 on_bad_lines='skip')
+# Cleaning, duplicate aggregation and the pivot to wide format are cached
+# by weo_data.load_weo; stream=True averages the duplicates chunk by chunk,
+# so the long table is never held in memory
+_, df_wide = load_weo(WEO_V1_PATH, aggregate=True, stream=True)
 
-# Aggregate duplicates
-df_agg = (df.groupby(
-    ["REF_AREA_ID", "REF_AREA_NAME", "TIME_PERIOD", "INDICATOR_NAME", "UNIT_MEASURE_NAME"],
-    as_index=False
-).agg({"OBS_VALUE": "mean", "COMMENT_OBS": "first"}))
-
-# Pivot to wide format
-df_wide = df_agg.pivot(
-    index=["REF_AREA_ID", "REF_AREA_NAME", "TIME_PERIOD"],
-    columns="INDICATOR_NAME",
-    values=["OBS_VALUE", "COMMENT_OBS"]
-)
-
-# Flatten multi-index column names
-df_wide.columns = [f"{val}_{col}" for val, col in df_wide.columns]
-df_wide = df_wide.reset_index()
+# Per-country first differences (DIFF_ columns) for the correlation graph
+df_wide = add_transforms(df_wide)
 
 # Dropdown options
 country_options = [{"label": c, "value": c} for c in sorted(df_wide["REF_AREA_NAME"].unique())]
@@ -45,6 +36,8 @@ indicator_colors = {v: color_scale[i % len(color_scale)] for i, v in enumerate(c
 # Initialize Dash app
 # -------------------------------------------------------------
 app = Dash(__name__, external_stylesheets=[dbc.themes.FLATLY])
+metrics = instrument(app)  # callback timings at /metrics
+server = app.server
 
 app.layout = dbc.Container(
     fluid=True,
@@ -152,16 +145,22 @@ def update_graph(selected_countries, selected_variables, selected_tab):
     if not selected_countries or not selected_variables:
         return px.line(title="Please select at least one country and one indicator"), ""
     
-    dff = df_wide[df_wide["REF_AREA_NAME"].isin(selected_countries)]
+    with stage("filter"):
+        dff = df_wide[df_wide["REF_AREA_NAME"].isin(selected_countries)]
     
-    dff_melt = dff.melt(
-        id_vars=["REF_AREA_NAME", "TIME_PERIOD"],
-        value_vars=selected_variables,
-        var_name="Indicator",
-        value_name="Value"
-    )
-    dff_melt["Indicator"] = dff_melt["Indicator"].str.replace("OBS_VALUE_", "", regex=False)
+    with stage("transform"):
+        dff_melt = dff.melt(
+            id_vars=["REF_AREA_NAME", "TIME_PERIOD"],
+            value_vars=selected_variables,
+            var_name="Indicator",
+            value_name="Value"
+        )
+        dff_melt["Indicator"] = dff_melt["Indicator"].str.replace("OBS_VALUE_", "", regex=False)
     
+    return line_figure(dff_melt, selected_countries, selected_variables, selected_tab)
+
+@stage("figure")
+def line_figure(dff_melt, selected_countries, selected_variables, selected_tab):
     if selected_tab == "tab1":
         fig = px.line(
             dff_melt,
@@ -219,39 +218,47 @@ def update_corr_graph(selected_countries, selected_variables, selected_tab, corr
 
     var_x, var_y = selected_variables
 
-    if selected_tab == "tab2":
-        country = selected_countries[0]
-       #data set for country, time and variables selected
-        df_corr = df_wide[df_wide["REF_AREA_NAME"] == country][
-            ["TIME_PERIOD", var_x, var_y]
-        ].dropna().reset_index(drop=True)
-        color_arg = None
-        colors = ["#636EFA", "#00CC96"]  # just two colors for trendline consistency
-    else:
-        # tab1: multiple countries
-        df_corr = df_wide[df_wide["REF_AREA_NAME"].isin(selected_countries)][
-            ["TIME_PERIOD", "REF_AREA_NAME", var_x, var_y]
-        ].dropna().reset_index(drop=True)
-        color_arg = "REF_AREA_NAME"
-        colors = px.colors.qualitative.Dark24
+    # First differences come from the precomputed per-country DIFF_ columns
+    prefix = "DIFF_" if corr_type == "diff" else ""
+    value_cols = {f"{prefix}{var_x}": var_x, f"{prefix}{var_y}": var_y}
 
-    # Apply first differences if needed
-    if corr_type == "diff":
-        df_corr[var_x] = df_corr[var_x].diff()
-        df_corr[var_y] = df_corr[var_y].diff()
-        df_corr = df_corr.dropna().reset_index(drop=True)
+    with stage("filter"):
+        if selected_tab == "tab2":
+            country = selected_countries[0]
+           #data set for country, time and variables selected
+            df_corr = df_wide[df_wide["REF_AREA_NAME"] == country][
+                ["TIME_PERIOD", *value_cols]
+            ].rename(columns=value_cols).dropna().reset_index(drop=True)
+            color_arg = None
+            colors = ["#636EFA", "#00CC96"]  # just two colors for trendline consistency
+        else:
+            # tab1: multiple countries
+            df_corr = df_wide[df_wide["REF_AREA_NAME"].isin(selected_countries)][
+                ["TIME_PERIOD", "REF_AREA_NAME", *value_cols]
+            ].rename(columns=value_cols).dropna().reset_index(drop=True)
+            color_arg = "REF_AREA_NAME"
+            colors = px.colors.qualitative.Dark24
 
+    return corr_figure(df_corr, var_x, var_y, color_arg, colors, corr_type), f"Correlation between {var_x} and {var_y}"
+
+@stage("figure")
+def corr_figure(df_corr, var_x, var_y, color_arg, colors, corr_type):
     # Build scatter plot
     fig = px.scatter(
         df_corr,
         x=var_x,
         y=var_y,
         color=color_arg,
-        trendline="ols",
         color_discrete_sequence=colors,
         title=f"{'First Differences' if corr_type=='diff' else 'Level'} Correlation"
     )
 
+    # OLS lines from one grouped fit, coloured like px assigns the markers
+    groups = df_corr[color_arg] if color_arg else None
+    labels = groups.unique() if color_arg else [""]
+    add_trendlines(fig, groups, df_corr[var_x], df_corr[var_y],
+                   colors={g: colors[i % len(colors)] for i, g in enumerate(labels)})
+
     # Calculate and display correlation coefficient
     if not df_corr.empty:
         corr_coef = df_corr[var_x].corr(df_corr[var_y])
@@ -265,14 +272,11 @@ def update_corr_graph(selected_countries, selected_variables, selected_tab, corr
             font=dict(size=12)
         )
 
-    return fig, f"Correlation between {var_x} and {var_y}"
+    return fig
 
 
 # -------------------------------------------------------------
 # Run app
 # -------------------------------------------------------------
 if __name__ == "__main__":
-    url = "http://127.0.0.1:9000/"
-    print(f"Your Dash app is running at: {url}")
-    webbrowser.open(url)
-    app.run(debug=True, port=9000)
+    launch(app, port=9000)
@@ -8,11 +8,16 @@ Created on Tue Sep 16 13:09:29 2025
 
 import dash
 from dash import dcc, html, Input, Output
+import numpy as np
 import pandas as pd
 import plotly.express as px
+from crosstab_cube import CrossTabCube
+from dash_metrics import instrument, stage
+from serve import launch
+from data_registry import read_dataset
 
 # Load the dataset
-df = pd.read_csv("https://vincentarelbundock.github.io/Rdatasets/csv/sampleSelection/Mroz87.csv", index_col=0)
+df = read_dataset("mroz87")
 
 # Ensure kids columns are numeric and drop NA for the slider marks
 df["kids5"] = pd.to_numeric(df["kids5"], errors="coerce")
@@ -21,8 +26,15 @@ df["kids618"] = pd.to_numeric(df["kids618"], errors="coerce")
 kids5_values = sorted(df["kids5"].dropna().astype(int).unique())
 kids618_values = sorted(df["kids618"].dropna().astype(int).unique())
 
+# Work status, hours histogram and hours moments per (kids5, kids618) cell:
+# a slider range is then answered from prefix sums instead of filtering the rows
+cube = CrossTabCube(df[["kids5", "kids618"]], counts={"lfp": df["lfp"]},
+                    values={"hours": df["hours"].where(df["hours"] > 0)}, bins={"hours": 20})
+
 # Create the Dash app
 app = dash.Dash(__name__)
+metrics = instrument(app)  # callback timings at /metrics
+server = app.server
 
 app.layout = html.Div([
     html.H2("Kids & Women's LFP Dashboard"),
@@ -98,41 +110,45 @@ def update_charts(kids5_range, kids618_range):
     k618_lo, k618_hi = norm_range(kids618_range, kids618_values)
 
 
-    # Filter data for selected ranges
-    filtered_df = df[
-        df["kids5"].between(k5_lo, k5_hi, inclusive="both") &
-        df["kids618"].between(k618_lo, k618_hi, inclusive="both")
-    ]
+    # Aggregates of the selected ranges
+    with stage("filter"):
+        selected = cube.query(kids5=(k5_lo, k5_hi), kids618=(k618_lo, k618_hi))
 
     title_suffix = f"(kids under 5 = {k5_lo}–{k5_hi}, kids 6–18 = {k618_lo}–{k618_hi})"
 
     
     # --- Pie chart: working vs not working (lfp column) ---
-    pie_data = filtered_df["lfp"].value_counts().rename_axis("lfp").reset_index(name="count")
-    pie_data["lfp"] = pie_data["lfp"].map({1: "Working", 0: "Not Working"}).fillna(pie_data["lfp"].astype(str))
-
-    pie_chart = px.pie(
-        pie_data,
-        names="lfp",
-        values="count",
-        title=f"Work Status {title_suffix}",
-        hole=0.3
-    )
-
-    # --- Histogram: distribution of hours (exclude zeros) ---
-    hist_df = filtered_df[filtered_df["hours"] > 0]
-
-    hist_chart = px.histogram(
-        hist_df,
-        x="hours",
-        nbins=20,
-        title=f"Distribution of Hours {title_suffix}"
-    )
+    with stage("transform"):
+        lfp_counts = selected.counts("lfp")
+        pie_data = lfp_counts[lfp_counts > 0].reset_index()
+        pie_data["lfp"] = pie_data["lfp"].map({1: "Working", 0: "Not Working"}).fillna(pie_data["lfp"].astype(str))
+
+    with stage("figure"):
+        pie_chart = px.pie(
+            pie_data,
+            names="lfp",
+            values="count",
+            title=f"Work Status {title_suffix}",
+            hole=0.3
+        )
+
+    # --- Histogram: distribution of hours (exclude zeros), in the cube's 20 bins ---
+    with stage("transform"):
+        hist_counts, edges = selected.histogram("hours")
+
+    with stage("figure"):
+        hist_chart = px.bar(
+            x=(edges[:-1] + edges[1:]) / 2,
+            y=hist_counts,
+            labels={"x": "hours", "y": "count"},
+            title=f"Distribution of Hours {title_suffix}"
+        )
+        hist_chart.update_traces(width=np.diff(edges))
+        hist_chart.update_layout(bargap=0)
 
     # --- Summary statistics ---
-    if not hist_df.empty:
-        mean_hours = hist_df["hours"].mean()
-        std_hours = hist_df["hours"].std()
+    n_hours, mean_hours, std_hours = selected.moments("hours")
+    if n_hours:
         summary_text = f"Average hours: {mean_hours:.2f}, Std Dev: {std_hours:.2f}"
     else:
         summary_text = "No positive hours for selected range"
@@ -142,9 +158,4 @@ def update_charts(kids5_range, kids618_range):
 
 
 if __name__ == "__main__":
-    url = "http://127.0.0.1:9000/"
-    print(f"Your Dash app is running at: {url}")
-
-    import webbrowser
-    webbrowser.open(url)
-    app.run(debug=True, port=9000)
+    launch(app, port=9000)
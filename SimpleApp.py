@@ -1,6 +1,8 @@
 from dash import Dash, dcc, html, Input, Output
+from serve import launch
 
 app = Dash(__name__)
+server = app.server
 
 app.layout = html.Div([
     html.H2("Basic Dashboard"),
@@ -31,10 +33,5 @@ def update_output(selected_var):
     return f"You selected: {selected_var}"
 
 if __name__ == "__main__":
-    url = "http://127.0.0.1:9000/"
-    print(f"Your Dash app is running at: {url}")
-    
-    import webbrowser
-    webbrowser.open(url)
-    app.run(debug=True, port=9000)   
+    launch(app, port=9000)
 
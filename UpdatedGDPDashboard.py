@@ -1,94 +1,59 @@
 import pandas as pd
 import dash
-from dash import Dash, dcc, html, Input, Output
+from dash import Dash, dcc, html, Input, Output, State
 import dash_bootstrap_components as dbc
 import plotly.express as px
 import plotly.colors as pc
-import webbrowser
-<<<<<<< Updated upstream
-=======
-import random 
+import hashlib
+from functools import lru_cache
+from weo_stats import grouped_pearson
+from weo_figures import add_trendlines, resolve_render_mode, show_markers, decimate_traces, figure_patch
+from weo_data import load_weo, add_transforms, WEO_PATH
+from figure_cache import FigureCache, normalize_selection
+from dash_metrics import instrument, stage
+from serve import launch
 
->>>>>>> Stashed changes
 
 # -------------------------------------------------------------
 # Load data
 # -------------------------------------------------------------
-df = pd.read_csv(
-<<<<<<< Updated upstream
-    "/Users/katedamato/Downloads/WEO_data.csv",
-=======
-    "/Users/katedamato/Downloads/WEO_data-2.csv",
->>>>>>> Stashed changes
-    index_col=0,
-    engine='python',
-    on_bad_lines='skip'
-)
+# stream=True averages duplicates chunk by chunk without holding the long table
+df, df_wide = load_weo(WEO_PATH, aggregate=True, stream=True)
 
-<<<<<<< Updated upstream
-=======
 #subset of countries - separate based on what you need it for 
 #faster way to read file? multithreaded function 
 
 
 # Check how many duplicate rows there are based on your supposed unique identifiers
+# (needs the long table: load without stream=True)
 if False:
     dupes = df[df.duplicated(subset=["REF_AREA_ID", "REF_AREA_NAME", "TIME_PERIOD", "INDICATOR_NAME"], keep=False)]
     print(f"Total duplicates: {len(dupes)}")
     dupes.head(10)
 
-## Keep only rows where OBS_VALUE is numeric
-df = df[pd.to_numeric(df["OBS_VALUE"], errors="coerce").notna()]
-##Get rid of headers and start/end statments 
-df = df[~df["STRUCTURE_ID"].str.contains("Start/end months", na=False)]
-
-
->>>>>>> Stashed changes
-# Aggregate duplicates
-df_agg = (
-    df.groupby(
-        ["REF_AREA_ID", "REF_AREA_NAME", "TIME_PERIOD", "INDICATOR_NAME", "UNIT_MEASURE_NAME"],
-        as_index=False
-    )
-    .agg({"OBS_VALUE": "mean", "COMMENT_OBS": "first"})
-)
-
-# Pivot to wide format
-df_wide = df_agg.pivot(
-    index=["REF_AREA_ID", "REF_AREA_NAME", "TIME_PERIOD"],
-    columns="INDICATOR_NAME",
-    values=["OBS_VALUE", "COMMENT_OBS"]
-)
+# Numeric filter, start/end month rows, duplicate aggregation and the
+# pivot all happen in weo_data.load_weo (cached after the first run)
 
-# Flatten multi-index column names
-df_wide.columns = [f"{val}_{col}" for val, col in df_wide.columns]
-df_wide = df_wide.reset_index()
 
-<<<<<<< Updated upstream
-=======
+# Per-country first differences, computed once
+df_wide = add_transforms(df_wide)
 
 #OBS columns to numbers 
 obs_columns = [col for col in df_wide.columns if col.startswith("OBS_VALUE_")]
 
->>>>>>> Stashed changes
 # Dropdown options
 country_options = [{"label": c, "value": c} for c in sorted(df_wide["REF_AREA_NAME"].unique())]
 obs_columns = [col for col in df_wide.columns if col.startswith("OBS_VALUE_")]
 clean_names = [col.replace("OBS_VALUE_", "") for col in obs_columns]
 variable_options = [{"label": clean, "value": col} for clean, col in zip(clean_names, obs_columns)]
 
-<<<<<<< Updated upstream
-# Color scales
-color_scale = pc.qualitative.Plotly
-country_colors = {c: color_scale[i % len(color_scale)] for i, c in enumerate(df_wide["REF_AREA_NAME"].unique())}
-indicator_colors = {v: color_scale[i % len(color_scale)] for i, v in enumerate(clean_names)}
-=======
->>>>>>> Stashed changes
 
 # -------------------------------------------------------------
 # Initialize Dash app
 # -------------------------------------------------------------
 app = Dash(__name__, external_stylesheets=[dbc.themes.FLATLY])
+metrics = instrument(app)  # callback timings at /metrics
+server = app.server
 app.layout = dbc.Container(
     fluid=True,
     children=[
@@ -168,7 +133,8 @@ app.layout = dbc.Container(
                             dcc.Tab(label="By Country", value="tab2"),
                         ]),
                         html.Div(id="tab_description", className="mb-3", style={"fontStyle": "italic", "color": "#555"}),
-                        dcc.Graph(id="line_graph", style={"height": "80vh"})
+                        dcc.Graph(id="line_graph", style={"height": "80vh"}),
+                        dcc.Store(id="line_graph_state")
                     ]),
                     className="shadow-sm"
                 ),
@@ -190,106 +156,83 @@ app.layout = dbc.Container(
     ]
 )
 
-<<<<<<< Updated upstream
+
 # -------------------------------------------------------------
-# Function to generate all plots
+# Shared selection frame - one filter/sort/diff/melt per selection
 # -------------------------------------------------------------
-def generate_all_plots(selected_countries, selected_variables, data_type="level"):
-    global plots
-    plots = {}
+base_colors = px.colors.qualitative.Dark24  # 24 distinct colors
 
-=======
+def get_distinct_color(index, name):
+    if index < len(base_colors):
+        return base_colors[index]
+    # a bright color from the name for extra entries, the same in every figure that shows it
+    r, g, b = hashlib.md5(str(name).encode()).digest()[:3]
+    return f"rgb({50 + r * 205 // 255}, {50 + g * 205 // 255}, {50 + b * 205 // 255})"
 
-# Function to generate all plots - replace exactly with at least
-# -------------------------------------------------------------
-def generate_all_plots(selected_countries, selected_variables, data_type="level"):
-    
-    plots = {}
 
-    # Return empty figures if nothing selected
->>>>>>> Stashed changes
-    if not selected_countries or not selected_variables:
-        empty_fig = px.line(title="Please select at least one country and one indicator")
-        empty_scatter = px.scatter(title="Please select exactly two indicators")
-        plots['by_country'] = {"plot": empty_fig, "descr": ""}
-        plots['by_variable'] = {"plot": empty_fig, "descr": ""}
-        plots['scatterplot'] = {"plot": empty_scatter, "descr": ""}
-        return plots
-
-<<<<<<< Updated upstream
-    dff = df_wide[df_wide["REF_AREA_NAME"].isin(selected_countries)].copy()
-
-    # Apply first differences globally if selected
-    if data_type == "diff":
-        dff[selected_variables] = dff[selected_variables].diff()
-        dff = dff.dropna().reset_index(drop=True)
-
-    # Melt for line graphs
-=======
+@lru_cache(maxsize=16)
+def get_selection(selected_countries, selected_variables, data_type="level"):
+    # Arguments are tuples so the result can be cached and shared by both callbacks
+    selected_countries, selected_variables = list(selected_countries), list(selected_variables)
+
     # Subset and sort
-    dff = df_wide[df_wide["REF_AREA_NAME"].isin(selected_countries)].copy()
-    dff["TIME_PERIOD"] = pd.to_numeric(dff["TIME_PERIOD"], errors="coerce")
-    dff = dff.sort_values(["REF_AREA_NAME", "TIME_PERIOD"])
-
-    # Apply first differences per country if selected
-    if data_type == "diff":
-        dff[selected_variables] = dff[selected_variables].apply(pd.to_numeric, errors="coerce")
-        dff[selected_variables] = dff.groupby("REF_AREA_NAME")[selected_variables].transform('diff')
-        dff[selected_variables] = dff[selected_variables].fillna(0)
-
-    # Melt for plotting
->>>>>>> Stashed changes
-    dff_melt = dff.melt(
-        id_vars=["REF_AREA_NAME", "TIME_PERIOD"],
-        value_vars=selected_variables,
-        var_name="Indicator",
-        value_name="Value"
-    )
-    dff_melt["Indicator"] = dff_melt["Indicator"].str.replace("OBS_VALUE_", "", regex=False)
-<<<<<<< Updated upstream
+    with stage("filter"):
+        dff = df_wide[df_wide["REF_AREA_NAME"].isin(selected_countries)].copy()
+        dff["TIME_PERIOD"] = pd.to_numeric(dff["TIME_PERIOD"], errors="coerce")
+        dff = dff.sort_values(["REF_AREA_NAME", "TIME_PERIOD"])
+
+    with stage("transform"):
+        # Apply first differences per country if selected
+        if data_type == "diff":
+            dff[selected_variables] = dff[[f"DIFF_{col}" for col in selected_variables]].to_numpy()
+            dff[selected_variables] = dff[selected_variables].fillna(0)
+
+        # Melt for plotting
+        dff_melt = dff.melt(
+            id_vars=["REF_AREA_NAME", "TIME_PERIOD"],
+            value_vars=selected_variables,
+            var_name="Indicator",
+            value_name="Value"
+        )
+        dff_melt["Indicator"] = dff_melt["Indicator"].str.replace("OBS_VALUE_", "", regex=False)
+        dff_melt["REF_AREA_NAME"] = pd.Categorical(
+            dff_melt["REF_AREA_NAME"], categories=selected_countries, ordered=True
+        )
 
-    # By Variable
-=======
-    dff_melt["REF_AREA_NAME"] = pd.Categorical(
-        dff_melt["REF_AREA_NAME"], categories=selected_countries, ordered=True
-    )
+    # Assign distinct colors to countries and indicators
+    country_colors = {c: get_distinct_color(i, c) for i, c in enumerate(selected_countries)}
+    selected_clean_names = [col.replace("OBS_VALUE_", "") for col in selected_variables]
+    indicator_colors = {v: get_distinct_color(i, v) for i, v in enumerate(selected_clean_names)}
 
-    # -------------------------
-    # Dynamic high-contrast color assignment
-    # -------------------------
-    base_colors = px.colors.qualitative.Dark24  # 24 distinct colors
+    return {"dff": dff, "melt": dff_melt, "country_colors": country_colors, "indicator_colors": indicator_colors}
 
-    def get_distinct_color(index):
-        if index < len(base_colors):
-            return base_colors[index]
-        # generate a random bright color for extra entries
-        return f"rgb({random.randint(50,255)}, {random.randint(50,255)}, {random.randint(50,255)})"
 
-    # Assign distinct colors to countries and indicators
-    country_colors = {c: get_distinct_color(i) for i, c in enumerate(selected_countries)}
-    selected_clean_names = [col.replace("OBS_VALUE_", "") for col in selected_variables]
-    indicator_colors = {v: get_distinct_color(i) for i, v in enumerate(selected_clean_names)}
+# -------------------------------------------------------------
+# Figure builders - each callback only builds the figure it shows
+# -------------------------------------------------------------
+@stage("figure")
+def build_by_variable(selected_countries, selected_variables, data_type="level", render_mode="auto"):
+    if not selected_countries or not selected_variables:
+        return {"plot": px.line(title="Please select at least one country and one indicator"), "descr": ""}
+    sel = get_selection(tuple(selected_countries), tuple(selected_variables), data_type)
+    n_points = len(sel["melt"])
+    render_mode = resolve_render_mode(render_mode, n_points)
 
-    # -------------------------
-    # By Variable Graph
-    # -------------------------
->>>>>>> Stashed changes
     fig_var = px.line(
-        dff_melt,
+        sel["melt"],
         x="TIME_PERIOD",
         y="Value",
         color="REF_AREA_NAME",
         facet_row="Indicator",
-        markers=True,
+        markers=show_markers(n_points),
+        render_mode=render_mode,
         title="Economic Indicators Over Time (By Variable)",
-        color_discrete_map=country_colors,
-<<<<<<< Updated upstream
-        hover_data={"Indicator": True, "REF_AREA_NAME": True, "Value": True, "TIME_PERIOD": True}
-=======
+        color_discrete_map=sel["country_colors"],
         hover_data={"Indicator": True, "REF_AREA_NAME": True, "Value": True, "TIME_PERIOD": True},
         category_orders={"REF_AREA_NAME": selected_countries}
->>>>>>> Stashed changes
     )
+    if render_mode == "webgl":
+        decimate_traces(fig_var)
     fig_var.update_yaxes(matches=None)
     fig_var.update_layout(
         height=400 + 300 * len(selected_variables),
@@ -298,39 +241,35 @@ def generate_all_plots(selected_countries, selected_variables, data_type="level"
         legend_title_text="Country"
     )
     fig_var.for_each_annotation(lambda a: a.update(text=a.text.split("=")[-1]))
-<<<<<<< Updated upstream
-    
-    #assign to dictionary
-    
-    plots["by_variable"] = {"plot": fig_var, "descr": "Each subplot shows a different economic indicator. Lines represent countries."}
-
-    # By Country
-=======
-    plots["by_variable"] = {
+    return {
         "plot": fig_var,
         "descr": "Each subplot shows a different economic indicator. Lines represent countries."
     }
 
-    # -------------------------
-    # By Country Graph
-    # -------------------------
->>>>>>> Stashed changes
+
+@stage("figure")
+def build_by_country(selected_countries, selected_variables, data_type="level", render_mode="auto"):
+    if not selected_countries or not selected_variables:
+        return {"plot": px.line(title="Please select at least one country and one indicator"), "descr": ""}
+    sel = get_selection(tuple(selected_countries), tuple(selected_variables), data_type)
+    n_points = len(sel["melt"])
+    render_mode = resolve_render_mode(render_mode, n_points)
+
     fig_country = px.line(
-        dff_melt,
+        sel["melt"],
         x="TIME_PERIOD",
         y="Value",
         color="Indicator",
         facet_row="REF_AREA_NAME",
-        markers=True,
+        markers=show_markers(n_points),
+        render_mode=render_mode,
         title="Economic Indicators Over Time (By Country)",
-        color_discrete_map=indicator_colors,
-<<<<<<< Updated upstream
-        hover_data={"Indicator": True, "REF_AREA_NAME": True, "Value": True, "TIME_PERIOD": True}
-=======
+        color_discrete_map=sel["indicator_colors"],
         hover_data={"Indicator": True, "REF_AREA_NAME": True, "Value": True, "TIME_PERIOD": True},
         category_orders={"REF_AREA_NAME": selected_countries}
->>>>>>> Stashed changes
     )
+    if render_mode == "webgl":
+        decimate_traces(fig_country)
     fig_country.update_yaxes(matches=None)
     fig_country.update_layout(
         height=400 + 300 * len(selected_countries),
@@ -339,158 +278,138 @@ def generate_all_plots(selected_countries, selected_variables, data_type="level"
         legend_title_text="Indicator"
     )
     fig_country.for_each_annotation(lambda a: a.update(text=a.text.split("=")[-1]))
-<<<<<<< Updated upstream
-    
-    #assign to dictionary
-    plots["by_country"] = {"plot": fig_country, "descr": "Each subplot shows a different country. Lines represent variables."}
-
-    # Scatterplot — multiple countries
-=======
-    plots["by_country"] = {
+    return {
         "plot": fig_country,
         "descr": "Each subplot shows a different country. Lines represent variables."
     }
 
-    # -------------------------
-    # Scatterplot (Correlation)
-    # -------------------------
->>>>>>> Stashed changes
-    if len(selected_variables) == 2:
-        var_x, var_y = selected_variables
-        df_scatter = dff[["REF_AREA_NAME", var_x, var_y]].dropna().reset_index(drop=True)
-        fig_scatter = px.scatter(
-            df_scatter,
-            x=var_x,
-            y=var_y,
-            color="REF_AREA_NAME",
-            trendline="ols",
-<<<<<<< Updated upstream
-            color_discrete_sequence=px.colors.qualitative.Dark24,
-            title=f"{'First Differences' if data_type=='diff' else 'Level'} Correlation"
-        )
-        # Add correlation annotations per country
-=======
-            color_discrete_map=country_colors,
-            title=f"{'First Differences' if data_type=='diff' else 'Level'} Correlation"
-        )
 
-        # Add per-country correlation annotations
->>>>>>> Stashed changes
-        for idx, country in enumerate(selected_countries):
-            temp = df_scatter[df_scatter["REF_AREA_NAME"] == country]
-            if not temp.empty:
-                r = temp[var_x].corr(temp[var_y])
-                fig_scatter.add_annotation(
-                    text=f"{country} r={r:.2f}",
-                    xref="paper",
-                    yref="paper",
-                    x=0.95,
-<<<<<<< Updated upstream
-                    y=0.05 - 0.05*idx,
-                    showarrow=False,
-                    font=dict(size=12)
-                )
-        #assign to dictionary
-        
-        plots["scatterplot"] = {"plot": fig_scatter, "descr": f"Correlation between {var_x} and {var_y}"}
-    else:
-        fig_scatter = px.scatter(title="Select exactly two indicators")
-        
-        #assign to dictionary
-        plots["scatterplot"] = {"plot": px.scatter(title="Select one country and exactly two indicators"), "descr": "Select one country and exactly two indicators."}
-        
-
-=======
-                    y=0.05 - 0.05 * idx,
-                    showarrow=False,
-                    font=dict(size=12)
-                )
-
-        plots["scatterplot"] = {"plot": fig_scatter, "descr": f"Correlation between {var_x} and {var_y}"}
-    else:
-        fig_scatter = px.scatter(title="Select exactly two indicators")
-        plots["scatterplot"] = {
-            "plot": fig_scatter,
+@stage("figure")
+def build_scatterplot(selected_countries, selected_variables, data_type="level", render_mode="auto"):
+    if not selected_countries or not selected_variables:
+        return {"plot": px.scatter(title="Please select exactly two indicators"), "descr": ""}
+    if len(selected_variables) != 2:
+        return {
+            "plot": px.scatter(title="Select exactly two indicators"),
             "descr": "Select at least one country and exactly two indicators."
         }
->>>>>>> Stashed changes
+    sel = get_selection(tuple(selected_countries), tuple(selected_variables), data_type)
+
+    var_x, var_y = selected_variables
+    df_scatter = sel["dff"][["REF_AREA_NAME", var_x, var_y]].dropna().reset_index(drop=True)
+    render_mode = resolve_render_mode(render_mode, len(df_scatter))
+    fig_scatter = px.scatter(
+        df_scatter,
+        x=var_x,
+        y=var_y,
+        color="REF_AREA_NAME",
+        color_discrete_map=sel["country_colors"],
+        render_mode=render_mode,
+        title=f"{'First Differences' if data_type=='diff' else 'Level'} Correlation"
+    )
+    if render_mode == "webgl":
+        decimate_traces(fig_scatter)
+
+    # OLS line per country from one grouped fit (no statsmodels)
+    add_trendlines(fig_scatter, df_scatter["REF_AREA_NAME"], df_scatter[var_x], df_scatter[var_y],
+                   colors=sel["country_colors"])
+
+    # Add per-country correlation annotations
+    corr = grouped_pearson(df_scatter["REF_AREA_NAME"], df_scatter[var_x], df_scatter[var_y])
+    for idx, country in enumerate(selected_countries):
+        if country in corr.index:
+            r = corr.at[country, "r"]
+            fig_scatter.add_annotation(
+                text=f"{country} r={r:.2f}",
+                xref="paper",
+                yref="paper",
+                x=0.95,
+                y=0.05 - 0.05 * idx,
+                showarrow=False,
+                font=dict(size=12)
+            )
+
+    return {"plot": fig_scatter, "descr": f"Correlation between {var_x} and {var_y}"}
+
+
+PLOT_BUILDERS = {
+    "by_variable": build_by_variable,
+    "by_country": build_by_country,
+    "scatterplot": build_scatterplot,
+}
+
+
+def generate_all_plots(selected_countries, selected_variables, data_type="level"):
+    return {
+        name: build(selected_countries, selected_variables, data_type)
+        for name, build in PLOT_BUILDERS.items()
+    }
+
+
+# -------------------------------------------------------------
+# Figure cache: serialized figures per selection, also what the page's patches are diffed against
+# -------------------------------------------------------------
+plot_cache = FigureCache(max_bytes=128 * 1024 * 1024)
+
+def cached_plot(name, selected_countries, selected_variables, data_type="level"):
+    countries, variables, data_type = normalize_selection(selected_countries, selected_variables, data_type)
+    return plot_cache.get_or_build(
+        (name, countries, variables, data_type),
+        lambda: PLOT_BUILDERS[name](list(countries), list(variables), data_type)
+    )
 
-    return plots
+def peek_plot(name, selected_countries, selected_variables, data_type="level"):
+    """Cached plot, or None without building it."""
+    return plot_cache.get((name,) + normalize_selection(selected_countries, selected_variables, data_type))
 
 
-<<<<<<< Updated upstream
 # -------------------------------------------------------------
 # Callbacks
 # -------------------------------------------------------------
 @app.callback(
     Output("line_graph", "figure"),
     Output("tab_description", "children"),
+    Output("line_graph_state", "data"),
     Input("country_selector", "value"),
     Input("variable_selector", "value"),
     Input("tabs", "value"),
-    Input("data_type_selector", "value")
+    Input("data_type_selector", "value"),
+    State("line_graph_state", "data")
 )
-def update_line_graph(selected_countries, selected_variables, selected_tab, data_type):
-   #use dictionary to call graph
-    plots = generate_all_plots(selected_countries, selected_variables, data_type)
-    if selected_tab == "tab1":
-        return plots['by_variable']['plot'], plots['by_variable']['descr']
-    else:
-        return plots['by_country']['plot'], plots['by_country']['descr']
-
-
-@app.callback(
-=======
-
-
-#-------Callback ---------------------------
+def update_line_graph(selected_countries, selected_variables, selected_tab, data_type, shown):
+    name = "by_variable" if selected_tab == "tab1" else "by_country"
+    plot = cached_plot(name, selected_countries, selected_variables, data_type)
+    state = [name, selected_countries, selected_variables, data_type]
+
+    # The page shows the cached figure of the previous selection: send only what changed.
+    # If it was evicted meanwhile the whole figure is sent rather than rebuilt to diff against
+    old = peek_plot(*shown) if shown and shown[0] == name else None
+    if old is not None:
+        with stage("patch"):
+            patch = figure_patch(old['plot'], plot['plot'])
+        if patch is not None:
+            return patch, plot['descr'], state
+    return plot['plot'], plot['descr'], state
+
+
+# The tab does not change the correlation graph, so it is not an input here
 @app.callback(
-
->>>>>>> Stashed changes
     Output("corr_graph", "figure"),
     Output("corr_message", "children"),
     Input("country_selector", "value"),
     Input("variable_selector", "value"),
-    Input("tabs", "value"),
     Input("data_type_selector", "value")
 )
-<<<<<<< Updated upstream
-def update_corr(selected_countries, selected_variables, selected_tab, data_type):
-   #use dictionary to call graph
-    plots = generate_all_plots(selected_countries, selected_variables, data_type)
-    return plots['scatterplot']['plot'], plots['scatterplot']['descr']
-=======
-
-def update_all(selected_countries, selected_variables, selected_tab, data_type):
-    # Generate all relevant plots once
-    plots = generate_all_plots(selected_countries, selected_variables, data_type)
-
-    # Handle line graph + description depending on tab
-    if selected_tab == "tab1":
-        line_plot = plots['by_variable']['plot']
-        line_descr = plots['by_variable']['descr']
-    else:
-        line_plot = plots['by_country']['plot']
-        line_descr = plots['by_country']['descr']
-
-    # Handle correlation graph + message
-    corr_plot = plots['scatterplot']['plot']
-    corr_descr = plots['scatterplot']['descr']
-
-    return line_plot, line_descr, corr_plot, corr_descr
+def update_corr(selected_countries, selected_variables, data_type):
+    plot = cached_plot("scatterplot", selected_countries, selected_variables, data_type)
+    return plot['plot'], plot['descr']
 
->>>>>>> Stashed changes
 
 # -------------------------------------------------------------
 # Run app
 # -------------------------------------------------------------
 if __name__ == "__main__":
-    url = "http://127.0.0.1:9000/"
-    print(f"Your Dash app is running at: {url}")
-    webbrowser.open(url)
-    app.run(debug=True, port=9000)
-<<<<<<< Updated upstream
-=======
+    launch(app, port=9000)
 
 
     
@@ -502,4 +421,3 @@ if __name__ == "__main__":
     #We could run some random forests or ann's to investigate these countries and factors contirbuting to twin deficits hypothesis 
     #Add which correlations are statistically significant 
     #Create new dashboard focused on twin deficits hypothesis and allow filtering based on outcome (positive/negative relationship_)
->>>>>>> Stashed changes
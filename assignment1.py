@@ -3,9 +3,10 @@ import pandas as pd
 import matplotlib.pyplot as plt 
 import seaborn as sns
 import plotly.express as px
+from data_registry import read_dataset
 
-#Download Data 
-lf = pd.read_csv("https://vincentarelbundock.github.io/Rdatasets/csv/sampleSelection/Mroz87.csv", index_col=0)
+#Load Data (python data_registry.py fetch mroz87 downloads it once)
+lf = read_dataset("mroz87")
 print(lf.head())
 
 # Fixing issues..
@@ -1,11 +1,13 @@
 import dash
 from dash import dcc, html
 from dash.dependencies import Input, Output
-import plotly.express as px
-import pandas as pd
+from serve import launch
+from data_registry import read_dataset
+from histogram_service import HistogramService
+from dash_metrics import instrument, stage
 
 
-lf = pd.read_csv("https://vincentarelbundock.github.io/Rdatasets/csv/sampleSelection/Mroz87.csv", index_col=0)
+lf = read_dataset("mroz87")
 print(lf.head())
 lf_worked = lf[lf['hours'] > 0]
 
@@ -25,11 +27,16 @@ for col in bool_cols:
 
 #Initialize the Dash app
 app = dash.Dash(__name__)
+metrics = instrument(app)  # callback timings at /metrics
+server = app.server
 
 
 #Get numeric columns for dropdown- Finds all numeric columns 
 numeric_cols = df.select_dtypes(include="number").columns
 
+#Bins and counts are computed here (once per column) so the browser only gets the bars
+histograms = HistogramService(df)
+
 #laying out the Dashboard ("App")
 app.layout = html.Div([
     html.H2("Histogram Dashboard"),
@@ -53,16 +60,11 @@ app.layout = html.Div([
     Input("variable-dropdown", "value")
 )
 def update_histogram(selected_var):
-    fig = px.histogram(df, x=selected_var, nbins=20,
-                       title=f"Histogram of {selected_var}")
+    with stage("figure"):
+        fig = histograms.figure(selected_var, nbins=20,
+                                title=f"Histogram of {selected_var}")
     return fig
 
 #Run the app: makes a local web server  
 if __name__ == "__main__":
-    url = "http://127.0.0.1:8050/"
-    print(f"Your Dash app is running at: {url}")
-    
-    import webbrowser
-    webbrowser.open(url)
-    
-    app.run(debug=True, use_reloader=False)
+    launch(app, port=8050, use_reloader=False)
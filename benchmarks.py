@@ -0,0 +1,904 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the WEO dashboards.
+
+Run with a benchmark name and optionally a WEO csv, e.g.
+
+    python benchmarks.py sharded /Users/katedamato/Downloads/WEO_data-2.csv
+
+Without a path a synthetic WEO-shaped file is generated in a temp dir.
+"""
+import csv
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import data_registry
+from crosstab_cube import CrossTabCube
+from histogram_service import HistogramService, histogram_from_chunks
+import weo_data
+
+EXPORTS = "Volume of exports of goods and services, Percent change"
+IMPORTS = "Volume of imports of goods and services, Percent change"
+CURRENT_ACCOUNT = "Current account balance, Percent of GDP"
+
+
+# -------------------------------------------------------------
+# Synthetic data
+# -------------------------------------------------------------
+def make_synthetic_weo(path, n_countries=190, n_years=45, n_indicators=40, seed=0):
+    """Write a WEO-shaped csv, with a few ragged lines and start/end month rows."""
+    rnd = random.Random(seed)
+    indicators = [f"Indicator {i}, Percent of GDP" for i in range(n_indicators - 3)]
+    indicators += [EXPORTS, IMPORTS, CURRENT_ACCOUNT]
+
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["DATASET", "STRUCTURE_ID", "REF_AREA_ID", "REF_AREA_NAME", "INDICATOR_ID",
+                         "INDICATOR_NAME", "UNIT_MEASURE_NAME", "TIME_PERIOD", "OBS_VALUE", "COMMENT_OBS"])
+        row_id = 0
+        for c in range(n_countries):
+            for indicator in indicators:
+                for year in range(1980, 1980 + n_years):
+                    row_id += 1
+                    value = round(rnd.gauss(0, 5), 3) if rnd.random() > 0.02 else "n/a"
+                    comment = "Estimate" if rnd.random() < 0.05 else ""
+                    writer.writerow([f"WEO:{row_id}", "IMF.RES:WEO(9.0.0)", f"C{c:03d}", f"Country {c:03d}",
+                                     "X", indicator, "Percent", year, value, comment])
+                    if rnd.random() < 0.002:
+                        f.write("ragged,line,with,too,many,fields,a,b,c,d,e,f\n")
+            writer.writerow([f"WEO:m{c}", "Start/end months of fiscal year", f"C{c:03d}", f"Country {c:03d}",
+                             "X", "Fiscal year", "Months", 2000, 1, ""])
+    return path
+
+
+def make_synthetic_geojson(path, n_countries=190, points_per_edge=200, seed=0):
+    """Write a grid of countries C000.. with shared, jagged borders as GeoJSON."""
+    rnd = np.random.default_rng(seed)
+    cols = int(np.ceil(np.sqrt(n_countries * 2)))
+    rows = int(np.ceil(n_countries / cols))
+    width, height = 360 / cols, 160 / rows
+    edges = {}
+
+    def edge(a, b):
+        """Jagged points from grid node a to b, identical for both cells that share it."""
+        key = (min(a, b), max(a, b))
+        if key not in edges:
+            (x0, y0), (x1, y1) = (np.multiply(key[0], (width, height)), np.multiply(key[1], (width, height)))
+            t = np.linspace(0, 1, points_per_edge)
+            wiggle = np.r_[0, np.cumsum(rnd.normal(0, 0.05, points_per_edge - 2)), 0]
+            wiggle[1:-1] -= np.linspace(0, wiggle[-2], points_per_edge)[1:-1]
+            x = x0 + t * (x1 - x0) + (wiggle if x0 == x1 else 0)
+            y = y0 + t * (y1 - y0) + (wiggle if y0 == y1 else 0)
+            edges[key] = np.column_stack([x - 180, y - 80])
+        points = edges[key]
+        return points if a == key[0] else points[::-1]
+
+    features = []
+    for c in range(n_countries):
+        i, j = c % cols, c // cols
+        corners = [(i, j), (i + 1, j), (i + 1, j + 1), (i, j + 1), (i, j)]
+        ring = np.concatenate([edge(a, b)[:-1] for a, b in zip(corners[:-1], corners[1:])])
+        ring = np.r_[ring, ring[:1]]
+        features.append({"type": "Feature", "id": f"C{c:03d}", "properties": {},
+                         "geometry": {"type": "Polygon", "coordinates": [ring.tolist()]}})
+    with open(path, "w") as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f)
+    return path
+
+
+def _data_path(argv):
+    if len(argv) > 2:
+        return argv[2]
+    path = os.path.join(tempfile.gettempdir(), "weo_synthetic.csv")
+    if not os.path.exists(path):
+        print(f"Writing synthetic WEO data to {path}")
+        make_synthetic_weo(path)
+    return path
+
+
+def _time(fn, repeat=3):
+    """Best wall time of fn() over repeat runs, and its last result."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+# -------------------------------------------------------------
+# Parsing
+# -------------------------------------------------------------
+def bench_sharded(path):
+    """Single-threaded python-engine read vs sharded loading at 1..N processes."""
+    def baseline():
+        df = pd.read_csv(path, index_col=0, engine='python', on_bad_lines='skip')
+        df = df[pd.to_numeric(df["OBS_VALUE"], errors="coerce").notna()]
+        return df[~df["STRUCTURE_ID"].str.contains("Start/end months", na=False)]
+
+    base, _ = _time(baseline, repeat=1)
+    print(f"{'pd.read_csv (python engine)':<32}{base:8.2f}s")
+
+    c_engine, _ = _time(lambda: weo_data.clean_weo(weo_data.read_weo_csv(path)[0]), repeat=1)
+    print(f"{'read_weo_csv (C engine)':<32}{c_engine:8.2f}s  x{base / c_engine:.1f}")
+
+    cores = os.cpu_count() or 1
+    for n in sorted({2 ** i for i in range(cores.bit_length()) if 2 ** i <= cores} | {cores}):
+        t, _ = _time(lambda: weo_data.read_weo_sharded(path, workers=n), repeat=1)
+        print(f"{f'read_weo_sharded workers={n}':<32}{t:8.2f}s  x{base / t:.1f}")
+
+
+# -------------------------------------------------------------
+# Memory
+# -------------------------------------------------------------
+def bench_memory(path):
+    """Resident size of df_wide in the old layout vs the compact layout."""
+    df = weo_data.clean_weo(weo_data.read_weo_csv(path)[0])
+
+    # The pivot the dashboards used to build
+    old = df.pivot(index=weo_data.ID_COLUMNS, columns="INDICATOR_NAME", values=["OBS_VALUE", "COMMENT_OBS"])
+    old.columns = [f"{val}_{col}" for val, col in old.columns]
+
+    print(weo_data.memory_report({
+        "before: OBS_VALUE + COMMENT_OBS": old.reset_index(),
+        "after: compact float32": weo_data.pivot_weo(df, compact=True),
+        "after: compact float64": weo_data.pivot_weo(df, compact=True, float_dtype="float64"),
+        "after: comment side table": weo_data.comments_weo(df),
+    }))
+
+
+# -------------------------------------------------------------
+# Callback lookups
+# -------------------------------------------------------------
+def bench_index(path):
+    """Boolean-mask scans used by the callbacks vs WideIndex takes."""
+    from weo_index import WideIndex
+
+    _, df_wide = weo_data.load_weo(path, compact=True)
+    index = WideIndex(df_wide)
+    countries = sorted(df_wide["REF_AREA_NAME"].unique())[:10]
+    year = int(df_wide["TIME_PERIOD"].median())
+    country_id = df_wide["REF_AREA_ID"].iloc[0]
+
+    cases = [
+        ("generate_all_plots: isin",
+         lambda: df_wide[df_wide["REF_AREA_NAME"].isin(countries)].copy(),
+         lambda: index.countries(countries)),
+        ("generate_map: year ==",
+         lambda: df_wide[df_wide["TIME_PERIOD"].astype(int) == int(year)].copy(),
+         lambda: index.year(year)),
+        ("update_line_chart: id ==",
+         lambda: df_wide[df_wide["REF_AREA_ID"] == country_id].copy(),
+         lambda: index.country_id(country_id)),
+    ]
+    for label, scan, take in cases:
+        t_scan, expected = _time(scan, repeat=20)
+        t_take, result = _time(take, repeat=20)
+        assert expected.index.equals(result.index)
+        print(f"{label:<32}{t_scan * 1e3:8.2f} ms -> {t_take * 1e3:6.2f} ms  x{t_scan / t_take:.1f}")
+
+
+def bench_cube(path):
+    """Selections through WideIndex (pandas) vs WeoCube (numpy)."""
+    from weo_cube import WeoCube
+    from weo_index import WideIndex
+
+    _, df_wide = weo_data.load_weo(path, compact=True)
+    index, cube = WideIndex(df_wide), WeoCube.from_wide(df_wide)
+    countries = sorted(df_wide["REF_AREA_NAME"].unique())[:50]
+    variables = [c for c in df_wide.columns if c.startswith("OBS_VALUE_")][:4]
+    year = int(df_wide["TIME_PERIOD"].median())
+
+    for label, call in [
+        ("select level (50 countries)", lambda d: d.select(countries, variables)),
+        ("select diff (50 countries)", lambda d: d.select(countries, variables, "diff")),
+        ("map_frame", lambda d: d.map_frame(variables[0], year)),
+    ]:
+        t_index, _ = _time(lambda: call(index), repeat=20)
+        t_cube, _ = _time(lambda: call(cube), repeat=20)
+        print(f"{label:<32}{t_index * 1e3:8.2f} ms -> {t_cube * 1e3:6.2f} ms  x{t_index / t_cube:.1f}")
+
+    # Same frames from both backends on data with gaps: missing country-year rows and missing values
+    rng = np.random.default_rng(0)
+    gapped = df_wide[rng.random(len(df_wide)) > 0.1].reset_index(drop=True)
+    gapped[variables[0]] = gapped[variables[0]].where(rng.random(len(gapped)) > 0.1)
+    backends = {
+        "groupby": WideIndex(gapped),
+        "add_transforms": WideIndex(weo_data.add_transforms(gapped, kinds=("diff", "growth", "logdiff"))),
+        "cube": WeoCube.from_wide(gapped),
+    }
+    for data_type in ("level", "diff", "growth", "logdiff"):
+        frames = {name: backend.select(countries, variables, data_type)
+                  for name, backend in backends.items() if name != "groupby" or data_type in ("level", "diff")}
+        expected = frames.pop("add_transforms")
+        for name, dff in frames.items():
+            assert dff["REF_AREA_NAME"].astype(str).tolist() == expected["REF_AREA_NAME"].astype(str).tolist()
+            assert np.array_equal(dff["TIME_PERIOD"].astype(int), expected["TIME_PERIOD"].astype(int))
+            assert np.allclose(dff[variables].to_numpy(float), expected[variables].to_numpy(float),
+                               rtol=1e-5, equal_nan=True), (name, data_type)
+    print("WideIndex and WeoCube agree on data with gaps (level, diff, growth, logdiff)")
+
+
+# -------------------------------------------------------------
+# First differences
+# -------------------------------------------------------------
+def bench_transforms(path):
+    """Check add_transforms against the per-country groupby and time both."""
+    _, df_wide = weo_data.load_weo(path, compact=True)
+    df_wide = weo_data.add_twin_deficits(df_wide)
+    columns = [c for c in df_wide.columns if c not in weo_data.ID_COLUMNS]
+
+    t_new, out = _time(lambda: weo_data.add_transforms(df_wide, kinds=("diff", "growth", "logdiff")), repeat=3)
+
+    # What the "First Differences" callbacks computed on every call
+    def groupby_diff():
+        dff = df_wide.sort_values(["REF_AREA_NAME", "TIME_PERIOD"])
+        return dff.groupby("REF_AREA_NAME", observed=True)[columns].transform('diff')
+
+    t_old, expected = _time(groupby_diff, repeat=3)
+    out = out.loc[expected.index]
+    grouped = df_wide.loc[expected.index].groupby("REF_AREA_NAME", observed=True)[columns]
+
+    pd.testing.assert_frame_equal(out[[f"DIFF_{c}" for c in columns]].set_axis(columns, axis=1), expected)
+    pd.testing.assert_frame_equal(out[[f"GROWTH_{c}" for c in columns]].set_axis(columns, axis=1),
+                                  grouped.pct_change(fill_method=None) * 100, rtol=1e-4)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_levels = np.log(df_wide.loc[expected.index, columns].where(lambda x: x > 0))
+    pd.testing.assert_frame_equal(
+        out[[f"LOGDIFF_{c}" for c in columns]].set_axis(columns, axis=1),
+        log_levels.groupby(df_wide.loc[expected.index, "REF_AREA_NAME"], observed=True).diff(), rtol=1e-4
+    )
+    print(f"add_transforms matches the per-country groupby for {len(columns)} columns")
+    print(f"{'per callback: groupby diff':<32}{t_old * 1e3:8.2f} ms  (whole table)")
+    print(f"{'once at load: add_transforms':<32}{t_new * 1e3:8.2f} ms  (diff, growth, logdiff)")
+
+
+# -------------------------------------------------------------
+# Correlations
+# -------------------------------------------------------------
+def bench_corr(path):
+    """Per-country Series.corr loop vs grouped_pearson vs the precomputed pair matrix (checked in test_weo_stats)."""
+    from weo_cube import WeoCube
+    from weo_stats import PairCorrelations, grouped_pearson
+
+    _, df_wide = weo_data.load_weo(path, compact=True)
+    cube = WeoCube.from_wide(df_wide)
+    var_x, var_y = cube.indicators[:2]
+    pairs = PairCorrelations(cube)
+    t_matrix, _ = _time(pairs.compute, repeat=1)
+    print(f"{'pair matrix (background, once)':<32}{t_matrix * 1e3:8.2f} ms")
+
+    for k in (10, 50, len(cube.countries)):
+        countries = list(cube.countries[:k])
+        df_scatter = cube.select(countries, [var_x, var_y]).dropna()
+
+        def loop():
+            return {c: df_scatter.loc[df_scatter["REF_AREA_NAME"] == c, var_x].corr(
+                df_scatter.loc[df_scatter["REF_AREA_NAME"] == c, var_y]) for c in countries}
+
+        t_loop, _ = _time(loop)
+        t_grouped, _ = _time(lambda: grouped_pearson(df_scatter["REF_AREA_NAME"], df_scatter[var_x], df_scatter[var_y]))
+        t_lookup, _ = _time(lambda: pairs.lookup(countries, var_x, var_y))
+        print(f"{f'{k} countries':<32}{t_loop * 1e3:8.2f} ms loop, {t_grouped * 1e3:6.2f} ms grouped, "
+              f"{t_lookup * 1e3:6.2f} ms lookup")
+
+
+# -------------------------------------------------------------
+# Trendlines
+# -------------------------------------------------------------
+def bench_trendline(path):
+    """px trendline="ols" (statsmodels per country) vs grouped_ols traces; huber/lowess in the pool.
+
+    test_weo_stats checks grouped_ols against numpy; this only times it.
+    """
+    import plotly.express as px
+    from weo_cube import WeoCube
+    from weo_figures import add_trendlines
+    from weo_stats import grouped_ols
+
+    _, df_wide = weo_data.load_weo(path, compact=True)
+    cube = WeoCube.from_wide(df_wide)
+    var_x, var_y = cube.indicators[:2]
+
+    for k in (10, 30, len(cube.countries)):
+        df_scatter = cube.select(list(cube.countries[:k]), [var_x, var_y]).dropna()
+        df_scatter["REF_AREA_NAME"] = df_scatter["REF_AREA_NAME"].astype(str)
+
+        def statsmodels_fig():
+            return px.scatter(df_scatter, x=var_x, y=var_y, color="REF_AREA_NAME", trendline="ols")
+
+        def grouped_fig():
+            fig = px.scatter(df_scatter, x=var_x, y=var_y, color="REF_AREA_NAME")
+            add_trendlines(fig, df_scatter["REF_AREA_NAME"], df_scatter[var_x], df_scatter[var_y])
+            return fig
+
+        t_old, _ = _time(statsmodels_fig, repeat=1)
+        t_new, _ = _time(grouped_fig)
+        t_fit, _ = _time(lambda: grouped_ols(df_scatter["REF_AREA_NAME"], df_scatter[var_x], df_scatter[var_y]))
+        print(f"{f'{k} countries':<32}{t_old * 1e3:8.2f} ms statsmodels -> {t_new * 1e3:6.2f} ms figure, "
+              f"{t_fit * 1e3:6.2f} ms fit  x{t_old / t_new:.1f}")
+
+    df_scatter = cube.select(list(cube.countries[:30]), [var_x, var_y]).dropna()
+    for method in ("huber", "lowess"):
+        fig = px.scatter(df_scatter, x=var_x, y=var_y)
+        t, _ = _time(lambda: add_trendlines(fig, df_scatter["REF_AREA_NAME"], df_scatter[var_x],
+                                            df_scatter[var_y], method), repeat=2)
+        print(f"{f'{method} (30 countries, pool)':<32}{t * 1e3:8.2f} ms")
+
+
+# -------------------------------------------------------------
+# Render mode
+# -------------------------------------------------------------
+RENDER_PAGE = """<html><head><meta charset="utf-8"><script>{plotlyjs}</script></head><body>
+<h3>Client render time (Plotly.newPlot, ms)</h3><table id="times" border="1"></table><div id="plot"></div>
+<script>
+const figures = {figures};
+(async () => {{
+  for (const [label, fig] of Object.entries(figures)) {{
+    const start = performance.now();
+    await Plotly.newPlot("plot", fig.data, fig.layout);
+    const row = document.getElementById("times").insertRow();
+    row.insertCell().textContent = label;
+    row.insertCell().textContent = (performance.now() - start).toFixed(1);
+    Plotly.purge("plot");
+  }}
+}})();
+</script></body></html>"""
+
+
+def bench_render(path):
+    """Figure JSON bytes and build time, SVG with markers vs the WebGL render mode.
+
+    Client render time needs a browser: the figures are written to an html
+    page that times Plotly.newPlot for each of them when opened.
+    """
+    import plotly.express as px
+    from plotly.offline import get_plotlyjs
+    from plotly.utils import PlotlyJSONEncoder
+
+    from figure_cache import serialize
+    from weo_cube import WeoCube
+    from weo_figures import decimate_traces, show_markers
+
+    _, df_wide = weo_data.load_weo(path, compact=True)
+    cube = WeoCube.from_wide(df_wide)
+    variables = cube.indicators[:4]
+    figures = {}
+
+    for k in (10, 50, len(cube.countries)):
+        melt = cube.select(list(cube.countries[:k]), variables).melt(
+            id_vars=["REF_AREA_NAME", "TIME_PERIOD"], var_name="Indicator", value_name="Value")
+
+        def svg():
+            return px.line(melt, x="TIME_PERIOD", y="Value", color="REF_AREA_NAME", facet_row="Indicator",
+                           markers=True, render_mode="svg")
+
+        def webgl():
+            fig = px.line(melt, x="TIME_PERIOD", y="Value", color="REF_AREA_NAME", facet_row="Indicator",
+                          markers=show_markers(len(melt)), render_mode="webgl")
+            decimate_traces(fig)
+            return fig
+
+        for mode, build in (("svg", svg), ("webgl", webgl)):
+            t, fig = _time(build, repeat=1)
+            figures[f"{k} countries {mode}"] = value = serialize(fig)[0]
+            size = len(json.dumps(value, cls=PlotlyJSONEncoder))
+            print(f"{f'{k} countries, {mode}':<32}{size / 1e6:8.2f} MB  {t * 1e3:8.1f} ms build")
+
+    page = os.path.join(tempfile.gettempdir(), "weo_render_bench.html")
+    with open(page, "w") as f:
+        f.write(RENDER_PAGE.format(plotlyjs=get_plotlyjs(), figures=json.dumps(figures, cls=PlotlyJSONEncoder)))
+    print(f"Open {page} in a browser for client render times")
+
+
+# -------------------------------------------------------------
+# Partial figure updates
+# -------------------------------------------------------------
+def _apply_patch(fig, patch):
+    """Apply Patch operations to a figure dict the way the browser does."""
+    for op in patch.to_plotly_json()["operations"]:
+        *parents, last = op["location"]
+        target = fig
+        for key in parents:
+            target = target[key]
+        if op["operation"] == "Assign":
+            target[last] = op["params"]["value"]
+        elif op["operation"] == "Delete":
+            del target[last]
+        elif op["operation"] == "Insert":
+            target[last].insert(op["params"]["index"], op["params"]["value"])
+        else:
+            raise ValueError(op["operation"])
+    return fig
+
+
+def bench_patch(path):
+    """Bytes sent for a full figure vs a figure_patch, for common selection changes."""
+    import plotly.express as px
+    from plotly.utils import PlotlyJSONEncoder
+
+    from figure_cache import serialize
+    from weo_cube import WeoCube
+    from weo_figures import figure_patch, patch_size
+
+    _, df_wide = weo_data.load_weo(path, compact=True)
+    cube = WeoCube.from_wide(df_wide)
+    variables = cube.indicators[:3]
+    colors = px.colors.qualitative.Dark24
+
+    def figure(countries, data_type="level", facet="Indicator"):
+        melt = cube.select(countries, variables, data_type).melt(
+            id_vars=["REF_AREA_NAME", "TIME_PERIOD"], var_name="Indicator", value_name="Value")
+        color = "REF_AREA_NAME" if facet == "Indicator" else "Indicator"
+        fig = px.line(melt, x="TIME_PERIOD", y="Value", color=color, facet_row=facet, markers=True,
+                      color_discrete_map={c: colors[i % len(colors)] for i, c in enumerate(sorted(countries))})
+        value, estimate = serialize(fig)
+        size = len(json.dumps(value, cls=PlotlyJSONEncoder))
+        # FigureCache sizes entries from the arrays and one trace rather than an encode
+        assert abs(estimate / size - 1) < 0.05, (estimate, size)
+        return value, size
+
+    def encode(fig):
+        return json.loads(json.dumps(fig, cls=PlotlyJSONEncoder))
+
+    for k in (10, 50):
+        countries = list(cube.countries[:k])
+        extra, middle = cube.countries[k], countries[k // 2]
+        cases = [
+            ("add a country", (countries,), (countries + [extra],)),
+            ("remove a country", (countries,), ([c for c in countries if c != middle],)),
+            ("switch to first differences", (countries,), (countries, "diff")),
+        ]
+        if k <= 20:
+            # px cannot space more facet rows than that
+            cases.append(("add a country (by country tab)", (countries, "level", "REF_AREA_NAME"),
+                          (countries + [extra], "level", "REF_AREA_NAME")))
+        for label, before, after in cases:
+            (old, _), (new, full) = figure(*before), figure(*after)
+            patch = figure_patch(old, new)
+            assert encode(_apply_patch(encode(old), patch)) == encode(new)
+            sent = patch_size(patch)
+            print(f"{f'{k} countries: {label}':<48}{full / 1e3:8.1f} kB -> {sent / 1e3:7.1f} kB  x{full / sent:.1f}")
+
+
+# -------------------------------------------------------------
+# Map geometry
+# -------------------------------------------------------------
+def _segment_counts(collection, decimals=None):
+    """How many rings use each border segment."""
+    counts = {}
+    for feature in collection["features"]:
+        geometry = feature["geometry"]
+        polygons = [geometry["coordinates"]] if geometry["type"] == "Polygon" else geometry["coordinates"]
+        for ring in (ring for polygon in polygons for ring in polygon):
+            points = [tuple(round(v, decimals) if decimals is not None else v for v in p[:2]) for p in ring]
+            for a, b in zip(points[:-1], points[1:]):
+                key = (a, b) if a <= b else (b, a)
+                counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def bench_geo(path):
+    """Simplified layer sizes and border check; per-year bytes of px.choropleth vs a patch."""
+    import math
+
+    import plotly.express as px
+    from plotly.utils import PlotlyJSONEncoder
+
+    from figure_cache import serialize
+    from weo_cube import WeoCube
+    from weo_figures import figure_patch, patch_size
+    from weo_geo import GEO_PATH, LEVELS, WorldGeometry
+
+    geo_path = GEO_PATH
+    if not os.path.exists(geo_path):
+        geo_path = os.path.join(tempfile.gettempdir(), "weo_synthetic.geojson")
+        if not os.path.exists(geo_path):
+            make_synthetic_geojson(geo_path)
+    with open(geo_path) as f:
+        source = json.load(f)
+    print(f"{'source GeoJSON':<32}{os.path.getsize(geo_path) / 1e6:8.2f} MB")
+
+    geo = WorldGeometry(geo_path, use_cache=False)
+    for level, tolerance in LEVELS.items():
+        t, data = _time(lambda: geo.layer(level), repeat=1)
+        # Every border segment must still be used by both neighbours (or lie on a coastline)
+        decimals = max(0, math.ceil(-math.log10(tolerance)) + 1)
+        coast = {p for seg, n in _segment_counts(source, decimals).items() if n == 1 for p in seg}
+        counts = _segment_counts(json.loads(data))
+        assert all(n == 2 or (a in coast and b in coast) for (a, b), n in counts.items())
+        print(f"{f'layer {level} (tol {tolerance})':<32}{len(data) / 1e6:8.2f} MB  {len(counts):8d} segments  "
+              f"{t:6.2f}s to simplify")
+
+    _, df_wide = weo_data.load_weo(path, compact=True)
+    cube = WeoCube.from_wide(df_wide)
+    variable = cube.indicators[0]
+    areas = pd.DataFrame({"REF_AREA_ID": cube.country_ids, "REF_AREA_NAME": cube.countries}).astype(str)
+
+    def builtin(year):
+        return px.choropleth(cube.map_frame(variable, year), locations="REF_AREA_ID", color=variable)
+
+    def layered(year):
+        dff = areas.merge(cube.map_frame(variable, year)[["REF_AREA_ID", variable]], how="left")
+        return serialize(px.choropleth(dff, locations="REF_AREA_ID", color=variable,
+                                       geojson="/geo/low.json", featureidkey="id"))[0]
+
+    year = int(cube.years[len(cube.years) // 2])
+    print(f"{'per year: px.choropleth':<32}{len(json.dumps(serialize(builtin(year))[0], cls=PlotlyJSONEncoder)) / 1e3:8.1f} kB  "
+          f"(+ the world topojson plotly.js fetches)")
+    print(f"{'per year: patch on the layer':<32}{patch_size(figure_patch(layered(year - 1), layered(year))) / 1e3:8.1f} kB")
+
+
+# -------------------------------------------------------------
+# Indicator statistics
+# -------------------------------------------------------------
+def bench_stats(path):
+    """Check indicator_stats against a per-year groupby and time it against per-call quantiles."""
+    _, df_wide = weo_data.load_weo(path, compact=True)
+    t_stats, stats = _time(lambda: weo_data.indicator_stats(df_wide), repeat=3)
+    columns = stats.index.get_level_values("INDICATOR").unique()
+
+    grouped = df_wide.groupby("TIME_PERIOD", observed=True)[list(columns)]
+    for name, expected in [("q05", grouped.quantile(0.05)), ("q95", grouped.quantile(0.95)),
+                           ("mean", grouped.mean()), ("std", grouped.std()), ("count", grouped.count())]:
+        got = stats[name].drop(weo_data.ALL_YEARS, level="TIME_PERIOD").unstack("INDICATOR")
+        assert np.allclose(got.to_numpy(), expected.loc[got.index, got.columns].to_numpy(), rtol=1e-4, equal_nan=True)
+    pooled = stats.xs(weo_data.ALL_YEARS, level="TIME_PERIOD")
+    assert np.allclose(pooled["q95"], df_wide[list(columns)].astype(float).quantile(0.95), rtol=1e-4)
+
+    # What generate_map did for every map drawn
+    year = int(df_wide["TIME_PERIOD"].median())
+    t_call, _ = _time(lambda: df_wide.loc[df_wide["TIME_PERIOD"] == year, columns[0]].quantile([0.05, 0.95]), repeat=20)
+    bounds = stats[["q05", "q95"]].to_dict("index")
+    t_lookup, _ = _time(lambda: bounds[(columns[0], year)], repeat=20)
+    print(f"indicator_stats matches the per-year groupby for {len(columns)} indicators")
+    print(f"{'at ingest: indicator_stats':<32}{t_stats * 1e3:8.2f} ms  ({len(stats)} rows)")
+    print(f"{'per map: quantile of the year':<32}{t_call * 1e3:8.2f} ms -> {t_lookup * 1e3:6.2f} ms lookup")
+
+
+# -------------------------------------------------------------
+# Shared cube
+# -------------------------------------------------------------
+def _private_kb():
+    """Memory only this process holds in kB (Linux): private dirty pages.
+
+    Clean pages of a read-only memory map are the page cache, shared by
+    every process mapping the file, and are not counted.
+    """
+    with open("/proc/self/smaps_rollup") as f:
+        fields = dict(line.split(":", 1) for line in f if ":" in line)
+    return int(fields["Private_Dirty"].split()[0])
+
+
+def _in_child(fn):
+    """Run fn() in a forked child and return what it returns (an int)."""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.write(write_fd, str(fn()).encode())
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        result = int(f.read())
+    os.waitpid(pid, 0)
+    return result
+
+
+def bench_shared(path, n_workers=4):
+    """Private memory each worker spends on the cube: built per worker vs memory-mapped."""
+    import weo_cube
+
+    _, df_wide = weo_data.load_weo(path, compact=True)
+    cube = weo_cube.WeoCube.from_wide(df_wide)
+    countries, variables = list(cube.countries), cube.indicators
+
+    def use(c):
+        # Read every value and difference, as a worker does over time (no temporaries)
+        return float(np.add.reduce(c.values, axis=None)) + float(np.add.reduce(c.diff(), axis=None))
+
+    shared = weo_cube.shared_cube(df_wide, path)
+    assert np.array_equal(shared.values, cube.values, equal_nan=True)
+    assert np.array_equal(shared.diff(), cube.diff(), equal_nan=True)
+    assert shared.select(countries[:5], variables[:3], "diff").equals(cube.select(countries[:5], variables[:3], "diff"))
+    use(shared)  # pages in the page cache, as after the first worker
+    size_kb = (cube.values.nbytes + cube.present.nbytes + cube.diff().nbytes) // 1024
+
+    def worker(build):
+        before = _private_kb()
+        use(build())
+        return _private_kb() - before
+
+    print(f"cube arrays: {size_kb / 1024:.1f} MB; private memory added per worker")
+    for label, build in [
+        ("from_wide in each worker", lambda: weo_cube.WeoCube.from_wide(df_wide)),
+        ("shared_cube (memory-mapped)", lambda: weo_cube.shared_cube(df_wide, path)),
+    ]:
+        added = [_in_child(lambda: worker(build)) for _ in range(n_workers)]
+        print(f"{label:<32}" + "  ".join(f"{kb / 1024:6.1f} MB" for kb in added))
+
+
+# -------------------------------------------------------------
+# Serving
+# -------------------------------------------------------------
+def _line_graph_request(countries, variables, tab="tab1", data_type="level"):
+    """Body of the POST the browser sends for FinalDashboard's update_line_graph."""
+    outputs = [("line_graph", "figure"), ("tab_description", "children"), ("line_graph_state", "data")]
+    inputs = [("country_selector", countries), ("variable_selector", variables), ("tabs", tab),
+              ("data_type_selector", data_type)]
+    return json.dumps({
+        "output": ".." + "...".join(f"{i}.{p}" for i, p in outputs) + "..",
+        "outputs": [{"id": i, "property": p} for i, p in outputs],
+        "inputs": [{"id": i, "property": "value", "value": v} for i, v in inputs],
+        "changedPropIds": ["country_selector.value"],
+        "state": [{"id": "line_graph_state", "property": "data", "value": None}],
+    }).encode()
+
+
+def _load(url, bodies, concurrency=16):
+    """Requests per second and median latency of POSTing every body to url."""
+    import urllib.request
+    from concurrent.futures import ThreadPoolExecutor
+
+    def post(body):
+        start = time.perf_counter()
+        request = urllib.request.Request(url, body, {"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=120) as response:
+            assert response.status == 200
+            response.read()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        latencies = list(pool.map(post, bodies))
+    return len(bodies) / (time.perf_counter() - start), float(np.median(latencies))
+
+
+def _wait_for_port(port, pid, timeout=120):
+    import socket
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if os.waitpid(pid, os.WNOHANG) != (0, 0):
+            raise RuntimeError("server exited during startup")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f"nothing listening on port {port}")
+
+
+def bench_serve(path, port=9123, n_requests=400):
+    """Callback requests per second of FinalDashboard: Flask dev server vs gunicorn at 1, 4 and 8 workers."""
+    import runpy
+    import signal
+
+    import serve
+
+    weo_data.WEO_PATH = weo_data.WEO_SMALL_PATH = path
+    dashboard = runpy.run_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), "FinalDashboard.py"),
+                               run_name="dashboard")
+    data = dashboard["dataset"].current
+    data.pair_corr.ready.wait()
+    server = dashboard["server"]
+
+    # Selections of three countries, each asked for a few times, so the figure cache sees hits and misses
+    countries, variables = list(data.backend.countries[:40]), list(data.backend.indicators[:2])
+    rnd = random.Random(0)
+    bodies = [_line_graph_request(rnd.sample(countries, 3), variables, rnd.choice(["tab1", "tab2"]))
+              for _ in range(n_requests // 4)] * 4
+    rnd.shuffle(bodies)
+
+    try:
+        import gunicorn  # noqa: F401
+        runs = [("flask dev server", None)] + [(f"gunicorn, {n} worker{'s' * (n > 1)}", n) for n in (1, 4, 8)]
+    except ImportError:
+        print("gunicorn is not installed: comparing waitress threads instead")
+        runs = [("flask dev server", None)] + [(f"waitress, {n} thread{'s' * (n > 1)}", n) for n in (1, 4, 8)]
+
+    print(f"{os.cpu_count()} CPUs, {len(bodies)} update_line_graph requests, 16 concurrent clients")
+    for label, workers in runs:
+        pid = os.fork()
+        if pid == 0:
+            # The child serves the app this process already loaded, as gunicorn's preload does
+            try:
+                if workers is None:
+                    import logging
+                    from werkzeug.serving import run_simple
+                    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+                    run_simple("127.0.0.1", port, server, threaded=True)
+                elif "gunicorn" in label:
+                    serve.serve_gunicorn(server, port=port, workers=workers)
+                else:
+                    serve.serve_waitress(server, port=port, threads=workers)
+            finally:
+                os._exit(0)
+        try:
+            _wait_for_port(port, pid)
+            url = f"http://127.0.0.1:{port}/_dash-update-component"
+            _load(url, bodies[:16])  # warm up every worker
+            rate, latency = _load(url, bodies)
+            print(f"{label:<28}{rate:8.1f} req/s  median {latency * 1e3:7.1f} ms")
+        finally:
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+
+
+# -------------------------------------------------------------
+# Dataset store
+# -------------------------------------------------------------
+def bench_registry(path):
+    """Check the typed copy of a table against read_csv and time both, in a temporary store."""
+    data_registry.DATA_DIR = tempfile.mkdtemp(prefix="datasets_")
+    data_registry.REGISTRY["bench"] = data_registry.Dataset("bench.csv", read_csv={"on_bad_lines": "skip"})
+    data_registry.add("bench", path)
+    t_build, _ = _time(lambda: data_registry.read_dataset("bench"), repeat=1)
+    t_typed, typed = _time(lambda: data_registry.read_dataset("bench"), repeat=3)
+    t_csv, parsed = _time(lambda: pd.read_csv(path, on_bad_lines="skip"), repeat=3)
+    pd.testing.assert_frame_equal(typed, parsed)
+    assert data_registry.verify(["bench"]) == {"bench": True}
+    print(f"typed copy matches read_csv ({len(parsed)} rows x {parsed.shape[1]} columns)")
+    print(f"{'read_csv':<32}{t_csv * 1e3:8.2f} ms")
+    print(f"{'typed copy, first use':<32}{t_build * 1e3:8.2f} ms")
+    print(f"{'typed copy':<32}{t_typed * 1e3:8.2f} ms")
+
+
+# -------------------------------------------------------------
+# Cross-tab cube
+# -------------------------------------------------------------
+def _microdata(n_rows, seed=0):
+    """Mroz87-shaped rows: kids counts, lfp and hours (zero when not working)."""
+    rng = np.random.default_rng(seed)
+    lfp = rng.random(n_rows) < 0.57
+    return pd.DataFrame({
+        "kids5": rng.poisson(0.25, n_rows).clip(0, 3),
+        "kids618": rng.poisson(1.35, n_rows).clip(0, 8),
+        "lfp": lfp.astype(int),
+        "hours": np.where(lfp, rng.gamma(4.0, 330.0, n_rows).round(), 0.0),
+    })
+
+
+def bench_crosstab(path, sizes=(753, 1_000_000)):
+    """Check CrossTabCube against the slider callback's row filter and time both."""
+    for n_rows in sizes:
+        df = _microdata(n_rows)
+        hours = df["hours"].where(df["hours"] > 0)
+        t_build, cube = _time(lambda: CrossTabCube(df[["kids5", "kids618"]], counts={"lfp": df["lfp"]},
+                                                   values={"hours": hours}, bins={"hours": 20}), repeat=1)
+        boxes = [((a, b), (c, d)) for a in range(4) for b in range(a, 4) for c in range(9) for d in range(c, 9)]
+
+        def filtered(box):
+            (a, b), (c, d) = box
+            rows = df[df["kids5"].between(a, b) & df["kids618"].between(c, d)]
+            worked = rows.loc[rows["hours"] > 0, "hours"]
+            return rows["lfp"].value_counts(), worked, np.histogram(worked, cube.edges["hours"])[0]
+
+        for box in boxes[::7]:
+            tab = cube.query(kids5=box[0], kids618=box[1])
+            lfp, worked, hist = filtered(box)
+            counts = tab.counts("lfp")
+            assert counts[counts > 0].to_dict() == lfp.to_dict()
+            n, mean, std = tab.moments("hours")
+            assert n == len(worked) and np.allclose([mean, std], [worked.mean(), worked.std()], equal_nan=True)
+            assert np.array_equal(tab.histogram("hours")[0], hist)
+
+        t_filter, _ = _time(lambda: [filtered(box) for box in boxes[:20]], repeat=1)
+        t_query, _ = _time(lambda: [cube.query(kids5=a, kids618=b).moments("hours") for a, b in boxes], repeat=3)
+        print(f"{n_rows} rows: the cube matches the filtered rows for {len(boxes[::7])} slider ranges")
+        print(f"{'  build the cube':<32}{t_build * 1e3:8.2f} ms")
+        print(f"{'  filter + aggregate per range':<32}{t_filter / 20 * 1e3:8.3f} ms")
+        print(f"{'  cube query per range':<32}{t_query / len(boxes) * 1e3:8.3f} ms")
+
+
+# -------------------------------------------------------------
+# Server-side histograms
+# -------------------------------------------------------------
+def bench_histogram(path, sizes=(753, 1_000_000), chunksize=100_000):
+    """Compare the payload of px.histogram with a pre-binned bar figure, and check streaming binning."""
+    import plotly.express as px
+    from plotly.io.json import to_json_plotly
+
+    for n_rows in sizes:
+        df = _microdata(n_rows)
+        histograms = HistogramService(df)
+        t_raw, raw = _time(lambda: to_json_plotly(px.histogram(df, x="hours", nbins=20)), repeat=1)
+        t_binned, binned = _time(lambda: to_json_plotly(histograms.figure("hours", nbins=20)), repeat=1)
+        counts, edges = histograms.histogram("hours", nbins=20)
+        assert np.array_equal(counts, np.histogram(df["hours"], 20)[0]) and counts.sum() == n_rows
+
+        chunks = [df.iloc[i:i + chunksize] for i in range(0, n_rows, chunksize)]
+        exact, _ = histogram_from_chunks(chunks, "hours", 20, range=(edges[0], edges[-1]))
+        assert np.array_equal(exact, counts)
+        # Sorted chunks: the range has to grow as they come
+        ordered = df.sort_values("hours", ascending=n_rows % 2 == 0)
+        grown, grown_edges = histogram_from_chunks(
+            (ordered.iloc[i:i + chunksize] for i in range(0, n_rows, chunksize)), "hours", 20)
+        assert grown.sum() == n_rows and grown_edges[0] <= edges[0] and grown_edges[-1] >= edges[-1]
+        assert np.array_equal(grown, np.histogram(df["hours"], grown_edges)[0])
+        print(f"{n_rows} rows: pre-binned counts match np.histogram, exactly when streamed with a range")
+        print(f"{'  px.histogram':<32}{len(raw) / 1024:10.1f} KiB {t_raw * 1e3:8.1f} ms")
+        print(f"{'  pre-binned bar figure':<32}{len(binned) / 1024:10.1f} KiB {t_binned * 1e3:8.1f} ms")
+        print(f"{'  streamed range, no range given':<32}{grown_edges[-1] - grown_edges[0]:10.0f} vs {edges[-1] - edges[0]:.0f}")
+
+
+# -------------------------------------------------------------
+# Streaming aggregation
+# -------------------------------------------------------------
+def _status_kb(field):
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith(field + ":"))
+
+
+def _peak_kb(fn):
+    """Peak RSS growth in kB while fn() runs, in a forked child (Linux)."""
+    def run():
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")  # reset the high-water mark to the current RSS
+        base = _status_kb("VmRSS")
+        fn()
+        return _status_kb("VmHWM") - base
+    return _in_child(run)
+
+
+def bench_stream(path, chunksize=20_000):
+    """Check stream_weo against aggregate_weo of the whole file, and compare peak memory."""
+    def in_memory():
+        df = weo_data.clean_weo(weo_data.read_weo_csv(path)[0])
+        return weo_data.pivot_weo(df, aggregate=True)
+
+    def streamed():
+        return weo_data.pivot_weo(weo_data.stream_weo(path, chunksize)[0])
+
+    df, report = weo_data.read_weo_csv(path)
+    df = weo_data.clean_weo(df, report)
+    expected = weo_data.aggregate_weo(df)
+    got, stream_report = weo_data.stream_weo(path, chunksize)
+    assert stream_report == report, (stream_report, report)
+    pd.testing.assert_frame_equal(got.drop(columns="OBS_VALUE"), expected.drop(columns="OBS_VALUE"),
+                                  check_dtype=False)
+    assert np.allclose(got["OBS_VALUE"], expected["OBS_VALUE"], rtol=1e-12)
+    pd.testing.assert_frame_equal(streamed(), in_memory(), check_dtype=False, rtol=1e-12)
+    print(f"stream_weo matches aggregate_weo ({len(got)} rows from {report['rows_kept']} kept)")
+    del df, expected, got
+
+    t_memory, _ = _time(in_memory, repeat=1)
+    t_stream, _ = _time(streamed, repeat=1)
+    print(f"{'in memory: read, clean, aggregate, pivot':<44}{t_memory:7.2f} s  peak +{_peak_kb(in_memory) / 1024:6.1f} MB")
+    print(f"{f'streamed in {chunksize}-row chunks':<44}{t_stream:7.2f} s  peak +{_peak_kb(streamed) / 1024:6.1f} MB")
+
+
+BENCHMARKS = {
+    "sharded": bench_sharded,
+    "memory": bench_memory,
+    "index": bench_index,
+    "cube": bench_cube,
+    "transforms": bench_transforms,
+    "corr": bench_corr,
+    "trendline": bench_trendline,
+    "render": bench_render,
+    "patch": bench_patch,
+    "geo": bench_geo,
+    "stats": bench_stats,
+    "shared": bench_shared,
+    "serve": bench_serve,
+    "registry": bench_registry,
+    "crosstab": bench_crosstab,
+    "histogram": bench_histogram,
+    "stream": bench_stream,
+}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(f"usage: python benchmarks.py {{{','.join(BENCHMARKS)}}} [WEO csv]")
+        sys.exit(1)
+    BENCHMARKS[sys.argv[1]](_data_path(sys.argv))
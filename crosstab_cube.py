@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cross-tab cube for range filters over a few small integer dimensions.
+
+Rows are binned once into the cells of their key columns (e.g. kids5 x
+kids618), and per cell the cube keeps counts per category, histogram bin
+counts and count/sum/sum of squares of numeric columns. Cumulative sums
+along every dimension turn any box of key ranges, which is what a set of
+RangeSliders selects, into 2^d lookups by inclusion-exclusion, whatever
+the number of rows:
+
+    cube = CrossTabCube(df[["kids5", "kids618"]], counts={"lfp": df["lfp"]},
+                        values={"hours": df["hours"]}, bins={"hours": 20})
+    box = cube.query(kids5=(0, 1), kids618=(2, 4))
+    box.counts("lfp"), box.moments("hours"), box.histogram("hours")
+
+Memory is the product of (distinct values + 1) over the dimensions times
+the number of aggregates, so it suits microdata with many rows but few,
+coarse filter dimensions.
+"""
+import itertools
+
+import numpy as np
+import pandas as pd
+
+
+class CrossTabCube:
+    """Prefix sums of per-cell aggregates over the key columns of keys.
+
+    counts maps names to categorical Series (missing values are not
+    counted); values maps names to numeric Series whose NaNs are left out of
+    their moments and histograms; bins gives, for some values, the number of
+    histogram bins or their edges. Rows with a missing key are left out.
+    """
+
+    def __init__(self, keys, counts=None, values=None, bins=None):
+        counts, values, bins = counts or {}, values or {}, bins or {}
+        self.dims = list(keys.columns)
+        self.domains = [np.unique(keys[d].dropna().to_numpy()) for d in self.dims]
+        shape = tuple(len(domain) for domain in self.domains)
+
+        index = [np.searchsorted(domain, keys[d].to_numpy()) for d, domain in zip(self.dims, self.domains)]
+        valid = keys.notna().all(axis=1).to_numpy()
+        cell = np.ravel_multi_index([i[valid] for i in index], shape)
+        n_cells = int(np.prod(shape))
+
+        # One (cells, k) block per aggregate, stacked into a single table
+        blocks, self._slices, self.categories, self.edges, self.shift = [], {}, {}, {}, {}
+
+        def add(key, block):
+            start = sum(b.shape[1] for b in blocks)
+            self._slices[key] = slice(start, start + block.shape[1])
+            blocks.append(block)
+
+        for name, series in counts.items():
+            series = series.to_numpy()[valid]
+            present = ~pd.isna(series)
+            self.categories[name], codes = np.unique(series[present], return_inverse=True)
+            k = len(self.categories[name])
+            add(("counts", name), np.bincount(cell[present] * k + codes.ravel(), minlength=n_cells * k)
+                .reshape(n_cells, k).astype(float))
+
+        for name, series in values.items():
+            x = series.to_numpy(dtype=float)[valid]
+            present = ~np.isnan(x)
+            x, where = x[present], cell[present]
+            # Sums of the deviations from the overall mean, so the variance of a box loses less precision
+            self.shift[name] = shift = x.mean() if len(x) else 0.0
+            add(("moments", name), np.column_stack([
+                np.bincount(where, minlength=n_cells),
+                np.bincount(where, x - shift, minlength=n_cells),
+                np.bincount(where, (x - shift) ** 2, minlength=n_cells),
+            ]).astype(float))
+
+            if name in bins:
+                edges = bins[name]
+                edges = np.histogram_bin_edges(x, edges) if np.isscalar(edges) else np.asarray(edges, dtype=float)
+                self.edges[name] = edges
+                # np.histogram's bins: half-open, the last one closed
+                b = np.searchsorted(edges, x, side="right") - 1
+                b[x == edges[-1]] = len(edges) - 2
+                inside = (b >= 0) & (b < len(edges) - 1)
+                k = len(edges) - 1
+                add(("histogram", name), np.bincount(where[inside] * k + b[inside], minlength=n_cells * k)
+                    .reshape(n_cells, k).astype(float))
+
+        table = np.hstack(blocks) if blocks else np.zeros((n_cells, 0))
+        table = table.reshape(shape + (table.shape[1],))
+        for axis in range(len(shape)):
+            table = np.cumsum(table, axis=axis)
+        # A zero plane in front of each dimension: prefix[i] is the total of cells < i
+        self.prefix = np.pad(table, [(1, 0)] * len(shape) + [(0, 0)])
+
+    def query(self, **ranges):
+        """Totals of the rows whose keys lie in the given inclusive (low, high) ranges.
+
+        Dimensions not given are not filtered.
+        """
+        unknown = set(ranges) - set(self.dims)
+        if unknown:
+            raise KeyError(f"Not a dimension of the cube: {', '.join(sorted(unknown))}")
+
+        bounds = []
+        for dim, domain in zip(self.dims, self.domains):
+            if dim in ranges and ranges[dim] is not None:
+                low, high = ranges[dim]
+                lo, hi = np.searchsorted(domain, low, side="left"), np.searchsorted(domain, high, side="right")
+                bounds.append((lo, max(lo, hi)))
+            else:
+                bounds.append((0, len(domain)))
+        totals = np.zeros(self.prefix.shape[-1])
+        for corner in itertools.product((0, 1), repeat=len(bounds)):
+            sign = -1 if (len(corner) - sum(corner)) % 2 else 1
+            totals += sign * self.prefix[tuple(b[c] for b, c in zip(bounds, corner))]
+        return CrossTab(self, totals)
+
+
+class CrossTab:
+    """Aggregates of one box of a CrossTabCube."""
+
+    def __init__(self, cube, totals):
+        self.cube = cube
+        self.totals = totals
+
+    def _block(self, kind, name):
+        return self.totals[self.cube._slices[(kind, name)]]
+
+    def counts(self, name):
+        """Rows per category, as value_counts would give them (but sorted and with zeros)."""
+        return pd.Series(np.rint(self._block("counts", name)).astype(np.int64),
+                         index=pd.Index(self.cube.categories[name], name=name), name="count")
+
+    def moments(self, name):
+        """(count, mean, sample standard deviation) of the non-missing values."""
+        n, s, ss = self._block("moments", name)
+        n = int(round(n))
+        if n == 0:
+            return 0, np.nan, np.nan
+        mean = s / n
+        std = np.sqrt(max(ss - s * mean, 0.0) / (n - 1)) if n > 1 else np.nan
+        return n, mean + self.cube.shift[name], std
+
+    def histogram(self, name):
+        """(bin counts, bin edges), as np.histogram with the cube's edges."""
+        return np.rint(self._block("histogram", name)).astype(np.int64), self.cube.edges[name]
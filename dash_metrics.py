@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Timing and payload metrics for Dash callbacks, served in Prometheus format.
+
+Call instrument(app) right after creating the app: every callback
+registered with @app.callback afterwards records its wall time, CPU time,
+the size of the response Dash sends for it and any stages it marks with
+
+    with stage("filter"):
+        ...
+
+or by decorating a helper with @stage("figure"). The numbers are served
+at /metrics (loopback clients only by default) as summaries with
+p50/p95/p99 over the most recent calls, plus a cumulative latency
+histogram.
+
+Background callbacks (background=True) run in the job's subprocess, so
+what they record stays there and is not served; their progress and
+result polls are not timed either.
+"""
+import contextvars
+import functools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import flask
+import numpy as np
+from dash.exceptions import PreventUpdate
+
+QUANTILES = (0.5, 0.95, 0.99)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Stage timings of the callback running in this thread / context:
+# (seconds per stage, stack of [open stage, time it last resumed])
+_stages = contextvars.ContextVar("dash_metrics_stages", default=None)
+
+
+@contextmanager
+def stage(name):
+    """Time a block (or, as a decorator, a function) as one stage of the current callback.
+
+    Nested stages are timed exclusively: the outer stage's clock stops while
+    an inner one runs. A no-op outside instrumented callbacks.
+    """
+    state = _stages.get()
+    if state is None:
+        yield
+        return
+    times, stack = state
+    now = time.perf_counter()
+    if stack:
+        outer, resumed = stack[-1]
+        times[outer] = times.get(outer, 0.0) + now - resumed
+    stack.append([name, now])
+    try:
+        yield
+    finally:
+        now = time.perf_counter()
+        _, resumed = stack.pop()
+        times[name] = times.get(name, 0.0) + now - resumed
+        if stack:
+            stack[-1][1] = now
+
+
+class _Series:
+    """Recent samples for the quantiles, plus all-time count and sum."""
+
+    def __init__(self, window):
+        self.recent = deque(maxlen=window)
+        self.count = 0
+        self.sum = 0.0
+
+    def add(self, value):
+        self.recent.append(value)
+        self.count += 1
+        self.sum += value
+
+
+class CallbackMetrics:
+    """Per-callback series of wall time, CPU time, payload bytes and stage times."""
+
+    def __init__(self, window=1024, payload_size=True):
+        self.window = window
+        self.payload_size = payload_size
+        self._series = {}  # (metric, callback, stage) -> _Series
+        self._buckets = {}  # callback -> cumulative counts per LATENCY_BUCKETS (+Inf last)
+        self._errors = {}
+        self._prevented = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric, callback, value, stage_name=None):
+        key = (metric, callback, stage_name)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = _Series(self.window)
+        series.add(value)
+
+    def record(self, callback, wall, cpu, stages):
+        with self._lock:
+            self._add("duration_seconds", callback, wall)
+            self._add("cpu_seconds", callback, cpu)
+            for name, seconds in stages.items():
+                self._add("stage_seconds", callback, seconds, name)
+            counts = self._buckets.setdefault(callback, [0] * (len(LATENCY_BUCKETS) + 1))
+            counts[int(np.searchsorted(LATENCY_BUCKETS, wall))] += 1
+
+    def record_payload(self, callback, size):
+        with self._lock:
+            self._add("payload_bytes", callback, size)
+
+    def _count(self, table, callback):
+        with self._lock:
+            table[callback] = table.get(callback, 0) + 1
+
+    def wrap(self, func):
+        """func timed and measured on every call."""
+        name = func.__name__
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            stages = {}
+            token = _stages.set((stages, []))
+            wall, cpu = time.perf_counter(), time.thread_time()
+            try:
+                output = func(*args, **kwargs)
+            except PreventUpdate:
+                self._count(self._prevented, name)
+                raise
+            except Exception:
+                self._count(self._errors, name)
+                raise
+            finally:
+                _stages.reset(token)
+            self.record(name, time.perf_counter() - wall, time.thread_time() - cpu, stages)
+            if self.payload_size and flask.has_request_context():
+                flask.g.dash_metrics_callback = name  # sized by the after_request hook of instrument
+            return output
+
+        return timed
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            series = sorted(self._series.items(), key=lambda item: tuple(str(k) for k in item[0]))
+            for metric, help_text in [
+                ("duration_seconds", "Wall time of Dash callbacks"),
+                ("cpu_seconds", "CPU time of Dash callbacks"),
+                ("payload_bytes", "Size of the response body sent for the callback"),
+                ("stage_seconds", "Wall time of marked stages inside Dash callbacks"),
+            ]:
+                lines += [f"# HELP dash_callback_{metric} {help_text}", f"# TYPE dash_callback_{metric} summary"]
+                for (name, callback, stage_name), s in series:
+                    if name != metric:
+                        continue
+                    labels = f'callback="{callback}"' + (f',stage="{stage_name}"' if stage_name else "")
+                    for q, v in zip(QUANTILES, np.quantile(np.fromiter(s.recent, float), QUANTILES)):
+                        lines.append(f'dash_callback_{metric}{{{labels},quantile="{q}"}} {v:.6g}')
+                    lines.append(f"dash_callback_{metric}_sum{{{labels}}} {s.sum:.6g}")
+                    lines.append(f"dash_callback_{metric}_count{{{labels}}} {s.count}")
+
+            lines += ["# HELP dash_callback_latency_seconds Histogram of callback wall time",
+                      "# TYPE dash_callback_latency_seconds histogram"]
+            for callback, counts in sorted(self._buckets.items()):
+                total = 0
+                for bound, n in zip(LATENCY_BUCKETS + ("+Inf",), counts):
+                    total += n
+                    lines.append(f'dash_callback_latency_seconds_bucket{{callback="{callback}",le="{bound}"}} {total}')
+                s = self._series[("duration_seconds", callback, None)]
+                lines.append(f'dash_callback_latency_seconds_sum{{callback="{callback}"}} {s.sum:.6g}')
+                lines.append(f'dash_callback_latency_seconds_count{{callback="{callback}"}} {total}')
+
+            for metric, table in (("errors_total", self._errors), ("prevented_total", self._prevented)):
+                lines.append(f"# TYPE dash_callback_{metric} counter")
+                lines += [f'dash_callback_{metric}{{callback="{c}"}} {n}' for c, n in sorted(table.items())]
+        return "\n".join(lines) + "\n"
+
+
+def instrument(app, metrics=None, path="/metrics", local_only=True):
+    """Wrap every callback registered on app from now on, and serve the metrics at path.
+
+    Returns the CallbackMetrics. With local_only the endpoint answers only
+    loopback clients.
+    """
+    metrics = metrics or CallbackMetrics()
+    register = app.callback
+
+    @functools.wraps(register)
+    def callback(*args, **kwargs):
+        decorator = register(*args, **kwargs)
+        return lambda func: decorator(metrics.wrap(func))
+
+    app.callback = callback
+
+    @app.server.after_request
+    def measure_payload(response):
+        # The response Dash already serialized, so sizing it costs no second encoding
+        name = flask.g.pop("dash_metrics_callback", None)
+        if name is not None and not response.is_streamed:
+            metrics.record_payload(name, response.calculate_content_length() or len(response.get_data()))
+        return response
+
+    def serve_metrics():
+        if local_only and flask.request.remote_addr not in ("127.0.0.1", "::1", None):
+            flask.abort(403)
+        return flask.Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+    app.server.add_url_rule(path, "dash_metrics", serve_metrics)
+    return metrics
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local registry of the datasets the scripts read.
+
+Files live in a content-addressed store under DATA_DIR: objects/<sha256>
+holds the bytes, refs.json records which object each dataset name points
+to, and DATA_DIR/<name>/<filename> is a stable path linked to the current
+object. Nothing is downloaded implicitly; a dataset missing from the store
+raises DatasetMissing until it is fetched (on a host with network access)
+or added from a copy made by hand:
+
+    python data_registry.py fetch mroz87 us_states
+    python data_registry.py add weo ~/Downloads/WEO_data-2.csv
+    python data_registry.py verify
+
+Tables are kept as well as a typed binary copy, built once per object after
+its checksum is checked: one raw file per column next to a JSON manifest,
+so read_dataset("mroz87") memory-maps the columns instead of parsing csv.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import urllib.request
+
+import numpy as np
+import pandas as pd
+
+DATA_DIR = os.environ.get(
+    "DATASET_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".datasets")
+)
+
+# dtype kinds written as they are; other columns are written as codes
+RAW_KINDS = "biufcmM"
+
+
+class Dataset:
+    """Where a dataset comes from and, for tables, how its csv is read."""
+
+    def __init__(self, filename, url=None, sha256=None, read_csv=None):
+        self.filename = filename
+        self.url = url
+        self.sha256 = sha256  # expected checksum, if pinned; otherwise recorded at the first fetch
+        self.read_csv = read_csv  # pd.read_csv options; None for files used as they are
+
+
+REGISTRY = {
+    "mroz87": Dataset(
+        "Mroz87.csv", read_csv={"index_col": 0},
+        url="https://vincentarelbundock.github.io/Rdatasets/csv/sampleSelection/Mroz87.csv",
+    ),
+    # IMF exports have no stable URL: download them from the IMF data portal and add them
+    "weo": Dataset("WEO_data-2.csv"),
+    "weo_v1": Dataset("WEO_data.csv"),  # the earlier export GDP Dashboard.py was built on
+    "weo_small": Dataset("WEO_data_small.csv"),
+    "us_states": Dataset(
+        "cb_2022_us_state_20m.zip",
+        url="https://www2.census.gov/geo/tiger/GENZ2022/shp/cb_2022_us_state_20m.zip",
+    ),
+}
+
+
+class DatasetMissing(FileNotFoundError):
+    pass
+
+
+class ChecksumError(ValueError):
+    pass
+
+
+# -------------------------------------------------------------
+# Store
+# -------------------------------------------------------------
+def sha256sum(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _object_path(sha256):
+    return os.path.join(DATA_DIR, "objects", sha256)
+
+
+def _replace_json(obj, path):
+    tmp_path = path + f".{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(obj, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def read_refs():
+    """{name: {"sha256", "size", "source"}} of the datasets in the store."""
+    try:
+        with open(os.path.join(DATA_DIR, "refs.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _spec(name):
+    try:
+        return REGISTRY[name]
+    except KeyError:
+        raise KeyError(f"Unknown dataset {name!r}; registered: {', '.join(sorted(REGISTRY))}") from None
+
+
+def _link(name, sha256):
+    """Point DATA_DIR/<name>/<filename> at the object, replacing the previous link in one step."""
+    path = os.path.join(DATA_DIR, name, _spec(name).filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + f".{os.getpid()}.tmp"
+    try:
+        os.symlink(os.path.relpath(_object_path(sha256), os.path.dirname(path)), tmp_path)
+    except OSError:
+        os.link(_object_path(sha256), tmp_path)  # no symlinks (e.g. Windows without privileges)
+    os.replace(tmp_path, path)
+    return path
+
+
+def add(name, source_path, source=None):
+    """Copy a file into the store as the current version of dataset name."""
+    spec = _spec(name)
+    sha256 = sha256sum(source_path)
+    if spec.sha256 and sha256 != spec.sha256:
+        raise ChecksumError(f"{source_path} has sha256 {sha256}, {name} expects {spec.sha256}")
+
+    object_path = _object_path(sha256)
+    if not os.path.exists(object_path):
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        tmp_path = object_path + f".{os.getpid()}.tmp"
+        shutil.copyfile(source_path, tmp_path)
+        os.chmod(tmp_path, 0o444)
+        os.replace(tmp_path, object_path)
+
+    path = _link(name, sha256)
+    refs = read_refs()
+    refs[name] = {"sha256": sha256, "size": os.path.getsize(object_path),
+                  "source": source or os.path.abspath(source_path)}
+    _replace_json(refs, os.path.join(DATA_DIR, "refs.json"))
+    return path
+
+
+def fetch(name, force=False, timeout=60):
+    """Download dataset name into the store, unless it is there already (or force)."""
+    spec = _spec(name)
+    if name in read_refs() and not force:
+        return dataset_path(name)
+    if spec.url is None:
+        raise DatasetMissing(f"{name} has no download URL; add a local copy: "
+                             f"python data_registry.py add {name} PATH")
+    os.makedirs(DATA_DIR, exist_ok=True)
+    tmp_path = os.path.join(DATA_DIR, f"{name}.{os.getpid()}.download")
+    try:
+        with urllib.request.urlopen(spec.url, timeout=timeout) as response, open(tmp_path, "wb") as f:
+            shutil.copyfileobj(response, f)
+        return add(name, tmp_path, source=spec.url)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def dataset_path(name, default=None):
+    """Local path of dataset name; default (if given) when it is not in the store."""
+    ref = read_refs().get(name)
+    if ref is None:
+        if default is not None:
+            return default
+        how = "fetch" if _spec(name).url else "add"
+        raise DatasetMissing(f"{name} is not in {DATA_DIR}; run: python data_registry.py {how} {name}"
+                             + (" PATH" if how == "add" else ""))
+    path = os.path.join(DATA_DIR, name, _spec(name).filename)
+    if not os.path.exists(path):
+        path = _link(name, ref["sha256"])
+    return path
+
+
+def verify(names=None):
+    """{name: True/False}: whether each stored object still hashes to its ref."""
+    refs = read_refs()
+    result = {}
+    for name in names or sorted(refs):
+        ref = refs.get(name)
+        path = ref and _object_path(ref["sha256"])
+        result[name] = bool(ref) and os.path.exists(path) and sha256sum(path) == ref["sha256"]
+    return result
+
+
+# -------------------------------------------------------------
+# Typed copies
+# -------------------------------------------------------------
+def _save_table(df, manifest_path):
+    """Write df (index first) as one raw file per column next to a JSON manifest."""
+    base = os.path.splitext(manifest_path)[0]
+    manifest = {"rows": len(df), "columns": []}
+    for n, (name, series) in enumerate([(df.index.name, pd.Series(df.index))] + list(df.items())):
+        spec = {"name": name, "dtype": str(series.dtype)}
+        values = series.to_numpy()
+        if series.dtype.kind in RAW_KINDS and isinstance(series.dtype, np.dtype):
+            path = f"{base}_{n}.bin"
+            tmp_path = path + f".{os.getpid()}.tmp"
+            np.ascontiguousarray(values).tofile(tmp_path)
+            os.replace(tmp_path, path)
+            spec.update(file=os.path.basename(path), dtype=values.dtype.str)
+        else:
+            # Strings etc.: raw codes into the distinct values, which go in the manifest
+            codes, uniques = pd.factorize(values)
+            path = f"{base}_{n}.bin"
+            tmp_path = path + f".{os.getpid()}.tmp"
+            codes.astype(np.int32).tofile(tmp_path)
+            os.replace(tmp_path, path)
+            spec.update(file=os.path.basename(path), codes=True, values=list(uniques))
+        manifest["columns"].append(spec)
+    # The manifest goes last: a reader that finds it finds every column
+    _replace_json(manifest, manifest_path)
+
+
+def _open_table(manifest_path):
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    directory = os.path.dirname(manifest_path)
+    columns = []
+    for spec in manifest["columns"]:
+        dtype = np.dtype(np.int32 if spec.get("codes") else spec["dtype"])
+        values = (np.memmap(os.path.join(directory, spec["file"]), dtype=dtype, mode="r",
+                            shape=(manifest["rows"],)) if manifest["rows"] else np.empty(0, dtype))
+        if spec.get("codes"):
+            # code -1 (missing) picks the NaN appended last, as read_csv leaves it
+            values = np.array(spec["values"] + [np.nan], dtype=object).take(values)
+        columns.append((spec["name"], values, spec["dtype"]))
+    (index_name, index, index_dtype), columns = columns[0], columns[1:]
+    index = pd.Index(index, dtype=index_dtype, name=index_name)
+    return pd.DataFrame({name: pd.Series(values, index=index, dtype=dtype) for name, values, dtype in columns},
+                        index=index)
+
+
+def read_dataset(name):
+    """DataFrame of a table dataset, from its typed copy (built on first use)."""
+    spec = _spec(name)
+    if spec.read_csv is None:
+        raise ValueError(f"{name} is not a table; use dataset_path({name!r})")
+    path = dataset_path(name)
+    sha256 = read_refs()[name]["sha256"]
+    options = hashlib.sha1(json.dumps(spec.read_csv, sort_keys=True).encode()).hexdigest()[:12]
+    manifest_path = os.path.join(DATA_DIR, "typed", f"{sha256[:20]}_{options}.json")
+    if not os.path.exists(manifest_path):
+        if sha256sum(path) != sha256:
+            raise ChecksumError(f"{path} does not match its recorded sha256; fetch {name} again")
+        os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        _save_table(pd.read_csv(path, **spec.read_csv), manifest_path)
+    return _open_table(manifest_path)
+
+
+# -------------------------------------------------------------
+# Command line
+# -------------------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the local dataset store.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    fetch_cmd = commands.add_parser("fetch", help="download datasets into the store")
+    fetch_cmd.add_argument("names", nargs="*", help="default: every dataset with a URL")
+    fetch_cmd.add_argument("--force", action="store_true", help="download again even if stored")
+    add_cmd = commands.add_parser("add", help="add a local file as a dataset")
+    add_cmd.add_argument("name", choices=sorted(REGISTRY))
+    add_cmd.add_argument("path")
+    verify_cmd = commands.add_parser("verify", help="check the stored files against their checksums")
+    verify_cmd.add_argument("names", nargs="*")
+    commands.add_parser("list", help="show the registered datasets")
+    args = parser.parse_args(argv)
+
+    if args.command == "fetch":
+        for name in args.names or [n for n, spec in REGISTRY.items() if spec.url]:
+            print(f"{name}: {fetch(name, force=args.force)}")
+    elif args.command == "add":
+        print(f"{args.name}: {add(args.name, args.path)}")
+    elif args.command == "verify":
+        result = verify(args.names)
+        for name, ok in result.items():
+            print(f"{name}: {'ok' if ok else 'MISMATCH'}")
+        return 0 if all(result.values()) else 1
+    else:
+        refs = read_refs()
+        for name, spec in REGISTRY.items():
+            ref = refs.get(name)
+            print(f"{name:<10} {ref['sha256'][:12] if ref else 'missing':<12} {spec.url or '(add by hand)'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
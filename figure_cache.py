@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LRU cache of serialized Plotly figures for the dashboard callbacks.
+
+Entries are bounded by their serialized size in bytes and can expire after
+a TTL. Hit/miss counters are kept for monitoring.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import plotly.graph_objects as go
+
+
+def normalize_selection(countries, variables, data_type="level"):
+    """Cache key for a dashboard selection.
+
+    Countries are sorted and deduplicated, since their order does not change
+    what is plotted. Indicator order is kept (it decides the scatter axes),
+    duplicates dropped.
+    """
+    return (
+        tuple(sorted(set(countries or []))),
+        tuple(dict.fromkeys(variables or [])),
+        data_type,
+    )
+
+
+def _figure_size(figure):
+    """Approximate JSON length of a figure dict, from its arrays and first trace.
+
+    The layout and the array buffers (base64 "bdata" strings) are counted
+    exactly; every trace is taken to carry as much besides its arrays as
+    the first. Traces of one px figure differ there only by names, so this
+    is within a few percent, at a fraction of an encode.
+    """
+    traces = figure.get("data") or []
+    size = len(json.dumps({k: v for k, v in figure.items() if k != "data"}, default=str)) + len('"data": [], ')
+    first_rest = None
+    for trace in traces:
+        rest = {}
+        for key, v in trace.items():
+            if type(v) is dict and "bdata" in v:
+                # "key": {"dtype": "f8", "bdata": "..."}, 
+                size += len(key) + len(v["bdata"]) + len(v.get("dtype", "")) + 34
+            elif first_rest is None:
+                rest[key] = v
+        if first_rest is None:
+            first_rest = len(json.dumps(rest, default=str))
+        size += first_rest + 2
+    return size
+
+
+def json_size(value):
+    """Length of value's JSON, approximately for figure dicts (see _figure_size), without encoding it."""
+    if isinstance(value, dict) and "data" in value and "layout" in value:
+        return _figure_size(value)
+    if isinstance(value, dict):
+        return 2 * len(value) + sum(json_size(str(k)) + 2 + json_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return 2 * max(len(value), 1) + sum(json_size(v) for v in value)
+    return len(json.dumps(value, default=str))
+
+
+def serialize(value):
+    """Replace go.Figure objects in a (nested) plots dict with plain figure dicts.
+
+    Returns (value, approximate size in bytes of its JSON, see json_size).
+    """
+    def convert(v):
+        if isinstance(v, go.Figure):
+            return v.to_plotly_json()
+        if isinstance(v, dict):
+            return {k: convert(x) for k, x in v.items()}
+        return v
+
+    value = convert(value)
+    return value, json_size(value)
+
+
+class FigureCache:
+    """Thread-safe LRU cache bounded by bytes, with an optional TTL in seconds."""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (value, size, created)
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[2] > self.ttl:
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size, time.monotonic())
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def get_or_build(self, key, build):
+        """Cached value for key, else serialize(build()) and store it."""
+        value = self.get(key)
+        if value is None:
+            value, size = serialize(build())
+            self.put(key, value, size)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.bytes -= size
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Histograms binned on the server.
+
+px.histogram sends every value of the column to the browser and bins it
+there. HistogramService bins a column once per (column, nbins, filter) with
+NumPy and returns a bar figure of the counts, so the payload grows with the
+number of bins, not of rows:
+
+    histograms = HistogramService(df)
+    histograms.figure("wage", nbins=20, where={"hours": (1, None)})
+
+For files too large to load, histogram_from_chunks bins a chunked reader
+(pd.read_csv(..., chunksize=...)) with a StreamingHistogram.
+"""
+import numpy as np
+import plotly.graph_objects as go
+
+from figure_cache import FigureCache
+
+
+def _finite(values):
+    values = np.asarray(values, dtype=float)
+    return values[np.isfinite(values)]
+
+
+def filter_key(where):
+    """Hashable form of a filter {column: (low, high)}; None bounds are open."""
+    return tuple(sorted((column, tuple(bounds)) for column, bounds in (where or {}).items()))
+
+
+def bar_figure(counts, edges, column, title=None):
+    """Histogram-style bar figure of precomputed bin counts."""
+    fig = go.Figure(go.Bar(
+        x=(edges[:-1] + edges[1:]) / 2, y=counts, width=np.diff(edges),
+        hovertemplate=f"{column}=%{{customdata[0]:.4g}}–%{{customdata[1]:.4g}}<br>count=%{{y}}<extra></extra>",
+        customdata=np.column_stack([edges[:-1], edges[1:]]),
+    ))
+    fig.update_layout(title=title, bargap=0, xaxis_title=column, yaxis_title="count")
+    return fig
+
+
+class HistogramService:
+    """Bin edges, counts and bar figures of the numeric columns of df, cached."""
+
+    def __init__(self, df, max_bytes=16 * 1024 * 1024):
+        self.df = df
+        self._bins = {}  # (column, nbins, filter) -> (counts, edges)
+        self.figures = FigureCache(max_bytes=max_bytes)
+
+    def _rows(self, key):
+        mask = np.ones(len(self.df), dtype=bool)
+        for column, (low, high) in key:
+            values = self.df[column].to_numpy(dtype=float)
+            if low is not None:
+                mask &= values >= low
+            if high is not None:
+                mask &= values <= high
+        return mask
+
+    def histogram(self, column, nbins=20, where=None):
+        """(counts, edges) of column over the rows passing where, as np.histogram gives them."""
+        key = (column, nbins, filter_key(where))
+        if key not in self._bins:
+            values = self.df[column].to_numpy(dtype=float)
+            if key[2]:
+                values = values[self._rows(key[2])]
+            self._bins[key] = np.histogram(_finite(values), bins=nbins)
+        return self._bins[key]
+
+    def figure(self, column, nbins=20, where=None, title=None):
+        """Bar figure (as a dict) of histogram(column, nbins, where)."""
+        return self.figures.get_or_build(
+            (column, nbins, filter_key(where), title),
+            lambda: bar_figure(*self.histogram(column, nbins, where), column, title)
+        )
+
+
+# -------------------------------------------------------------
+# Streaming
+# -------------------------------------------------------------
+class StreamingHistogram:
+    """Equal-width bins filled chunk by chunk.
+
+    With a range the counts are exactly np.histogram's over that range
+    (values outside it are dropped). Without one the range starts at the
+    first chunk's and, whenever a value falls outside, doubles its bin width
+    towards it, merging pairs of bins. Counts stay exact for the final
+    bins, but the range can end up to twice as wide as the data's.
+    """
+
+    def __init__(self, nbins=20, range=None):
+        self.nbins = nbins
+        self.fixed = range is not None
+        self.edges = np.linspace(range[0], range[1], nbins + 1) if self.fixed else None
+        self.counts = np.zeros(nbins, dtype=np.int64)
+        self.rows = 0
+
+    def _grow(self, low, high):
+        while low < self.edges[0] or high > self.edges[-1]:
+            lo, width = self.edges[0], self.edges[1] - self.edges[0]
+            if low < lo:
+                lo -= self.nbins * width  # old bins become the upper half
+                merged = (np.arange(self.nbins) + self.nbins) // 2
+            else:
+                merged = np.arange(self.nbins) // 2
+            self.counts = np.bincount(merged, weights=self.counts, minlength=self.nbins).astype(np.int64)
+            self.edges = lo + 2 * width * np.arange(self.nbins + 1)
+
+    def update(self, values):
+        values = _finite(values)
+        self.rows += len(values)
+        if not len(values):
+            return self
+        if self.edges is None:
+            self.edges = np.histogram_bin_edges(values, bins=self.nbins)
+        elif not self.fixed:
+            self._grow(values.min(), values.max())
+        self.counts += np.histogram(values, bins=self.edges)[0]
+        return self
+
+    def result(self):
+        """(counts, edges); np.histogram's empty-input edges if no value was seen."""
+        if self.edges is None:
+            return self.counts, np.histogram_bin_edges([], bins=self.nbins)
+        return self.counts, self.edges
+
+
+def histogram_from_chunks(chunks, column, nbins=20, range=None):
+    """(counts, edges) of column over an iterable of DataFrames, e.g. a chunked read_csv."""
+    streaming = StreamingHistogram(nbins, range)
+    for chunk in chunks:
+        streaming.update(chunk[column].to_numpy(dtype=float))
+    return streaming.result()
@@ -5,188 +5,290 @@ Created on Tue Nov 11 12:24:12 2025
 @author: katedamato
 """
 
+import os
+from functools import lru_cache
+import flask
+import numpy as np
 import pandas as pd
 import dash
 from dash import Dash, dcc, html, Input, Output, State
 import dash_bootstrap_components as dbc
 import plotly.express as px
-import webbrowser
 import plotly.io as pio
+from weo_data import (load_weo, load_comments, lookup_comment, add_twin_deficits, load_stats,
+                      indicator_stats, prune_cache, WEO_PATH, ID_COLUMNS, ALL_YEARS)
+from weo_index import WideIndex
+from weo_cube import shared_cube
+from weo_geo import WorldGeometry, GEO_PATH, LEVELS, level_for_scale
+from weo_figures import figure_patch
+from weo_reload import DatasetManager
+from dash_metrics import instrument, stage
+from serve import launch
 
 pio.renderers.default = "browser"
 
 # -------------------------------------------------------------
 # Load and preprocess data
 # -------------------------------------------------------------
-df = pd.read_csv(
-    "/Users/katedamato/Downloads/WEO_data-2.csv",
-    index_col=0,
-    engine='python',
-    on_bad_lines='skip'
-)
+use_cube = True
+calculated_columns = ["Net_Exports_Goods_Services", "Capital_Account_Balance"]
 
-# Ensure numeric values
-df = df[pd.to_numeric(df["OBS_VALUE"], errors="coerce").notna()]
-df = df[~df["STRUCTURE_ID"].str.contains("Start/end months", na=False)]
+def load_dataset(path):
+    """Everything the map derives from the WEO file; rebuilt when it changes."""
+    # Compact layout: categorical countries, int16 years, float32 values.
+    # Observation comments live in a side table read on first hover.
+    df, df_wide = load_weo(path, compact=True)
 
-# Pivot to wide format
-df_wide = df.pivot(
-    index=["REF_AREA_ID", "REF_AREA_NAME", "TIME_PERIOD"],
-    columns="INDICATOR_NAME",
-    values=["OBS_VALUE", "COMMENT_OBS"]
-)
+    # Optional calculated columns
+    df_wide = add_twin_deficits(df_wide)
 
-# Flatten multiindex columns
-df_wide.columns = [f"{val}_{col}" for val, col in df_wide.columns]
-df_wide = df_wide.reset_index()
+    # Quantiles per indicator and year, and pooled over all years, for the colour
+    # scale: built at ingest, plus the calculated columns
+    stats = load_stats(path, compact=True)
+    new_columns = [c for c in df_wide.columns
+                   if c not in ID_COLUMNS and c not in stats.index.get_level_values("INDICATOR")]
+    stats = pd.concat([stats, indicator_stats(df_wide, new_columns)]).sort_index()
 
-# Optional calculated columns
-df_wide['Net_Exports_Goods_Services'] = (
-    df_wide.get('OBS_VALUE_Volume of exports of goods and services, Percent change', 0) -
-    df_wide.get('OBS_VALUE_Volume of imports of goods and services, Percent change', 0)
-)
-df_wide['Capital_Account_Balance'] = (
-    df_wide.get('OBS_VALUE_Current account balance, Percent of GDP', 0) -
-    df_wide['Net_Exports_Goods_Services']
-)
+    # Row lookups by year and country id, or the dense cube, memory-mapped once for every worker.
+    # With the cube, df_wide is dropped once the options are read from it
+    backend = shared_cube(df_wide, path) if use_cube else WideIndex(df_wide)
 
-# -------------------------------------------------------------
-# Dropdown options
-# -------------------------------------------------------------
-obs_columns = [col for col in df_wide.columns if col.startswith("OBS_VALUE_")]
-clean_names = [col.replace("OBS_VALUE_", "") for col in obs_columns]
-variable_options = [{"label": clean, "value": col} for clean, col in zip(clean_names, obs_columns)]
+    # Dropdown options
+    obs_columns = [col for col in df_wide.columns if col.startswith("OBS_VALUE_")]
+    variable_options = [{"label": col.replace("OBS_VALUE_", ""), "value": col} for col in obs_columns]
+    variable_options += [{"label": col.replace("_", " "), "value": col} for col in calculated_columns]
 
-calculated_columns = ["Net_Exports_Goods_Services", "Capital_Account_Balance"]
-variable_options += [{"label": col.replace("_", " "), "value": col} for col in calculated_columns]
+    areas = (df_wide[["REF_AREA_ID", "REF_AREA_NAME"]].drop_duplicates("REF_AREA_ID")
+             .astype(str).sort_values("REF_AREA_ID", ignore_index=True))
+    year_list = sorted(int(y) for y in df_wide["TIME_PERIOD"].dropna().unique())
+
+    return {
+        "stats": stats, "backend": backend,
+        "scale_bounds": stats[["q05", "q95"]].to_dict("index"),  # (indicator, year) -> bounds
+        "variable_options": variable_options, "areas": areas, "year_list": year_list,
+    }
+
+# The current data, reloaded in the background when the csv changes
+dataset = DatasetManager(WEO_PATH, load_dataset).start()
 
-year_options = sorted(df_wide["TIME_PERIOD"].dropna().astype(int).unique())
-year_list = [int(x) for x in year_options]
+# Play the years in the browser from a matrix of every year's values,
+# instead of one server round trip per year
+client_playback = True
+
+# Simplified country polygons, served as static layers; without the file
+# the map falls back to Plotly's built-in world geometry
+geo = WorldGeometry(GEO_PATH) if os.path.exists(GEO_PATH) else None
+if geo is not None:
+    geo.layer("low")  # simplify (or load from the cache) before the first request
 
 # -------------------------------------------------------------
 # App Layout
 # -------------------------------------------------------------
 app = Dash(__name__, external_stylesheets=[dbc.themes.FLATLY])
+metrics = instrument(app)  # callback timings at /metrics
+server = app.server
+
+def serve_layout():
+    # Built per page load, so a new page gets the current indicators and years
+    data = dataset.current
+    variable_options, year_list = data.variable_options, data.year_list
+    return dbc.Container(
+        fluid=True,
+        children=[
+
+            html.H2("World Bank Choropleth Dashboard", className="text-center my-4"),
 
-app.layout = dbc.Container(
-    fluid=True,
-    children=[
-
-        html.H2("World Bank Choropleth Dashboard", className="text-center my-4"),
-
-        # -------------------------------------------------------------
-        # Row 1: Dropdown + instruction text
-        # -------------------------------------------------------------
-        dbc.Row([
-            dbc.Col(
-                dbc.Card(dbc.CardBody([
-                    html.Label("Select Indicator:", className="fw-bold"),
-                    dcc.Dropdown(
-                        id="variable_selector",
-                        options=variable_options,
-                        value=variable_options[0]['value'],
-                        clearable=False
-                    )
-                ])), width=6
-            ),
-            dbc.Col(
-                dbc.Card(dbc.CardBody([
-                    html.Div(
-                        "Click a country on the map to explore its trends. "
-                        "Scroll down below the map to view the detailed time series.",
-                        style={"fontSize": "16px", "fontWeight": "500", "color": "#333"}
-                    )
-                ]), style={"height": "100%"})
-            )
-        ], className="mb-4"),
-
-        # -------------------------------------------------------------
-        # Row 2: Slider + Play Button
-        # -------------------------------------------------------------
-        dbc.Row([
-            dbc.Col(
-                html.Div([
-                    dcc.Slider(
-                        id="year_slider",
-                        min=min(year_list),
-                        max=max(year_list),
-                        step=1,
-                        value=min(year_list),
-                        marks={int(y): str(int(y)) for y in year_list[::5]},
-                        tooltip={"placement": "bottom"}
-                    ),
-                    html.Button("▶ Play", id="play_button", n_clicks=0,
-                                style={"marginTop": "15px", "fontWeight": "bold"})
-                ], style={"paddingBottom": "20px"})
-            )
-        ]),
-
-        # Interval timer (disabled by default)
-        dcc.Interval(id="play_interval", interval=400, n_intervals=0, disabled=True),
-
-        # -------------------------------------------------------------
-        # Row 3: Choropleth Map
-        # -------------------------------------------------------------
-        dbc.Row([
-            dbc.Col(
-                dbc.Card(dbc.CardBody([
-                    dcc.Graph(id="choropleth_map", style={"height": "78vh"})
-                ])), width=12
-            )
-        ]),
-
-        # -------------------------------------------------------------
-        # Row 4: Collapsible Country Time Series
-        # -------------------------------------------------------------
-        dbc.Row([
-            dbc.Col(
-                dbc.Collapse(
+            # -------------------------------------------------------------
+            # Row 1: Dropdown + instruction text
+            # -------------------------------------------------------------
+            dbc.Row([
+                dbc.Col(
                     dbc.Card(dbc.CardBody([
-                        dcc.Graph(id="country_time_series", style={"height": "40vh"})
-                    ])),
-                    id="country_panel",
-                    is_open=False
-                ), width=12
-            )
-        ])
-    ]
-)
+                        html.Label("Select Indicator:", className="fw-bold"),
+                        dcc.Dropdown(
+                            id="variable_selector",
+                            options=variable_options,
+                            value=variable_options[0]['value'],
+                            clearable=False
+                        )
+                    ])), width=6
+                ),
+                dbc.Col(
+                    dbc.Card(dbc.CardBody([
+                        html.Div(
+                            "Click a country on the map to explore its trends. "
+                            "Scroll down below the map to view the detailed time series.",
+                            style={"fontSize": "16px", "fontWeight": "500", "color": "#333"}
+                        )
+                    ]), style={"height": "100%"})
+                )
+            ], className="mb-4"),
+
+            # -------------------------------------------------------------
+            # Row 2: Slider + Play Button
+            # -------------------------------------------------------------
+            dbc.Row([
+                dbc.Col(
+                    html.Div([
+                        dcc.Slider(
+                            id="year_slider",
+                            min=min(year_list),
+                            max=max(year_list),
+                            step=1,
+                            value=min(year_list),
+                            marks={int(y): str(int(y)) for y in year_list[::5]},
+                            tooltip={"placement": "bottom"}
+                        ),
+                        html.Button("▶ Play", id="play_button", n_clicks=0,
+                                    style={"marginTop": "15px", "fontWeight": "bold"}),
+                        dcc.RadioItems(
+                            id="scale_mode",
+                            options=[{"label": "Colour scale per year", "value": "year"},
+                                     {"label": "Fixed across years", "value": "fixed"}],
+                            value="year",
+                            inline=True,
+                            style={"marginTop": "10px"}
+                        )
+                    ], style={"paddingBottom": "20px"})
+                )
+            ]),
+
+            # Interval timer (disabled by default)
+            dcc.Interval(id="play_interval", interval=400, n_intervals=0, disabled=True),
+            dcc.Store(id="map_frames"),
+            dcc.Store(id="map_frames_key"),
+
+            # -------------------------------------------------------------
+            # Row 3: Choropleth Map
+            # -------------------------------------------------------------
+            dbc.Row([
+                dbc.Col(
+                    dbc.Card(dbc.CardBody([
+                        dcc.Graph(id="choropleth_map", style={"height": "78vh"}),
+                        dcc.Store(id="map_state")
+                    ])), width=12
+                )
+            ]),
+
+            # -------------------------------------------------------------
+            # Row 4: Collapsible Country Time Series
+            # -------------------------------------------------------------
+            dbc.Row([
+                dbc.Col(
+                    dbc.Collapse(
+                        dbc.Card(dbc.CardBody([
+                            dcc.Graph(id="country_time_series", style={"height": "40vh"}),
+                            html.Div(id="obs_comment", style={"fontStyle": "italic", "color": "#555"})
+                        ])),
+                        id="country_panel",
+                        is_open=False
+                    ), width=12
+                )
+            ])
+        ]
+    )
+
+app.layout = serve_layout
+
+# -------------------------------------------------------------
+# Geometry layers: serialized once per zoom level, cached by the browser
+# -------------------------------------------------------------
+@app.server.route("/geo/<level>.json")
+def geo_layer(level):
+    if geo is None or level not in LEVELS:
+        flask.abort(404)
+    response = flask.Response(geo.layer(level), mimetype="application/json")
+    response.headers["Cache-Control"] = "public, max-age=86400"
+    response.set_etag(geo.etags[level])
+    return response.make_conditional(flask.request)
+
+def geo_args(level):
+    if geo is None:
+        return {}
+    return {"geojson": app.get_relative_path(f"/geo/{level}.json"), "featureidkey": "id"}
 
 # -------------------------------------------------------------
 # Map Generator
 # -------------------------------------------------------------
-def generate_map(selected_variable, selected_year):
-    dff = df_wide[df_wide["TIME_PERIOD"].astype(int) == int(selected_year)].copy()
-    dff[selected_variable] = pd.to_numeric(dff[selected_variable], errors="coerce")
-    dff = dff.dropna(subset=[selected_variable])
+def color_range(selected_variable, selected_year, scale="year"):
+    """5-95% range of the year, or of all years with scale="fixed", from the stats table."""
+    year = ALL_YEARS if scale == "fixed" else int(selected_year)
+    bounds = dataset.get().scale_bounds.get((selected_variable, year))
+    if bounds is None:
+        return None, None
+    return bounds["q05"], bounds["q95"]
+
+def generate_map(selected_variable, selected_year, data=None, level="low", scale="year"):
+    vintage = dataset.get()
+    with stage("filter"):
+        dff = (data or vintage.backend).map_frame(selected_variable, selected_year)
+
+        # Every country in a fixed order, so consecutive years differ only in the values
+        dff = vintage.areas.merge(dff[["REF_AREA_ID", selected_variable]], on="REF_AREA_ID", how="left")
 
     # Trim outliers for stronger visible contrast
-    lower_bound = dff[selected_variable].quantile(0.05)
-    upper_bound = dff[selected_variable].quantile(0.95)
-
-    fig = px.choropleth(
-        dff,
-        locations="REF_AREA_ID",
-        color=selected_variable,
-        hover_name="REF_AREA_NAME",
-        color_continuous_scale=px.colors.sequential.Blues,
-        range_color=(lower_bound, upper_bound),
-        labels={selected_variable: selected_variable.replace("_", " ")}
-    )
+    lower_bound, upper_bound = color_range(selected_variable, selected_year, scale)
 
-    fig.update_layout(template="plotly_white")
+    with stage("figure"):
+        fig = px.choropleth(
+            dff,
+            locations="REF_AREA_ID",
+            color=selected_variable,
+            hover_name="REF_AREA_NAME",
+            color_continuous_scale=px.colors.sequential.Blues,
+            range_color=(lower_bound, upper_bound),
+            labels={selected_variable: selected_variable.replace("_", " ")},
+            **geo_args(level)
+        )
+        fig.update_layout(template="plotly_white")
     return fig
 
 # -------------------------------------------------------------
 # Update map
 # -------------------------------------------------------------
+@lru_cache(maxsize=256)
+def map_figure(version, selected_variable, selected_year, level="low", scale="year"):
+    # version keys the cache by data version; the figure is built from dataset.get()
+    return generate_map(selected_variable, selected_year, level=level, scale=scale).to_plotly_json()
+
+@dataset.on_swap
+def clear_caches(new, old):
+    map_figure.cache_clear()
+
+@dataset.on_release
+def prune_files(old):
+    # Once no callback reads the old vintage, its cached tables and cube files can go
+    prune_cache(WEO_PATH, keep=[dataset.current.stamp[1]])
+
+# With client playback the year is drawn in the browser (show_year below)
 @app.callback(
     Output("choropleth_map", "figure"),
+    Output("map_state", "data"),
     Input("variable_selector", "value"),
-    Input("year_slider", "value")
+    (State if client_playback else Input)("year_slider", "value"),
+    Input("choropleth_map", "relayoutData"),
+    Input("scale_mode", "value"),
+    State("map_state", "data")
 )
-def update_map(selected_variable, selected_year):
-    return generate_map(selected_variable, selected_year)
+@dataset.pin()
+def update_map(selected_variable, selected_year, relayout, scale, shown):
+    # Finer polygons once the user zooms in
+    level = shown[2] if shown else "low"
+    if relayout and "geo.projection.scale" in relayout:
+        level = level_for_scale(relayout["geo.projection.scale"])
+    version = dataset.get().version
+    state = [selected_variable, selected_year, level, scale, version]
+    if shown == state:
+        return dash.no_update, dash.no_update
+
+    # After the first figure only the values, colour range and layer URL change
+    fig = map_figure(version, selected_variable, selected_year, level, scale)
+    if shown and shown[4:] == [version]:
+        with stage("patch"):
+            patch = figure_patch(map_figure(version, *shown[:4]), fig)
+        if patch is not None:
+            return patch, state
+    return fig, state
 
 # -------------------------------------------------------------
 # Toggle play / pause
@@ -208,15 +310,102 @@ def toggle_play(n_clicks, interval_disabled):
 # -------------------------------------------------------------
 # Advance year on interval
 # -------------------------------------------------------------
-@app.callback(
-    Output("year_slider", "value"),
-    Input("play_interval", "n_intervals"),
-    State("year_slider", "value")
-)
-def animate(n, current_year):
-    if current_year < max(year_list):
-        return current_year + 1
-    return max(year_list)
+def year_frames(selected_variable, scale="year", data=None):
+    """Values of every year for the map's countries, with each year's colour range."""
+    vintage = dataset.get()
+    matrix = (data or vintage.backend).year_matrix(selected_variable).reindex(vintage.areas["REF_AREA_ID"])
+    values = matrix.to_numpy(dtype=float)
+    bounds = [color_range(selected_variable, year, scale) for year in matrix.columns]
+    cmin, cmax = np.array(bounds, dtype=float).T
+    z = np.round(values.T, 4).astype(object)
+    z[np.isnan(values.T)] = None
+    return {
+        "variable": selected_variable,
+        "scale": scale,
+        "version": vintage.version,
+        "years": [int(y) for y in matrix.columns],
+        "z": z.tolist(),
+        "cmin": np.where(np.isnan(cmin), None, cmin).tolist(),
+        "cmax": np.where(np.isnan(cmax), None, cmax).tolist(),
+    }
+
+if client_playback:
+    # Frames follow the figure the server drew: its indicator, scale and data version.
+    # map_state also changes on zoom, pan and year, which leave the frames as they are;
+    # their key is kept in a small store so the matrix itself is never sent back up
+    @app.callback(
+        Output("map_frames", "data"),
+        Output("map_frames_key", "data"),
+        Input("map_state", "data"),
+        State("map_frames_key", "data"),
+        prevent_initial_call=True
+    )
+    @dataset.pin()
+    def load_frames(shown, loaded):
+        selected_variable, _, _, scale, version = shown
+        key = [selected_variable, scale, version]
+        if key == loaded:
+            return dash.no_update, dash.no_update
+        return year_frames(selected_variable, scale), key
+
+    # Slider moves and playback only swap z and the colour range in the browser
+    app.clientside_callback(
+        """
+        function(year, frames, variable, scale, figure, shown) {
+            const no_update = window.dash_clientside.no_update;
+            if (!frames || frames.variable !== variable || frames.scale !== scale ||
+                    !shown || frames.version !== shown[4] ||
+                    !figure || !figure.data || !figure.data.length) {
+                return no_update;
+            }
+            const i = frames.years.indexOf(year);
+            if (i < 0) {
+                return no_update;
+            }
+            const trace = Object.assign({}, figure.data[0], {z: frames.z[i]});
+            const coloraxis = Object.assign({}, figure.layout.coloraxis, {cmin: frames.cmin[i], cmax: frames.cmax[i]});
+            return Object.assign({}, figure, {
+                data: [trace].concat(figure.data.slice(1)),
+                layout: Object.assign({}, figure.layout, {coloraxis: coloraxis})
+            });
+        }
+        """,
+        Output("choropleth_map", "figure", allow_duplicate=True),
+        Input("year_slider", "value"),
+        State("map_frames", "data"),
+        State("variable_selector", "value"),
+        State("scale_mode", "value"),
+        State("choropleth_map", "figure"),
+        State("map_state", "data"),
+        prevent_initial_call=True
+    )
+
+    app.clientside_callback(
+        """
+        function(n, current_year, frames) {
+            if (!frames) {
+                return window.dash_clientside.no_update;
+            }
+            const last = frames.years[frames.years.length - 1];
+            return current_year < last ? current_year + 1 : last;
+        }
+        """,
+        Output("year_slider", "value"),
+        Input("play_interval", "n_intervals"),
+        State("year_slider", "value"),
+        State("map_frames", "data")
+    )
+else:
+    @app.callback(
+        Output("year_slider", "value"),
+        Input("play_interval", "n_intervals"),
+        State("year_slider", "value")
+    )
+    def animate(n, current_year):
+        last_year = max(dataset.current.year_list)
+        if current_year < last_year:
+            return current_year + 1
+        return last_year
 
 # -------------------------------------------------------------
 # Country time series
@@ -228,30 +417,45 @@ def animate(n, current_year):
     State("country_panel", "is_open"),
     Input("variable_selector", "value")
 )
+@dataset.pin()
 def update_line_chart(clickData, is_open, selected_variable):
     if clickData is None:
         return px.line(title="Click a country to see its time series"), is_open
     
     country_id = clickData['points'][0]['location']
-    dff_country = df_wide[df_wide["REF_AREA_ID"] == country_id].copy()
-    dff_country[selected_variable] = pd.to_numeric(dff_country[selected_variable], errors="coerce")
-    dff_country = dff_country.dropna(subset=[selected_variable])
-    dff_country = dff_country.sort_values("TIME_PERIOD")
-
-    fig = px.line(
-        dff_country,
-        x="TIME_PERIOD",
-        y=selected_variable,
-        title=f"{dff_country['REF_AREA_NAME'].iloc[0]}: {selected_variable.replace('_', ' ')}",
-        labels={"TIME_PERIOD": "Year", selected_variable: selected_variable.replace("_", " ")}
-    )
-    fig.update_layout(template="plotly_white")
+    with stage("filter"):
+        dff_country = dataset.get().backend.country_series(country_id, selected_variable)
+
+    with stage("figure"):
+        fig = px.line(
+            dff_country,
+            x="TIME_PERIOD",
+            y=selected_variable,
+            title=f"{dff_country['REF_AREA_NAME'].iloc[0]}: {selected_variable.replace('_', ' ')}",
+            labels={"TIME_PERIOD": "Year", selected_variable: selected_variable.replace("_", " ")}
+        )
+        fig.update_layout(template="plotly_white")
     
     return fig, True  # open panel automatically when a country is clicked
 
+# -------------------------------------------------------------
+# Observation comment on hover
+# -------------------------------------------------------------
+@app.callback(
+    Output("obs_comment", "children"),
+    Input("country_time_series", "hoverData"),
+    State("choropleth_map", "clickData"),
+    State("variable_selector", "value")
+)
+def show_comment(hoverData, clickData, selected_variable):
+    if hoverData is None or clickData is None:
+        return ""
+
+    country_id = clickData['points'][0]['location']
+    year = hoverData['points'][0]['x']
+    comment = lookup_comment(load_comments(WEO_PATH), country_id, year, selected_variable)
+    return f"Note: {comment}" if comment else ""
+
 # -------------------------------------------------------------
 if __name__ == "__main__":
-    url = "http://127.0.0.1:8050/"
-    print(f"Your Dash app is running at: {url}")
-    webbrowser.open(url)
-    app.run(debug=True, port=8050)
+    launch(app, port=8050)
@@ -12,11 +12,12 @@ import folium
 import plotly.io as pio
 import os
 import webbrowser
+from data_registry import dataset_path
 
 pio.renderers.default = "browser"
 
-url = "https://www2.census.gov/geo/tiger/GENZ2022/shp/cb_2022_us_state_20m.zip"
-states = gpd.read_file(url)
+# Census cartographic boundary file, from the local store (python data_registry.py fetch us_states)
+states = gpd.read_file(dataset_path("us_states"))
 states.head()
 
 
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Launcher shared by the dashboards.
+
+Every dashboard exposes its Flask app as `server` and ends with
+
+    if __name__ == "__main__":
+        launch(app, port=9000)
+
+Without flags this is the usual development setup: the Flask dev server
+with the debugger and hot reload, and a browser tab. With --workers N the
+app is served by gunicorn with N forked workers and preload, so the WEO
+data is parsed once in the master and shared copy-on-write by the workers
+(or, where gunicorn is not available, e.g. on Windows, by waitress with N
+threads). For example
+
+    python FinalDashboard.py --workers 4 --no-browser
+    gunicorn --preload -c python:serve -w 4 -b 0.0.0.0:9000 FinalDashboard:server
+
+Each worker keeps its own caches and /metrics. Background threads that
+belong to a serving process (e.g. the file watcher of weo_reload) are
+registered with in_serving_process and started only where requests are
+served: this process for the dev server and waitress, each gunicorn worker
+after its fork (the post_fork hook below, which -c python:serve hands to
+the gunicorn command line), never the preload master.
+"""
+import argparse
+import gc
+import os
+import sys
+import webbrowser
+
+SERVERS = ("auto", "gunicorn", "waitress")
+
+_serving_hooks = []
+
+
+def in_serving_process(hook):
+    """Call hook() in each process that serves requests, once it starts serving; usable as a decorator.
+
+    Unlike os.register_at_fork, this leaves alone the other children of the
+    process: process-pool workers, Dash background jobs, the reloader parent.
+    """
+    _serving_hooks.append(hook)
+    return hook
+
+
+def _start_serving():
+    for hook in _serving_hooks:
+        hook()
+
+
+def post_fork(server, worker):
+    """gunicorn hook: the forked worker is a serving process."""
+    _start_serving()
+
+
+def parse_args(argv=None, port=9000):
+    parser = argparse.ArgumentParser(description="Run a Dash dashboard.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to bind (0.0.0.0 for all interfaces)")
+    parser.add_argument("--port", type=int, default=port)
+    parser.add_argument("--workers", type=int, default=0,
+                        help="worker processes (gunicorn) or threads (waitress); 0 runs the Flask dev server")
+    parser.add_argument("--threads", type=int, default=1, help="threads per gunicorn worker")
+    parser.add_argument("--server", choices=SERVERS, default="auto", help="WSGI server used with --workers")
+    parser.add_argument("--no-browser", action="store_true", help="do not open a browser tab")
+    parser.add_argument("--no-debug", action="store_true", help="dev server without the debugger and hot reload")
+    return parser.parse_args(argv)
+
+
+def _gunicorn_app(server, options):
+    from gunicorn.app.base import BaseApplication
+
+    class DashApplication(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            # Already imported in this process: workers fork with the data loaded
+            return server
+
+    return DashApplication()
+
+
+def serve_gunicorn(server, host="127.0.0.1", port=9000, workers=4, threads=1, timeout=120):
+    """Serve a WSGI app with gunicorn from this (preloaded) process; blocks."""
+    options = {
+        "bind": f"{host}:{port}",
+        "workers": workers,
+        "threads": threads,
+        "worker_class": "gthread" if threads > 1 else "sync",
+        "preload_app": True,
+        "timeout": timeout,
+        "accesslog": None,
+        "post_fork": post_fork,
+    }
+    _gunicorn_app(server, options).run()
+
+
+def serve_waitress(server, host="127.0.0.1", port=9000, threads=4):
+    """Serve a WSGI app with waitress (one process, threads); blocks."""
+    import waitress
+
+    waitress.serve(server, host=host, port=port, threads=threads)
+
+
+def _pick_server(name):
+    if name != "auto":
+        return name
+    try:
+        import gunicorn  # noqa: F401 (POSIX only)
+        return "gunicorn"
+    except ImportError:
+        return "waitress"
+
+
+def launch(app, port=9000, argv=None, wait_for=(), use_reloader=True):
+    """Run app as the command line asks: dev server by default, gunicorn/waitress with --workers.
+
+    wait_for are threading.Events (e.g. background precomputation) waited on
+    before the workers are forked, so they share the result.
+    """
+    args = parse_args(sys.argv[1:] if argv is None else argv, port)
+    url = f"http://{'127.0.0.1' if args.host == '0.0.0.0' else args.host}:{args.port}/"
+    print(f"Your Dash app is running at: {url}")
+    if not args.no_browser:
+        webbrowser.open(url)
+
+    if args.workers < 1:
+        debug = not args.no_debug
+        reloader = debug and use_reloader
+        # With the reloader this process only watches the sources; its child serves
+        if not reloader or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+            _start_serving()
+        app.run(debug=debug, use_reloader=reloader, host=args.host, port=args.port)
+        return
+
+    server = _pick_server(args.server)
+    if server == "gunicorn":
+        for event in wait_for:
+            event.wait()
+        # Keep the collector in the workers off the objects loaded here, so their pages stay shared
+        gc.collect()
+        gc.freeze()
+        serve_gunicorn(app.server, args.host, args.port, args.workers, args.threads)
+    else:
+        _start_serving()
+        serve_waitress(app.server, args.host, args.port, threads=args.workers * args.threads)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The grouped statistics of weo_stats against pandas and numpy, one group at a time.
+
+Run with `python -m pytest -q`; benchmarks.py times the same functions.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from weo_cube import WeoCube
+from weo_stats import PairCorrelations, grouped_ols, grouped_pearson
+
+
+def scatter_frame(n_groups=12, n_rows=40, level=0.0, seed=0):
+    """Correlated x, y per group (sizes 2..n_rows), with some missing values."""
+    rng = np.random.default_rng(seed)
+    sizes = rng.integers(2, n_rows, n_groups)
+    groups = np.repeat([f"C{g:03d}" for g in range(n_groups)], sizes)
+    x = level + rng.normal(size=len(groups)) * 10
+    y = level + 0.5 * (x - level) + rng.normal(size=len(groups)) * 5
+    x[rng.random(len(x)) < 0.1] = np.nan
+    y[rng.random(len(y)) < 0.1] = np.nan
+    order = rng.permutation(len(groups))  # groups need not be contiguous
+    return pd.DataFrame({"group": groups[order], "x": x[order], "y": y[order]})
+
+
+@pytest.mark.parametrize("level", [0.0, 1e9])
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")  # Series.corr of a group with one complete row
+def test_grouped_pearson_matches_series_corr(level):
+    df = scatter_frame(level=level)
+    result = grouped_pearson(df["group"], df["x"], df["y"])
+    for group, rows in df.groupby("group"):
+        complete = rows.dropna()
+        assert result.loc[group, "n"] == len(complete)
+        assert np.isclose(result.loc[group, "r"], rows["x"].corr(rows["y"]), atol=1e-6, equal_nan=True)
+
+
+def test_grouped_ols_matches_polyfit():
+    df = scatter_frame()
+    fits = grouped_ols(df["group"], df["x"], df["y"])
+    for group, rows in df.dropna().groupby("group"):
+        fit = fits.loc[group]
+        assert fit["n"] == len(rows)
+        assert (fit["x_min"], fit["x_max"]) == (rows["x"].min(), rows["x"].max())
+        if len(rows) < 4:
+            continue  # polyfit's covariance needs more points than coefficients + 1
+        (slope, intercept), cov = np.polyfit(rows["x"], rows["y"], 1, cov=True)
+        assert np.allclose([fit["slope"], fit["intercept"]], [slope, intercept], rtol=1e-6, atol=1e-9)
+        assert np.allclose([fit["slope_se"], fit["intercept_se"]], np.sqrt(np.diag(cov)), rtol=1e-6)
+        assert np.isclose(fit["r2"], rows["x"].corr(rows["y"]) ** 2, rtol=1e-6)
+
+
+def test_grouped_stats_without_complete_rows():
+    nan = np.full(3, np.nan)
+    assert grouped_pearson(["a", "b", "c"], nan, nan).empty
+    assert grouped_ols(["a", "b", "c"], nan, nan).empty
+
+
+def small_cube(level=0.0, seed=0):
+    rng = np.random.default_rng(seed)
+    n_countries, n_years, n_indicators = 6, 30, 3
+    values = level + rng.normal(size=(n_countries, n_years, n_indicators))
+    values[..., 1] += values[..., 0] - level
+    values[rng.random(values.shape) < 0.15] = np.nan
+    present = np.ones((n_countries, n_years), dtype=bool)
+    present[0, :5] = False
+    values[~present] = np.nan
+    countries = np.array([f"Country {c}" for c in range(n_countries)], dtype=object)
+    ids = np.array([f"C{c:03d}" for c in range(n_countries)], dtype=object)
+    return WeoCube(countries, ids, np.arange(1990, 1990 + n_years), ["A", "B", "C"], values, present)
+
+
+@pytest.mark.parametrize("level", [0.0, 1e9])
+@pytest.mark.parametrize("data_type", ["level", "diff"])
+def test_pair_matrix_matches_grouped_pearson(level, data_type):
+    cube = small_cube(level)
+    pairs = PairCorrelations(cube)
+    pairs.compute()
+    countries = list(cube.countries)
+    df_scatter = cube.select(countries, ["A", "B"], data_type).dropna()
+    grouped = grouped_pearson(df_scatter["REF_AREA_NAME"].astype(str), df_scatter["A"], df_scatter["B"])
+    looked_up = pairs.lookup(countries, "A", "B", data_type)
+    looked_up = looked_up[looked_up["n"] > 1]
+    assert list(looked_up["n"]) == list(grouped.loc[looked_up.index, "n"])
+    assert np.allclose(looked_up["r"], grouped.loc[looked_up.index, "r"], atol=1e-6, equal_nan=True)
+
+
+def test_pair_lookup_before_compute():
+    assert PairCorrelations(small_cube()).lookup(["Country 0"], "A", "B") is None
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Dense country x year x indicator cube of the WEO observations.
+
+An alternative to slicing df_wide: every selection the dashboards make is
+an index into one contiguous float array, first differences are one
+subtraction over the country-year rows and a map frame is a
+cube[:, year, indicator] view. WeoCube answers the same select / map_frame / country_series calls
+as WideIndex, so either can be passed to the plot functions.
+
+shared_cube keeps the arrays in memory-mapped files in the cache dir,
+described by a small JSON manifest (axes, dtypes, shapes). Every process
+serving the dashboard maps the same pages read-only, so extra workers add
+almost nothing for the data.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from weo_data import CACHE_DIR, ID_COLUMNS, TRANSFORM_PREFIXES, cache_key
+
+
+class WeoCube:
+    """Observations as values[country, year, indicator] with axis lookup tables."""
+
+    def __init__(self, countries, country_ids, years, indicators, values, present):
+        self.countries = countries
+        self.country_ids = country_ids
+        self.years = years
+        self.indicators = indicators
+        self.values = values
+        # present[c, y] is True where df_wide had a row for that country and year
+        self.present = present
+
+        self.country_pos = {c: i for i, c in enumerate(countries)}
+        self.id_pos = {c: i for i, c in enumerate(country_ids)}
+        self.year_pos = {int(y): i for i, y in enumerate(years)}
+        self.indicator_pos = {v: i for i, v in enumerate(indicators)}
+        self.country_dtype = pd.CategoricalDtype(countries)
+        self._diff = None
+        self._transforms = {}
+
+    @classmethod
+    def from_wide(cls, df_wide, columns=None, dtype=None):
+        """Build the cube from df_wide; columns defaults to every numeric indicator column.
+
+        Precomputed DIFF_/GROWTH_/LOGDIFF_ columns are left out; the cube
+        differences along its own year axis.
+        """
+        if columns is None:
+            columns = [
+                col for col in df_wide.columns
+                if col not in ID_COLUMNS and pd.api.types.is_float_dtype(df_wide[col])
+                and not col.startswith(tuple(TRANSFORM_PREFIXES.values()))
+            ]
+        values_2d = df_wide[columns].to_numpy(dtype=dtype)
+
+        country_codes, countries = pd.factorize(df_wide["REF_AREA_NAME"].astype(str), sort=True)
+        year_codes, years = pd.factorize(df_wide["TIME_PERIOD"].astype(int), sort=True)
+
+        values = np.full((len(countries), len(years), len(columns)), np.nan, dtype=values_2d.dtype)
+        values[country_codes, year_codes] = values_2d
+        present = np.zeros((len(countries), len(years)), dtype=bool)
+        present[country_codes, year_codes] = True
+
+        # One REF_AREA_ID per country name
+        country_ids = np.empty(len(countries), dtype=object)
+        country_ids[country_codes] = df_wide["REF_AREA_ID"].astype(str).to_numpy()
+
+        return cls(np.asarray(countries, dtype=object), country_ids, np.asarray(years),
+                   list(columns), values, present)
+
+    def _along_rows(self, kind):
+        """kind of TRANSFORM_PREFIXES between consecutive rows of each country, as add_transforms.
+
+        Like the groupby over df_wide, a year without a row is skipped: the
+        next year is compared with the last one before the gap. Each
+        country's first row and the years without a row are NaN.
+        """
+        c_idx, y_idx = np.nonzero(self.present)
+        rows = self.values[c_idx, y_idx]
+        out = np.full_like(rows, np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if kind == "diff":
+                np.subtract(rows[1:], rows[:-1], out=out[1:])
+            elif kind == "growth":
+                out[1:] = (rows[1:] / rows[:-1] - 1) * 100
+            elif kind == "logdiff":
+                logs = np.log(np.where(rows > 0, rows, np.nan))
+                np.subtract(logs[1:], logs[:-1], out=out[1:])
+            else:
+                raise ValueError(f"Unknown transform {kind!r}")
+        out[np.r_[True, c_idx[1:] != c_idx[:-1]]] = np.nan
+
+        result = np.full_like(self.values, np.nan)
+        result[c_idx, y_idx] = out
+        return result
+
+    def diff(self):
+        """Per-country first differences, kept (and saved) with the cube."""
+        if self._diff is None:
+            self._diff = self._along_rows("diff")
+        return self._diff
+
+    def transform(self, kind):
+        """values transformed per country: "diff", "growth" (percent change) or "logdiff"."""
+        if kind == "diff":
+            return self.diff()
+        if kind not in self._transforms:
+            self._transforms[kind] = self._along_rows(kind)
+        return self._transforms[kind]
+
+    def select(self, countries, variables, data_type="level"):
+        """Long-by-country frame of the selection, sorted by country and year.
+
+        Same columns and rows as WideIndex.select: REF_AREA_NAME,
+        TIME_PERIOD and one column per variable, transformed per country
+        for any data_type other than "level".
+        """
+        if data_type == "level":
+            source = self.values
+        elif data_type in TRANSFORM_PREFIXES:
+            source = self.transform(data_type)
+        else:
+            raise ValueError(f"Unknown data_type {data_type!r}")
+        ci = np.array(sorted(self.country_pos[c] for c in set(countries) if c in self.country_pos), dtype=np.intp)
+        ii = np.array([self.indicator_pos[v] for v in variables], dtype=np.intp)
+
+        mask = self.present[ci]
+        c_idx, y_idx = np.nonzero(mask)
+        rows = source[ci[c_idx], y_idx]
+
+        dff = pd.DataFrame(rows[:, ii], columns=list(variables))
+        dff.insert(0, "REF_AREA_NAME", pd.Categorical.from_codes(ci[c_idx], dtype=self.country_dtype))
+        dff.insert(1, "TIME_PERIOD", self.years[y_idx])
+        return dff
+
+    def map_frame(self, variable, year):
+        """REF_AREA_ID, REF_AREA_NAME and variable for one year, missing values dropped."""
+        y = self.year_pos.get(int(year))
+        if y is None:
+            return pd.DataFrame(columns=["REF_AREA_ID", "REF_AREA_NAME", variable])
+        col = self.values[:, y, self.indicator_pos[variable]]
+        keep = ~np.isnan(col)
+        return pd.DataFrame({
+            "REF_AREA_ID": self.country_ids[keep],
+            "REF_AREA_NAME": self.countries[keep],
+            variable: col[keep],
+        })
+
+    def country_series(self, country_id, variable):
+        """TIME_PERIOD, variable and REF_AREA_NAME for one country, missing values dropped."""
+        c = self.id_pos.get(country_id)
+        if c is None:
+            return pd.DataFrame(columns=["REF_AREA_NAME", "TIME_PERIOD", variable])
+        col = self.values[c, :, self.indicator_pos[variable]]
+        keep = ~np.isnan(col)
+        return pd.DataFrame({
+            "REF_AREA_NAME": self.countries[c],
+            "TIME_PERIOD": self.years[keep],
+            variable: col[keep],
+        })
+
+    def year_matrix(self, variable):
+        """variable for every country and year: DataFrame indexed by REF_AREA_ID, one column per year."""
+        return pd.DataFrame(self.values[:, :, self.indicator_pos[variable]],
+                            index=pd.Index(self.country_ids, name="REF_AREA_ID"), columns=self.years)
+
+    # -------------------------------------------------------------
+    # Memory-mapped copy
+    # -------------------------------------------------------------
+    def save(self, manifest_path):
+        """Write the arrays (with first differences) as raw files next to a JSON manifest."""
+        base = os.path.splitext(manifest_path)[0]
+        arrays = {"values": self.values, "present": self.present, "diff": self.diff()}
+        manifest = {
+            "countries": [str(c) for c in self.countries],
+            "country_ids": [str(c) for c in self.country_ids],
+            "years": [int(y) for y in self.years],
+            "indicators": list(self.indicators),
+            "arrays": {},
+        }
+        for name, array in arrays.items():
+            path = f"{base}_{name}.bin"
+            tmp_path = path + f".{os.getpid()}.tmp"
+            np.ascontiguousarray(array).tofile(tmp_path)
+            os.replace(tmp_path, path)
+            manifest["arrays"][name] = {
+                "file": os.path.basename(path), "dtype": array.dtype.str, "shape": list(array.shape),
+            }
+        # The manifest goes last: a reader that finds it finds every array
+        tmp_path = manifest_path + f".{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, manifest_path)
+        return manifest_path
+
+    @classmethod
+    def open(cls, manifest_path):
+        """Cube over read-only memory maps of the files written by save."""
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        directory = os.path.dirname(manifest_path)
+        arrays = {
+            name: np.memmap(os.path.join(directory, spec["file"]), dtype=np.dtype(spec["dtype"]),
+                            mode="r", shape=tuple(spec["shape"]))
+            for name, spec in manifest["arrays"].items()
+        }
+        cube = cls(np.asarray(manifest["countries"], dtype=object),
+                   np.asarray(manifest["country_ids"], dtype=object),
+                   np.asarray(manifest["years"]), manifest["indicators"],
+                   arrays["values"], arrays["present"])
+        cube._diff = arrays["diff"]
+        return cube
+
+
+def shared_cube(df_wide, source_path, columns=None, dtype=None):
+    """WeoCube.from_wide(df_wide) memory-mapped from the cache dir, written on first use.
+
+    source_path is the WEO csv df_wide was loaded from; the cache entry is
+    keyed by it and by df_wide's columns, so calculated columns are included.
+    """
+    columns_hash = hashlib.sha1("|".join(map(str, columns or df_wide.columns)).encode()).hexdigest()[:12]
+    key = cache_key(source_path, table="cube", columns=columns_hash, dtype=dtype, diff="rows")
+    manifest_path = os.path.join(CACHE_DIR, f"{key}_cube.json")
+    if not os.path.exists(manifest_path):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        WeoCube.from_wide(df_wide, columns, dtype).save(manifest_path)
+    return WeoCube.open(manifest_path)
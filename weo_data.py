@@ -0,0 +1,690 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared WEO ingest for the economic dashboards.
+
+Parses the raw WEO export once, cleans it, pivots it to the wide
+(country, year) x indicator layout and keeps both tables in an on-disk
+cache so later starts just reload them.
+"""
+import csv
+import hashlib
+import io
+import json
+import os
+import re
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from data_registry import dataset_path
+
+# From the dataset store when added there (python data_registry.py add weo PATH)
+WEO_PATH = dataset_path("weo", "/Users/katedamato/Downloads/WEO_data-2.csv")
+WEO_SMALL_PATH = dataset_path("weo_small", "/Users/katedamato/Downloads/WEO_data_small.csv")
+WEO_V1_PATH = dataset_path("weo_v1", "/Users/katedamato/Downloads/WEO_data.csv")
+CACHE_DIR = os.environ.get(
+    "WEO_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".weo_cache")
+)
+
+ID_COLUMNS = ["REF_AREA_ID", "REF_AREA_NAME", "TIME_PERIOD"]
+
+# Duplicate observations share these; aggregate=True averages them
+AGGREGATE_KEYS = ID_COLUMNS + ["INDICATOR_NAME", "UNIT_MEASURE_NAME"]
+
+# Column prefixes of the per-country transforms added by add_transforms
+TRANSFORM_PREFIXES = {"diff": "DIFF_", "growth": "GROWTH_", "logdiff": "LOGDIFF_"}
+
+# Rows per chunk when streaming the export through the C parser
+CHUNKSIZE = 200_000
+
+# Quantiles in the indicator stats table, and the TIME_PERIOD of its pooled rows
+STAT_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+ALL_YEARS = -1
+
+_SKIPPED_LINE = re.compile(r"Skipping line (\d+): (.*)")
+
+try:
+    import pyarrow  # noqa: F401
+    CACHE_FORMAT = "parquet"
+except ImportError:
+    CACHE_FORMAT = "pickle"
+
+
+# -------------------------------------------------------------
+# Parse / clean / pivot
+# -------------------------------------------------------------
+def _skipped_lines(caught, bad_lines):
+    """Move the parser's skipped-line warnings into bad_lines; re-emit any others."""
+    for w in caught:
+        if not issubclass(w.category, pd.errors.ParserWarning):
+            warnings.warn_explicit(w.message, w.category, w.filename, w.lineno)
+            continue
+        for line_no, reason in _SKIPPED_LINE.findall(str(w.message)):
+            bad_lines.append((int(line_no), reason))
+
+
+# Text columns stay text even where (a shard, a chunk) they are all empty
+_TEXT_DTYPES = {"STRUCTURE_ID": "str", "COMMENT_OBS": "str"}
+
+
+def _parse_csv(source, engine="c", chunksize=CHUNKSIZE):
+    """Parse a WEO csv, returning (df, [(line, reason), ...]) for skipped lines."""
+    bad_lines = []
+
+    if engine == "python":
+        def on_bad_line(fields):
+            bad_lines.append((None, "malformed: " + ",".join(fields)))
+            return None
+
+        df = pd.read_csv(source, index_col=0, engine='python', on_bad_lines=on_bad_line, dtype=_TEXT_DTYPES)
+        return df, bad_lines
+
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always", pd.errors.ParserWarning)
+        df = pd.read_csv(source, index_col=0, engine=engine, on_bad_lines='warn',
+                         chunksize=chunksize, low_memory=False, dtype=_TEXT_DTYPES)
+        if chunksize:
+            df = pd.concat(df)
+
+    _skipped_lines(caught, bad_lines)
+    return df, bad_lines
+
+
+def _read_chunks(source, bad_lines, chunksize=CHUNKSIZE):
+    """Yield the export chunk by chunk (C engine), adding its skipped lines to bad_lines."""
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always", pd.errors.ParserWarning)
+        reader = pd.read_csv(source, index_col=0, on_bad_lines='warn', chunksize=chunksize,
+                             low_memory=False, dtype=_TEXT_DTYPES)
+    _skipped_lines(caught, bad_lines)
+    with reader:
+        while True:
+            # Only the read is under catch_warnings, not the caller's work on the chunk
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter("always", pd.errors.ParserWarning)
+                chunk = next(reader, None)
+            _skipped_lines(caught, bad_lines)
+            if chunk is None:
+                return
+            yield chunk
+
+
+def _write_quarantine(path, bad_lines, quarantine_path):
+    """Write the skipped lines, with their raw text, to quarantine_path."""
+    # Fetch the raw text of the skipped lines in one pass
+    wanted = {line_no for line_no, _ in bad_lines if line_no is not None}
+    raw = {}
+    if wanted:
+        with open(path, newline="") as f:
+            for line_no, line in enumerate(f, start=1):
+                if line_no in wanted:
+                    raw[line_no] = line.rstrip("\r\n")
+
+    with open(quarantine_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["line", "reason", "text"])
+        writer.writerows((n, reason, raw.get(n)) for n, reason in bad_lines)
+
+
+def read_weo_csv(path, engine="c", chunksize=CHUNKSIZE, quarantine_path=None):
+    """Read the raw WEO export, setting malformed lines aside.
+
+    The C engine streams the file in chunks; lines with too many fields are
+    skipped and written to quarantine_path with their line numbers. The
+    python engine is kept for comparison with the old loader.
+
+    Returns (df, report), where report counts the dropped lines by reason.
+    """
+    df, bad_lines = _parse_csv(path, engine, chunksize)
+    if quarantine_path is not None:
+        _write_quarantine(path, bad_lines, quarantine_path)
+
+    report = {"rows_read": len(df), "malformed": len(bad_lines)}
+    return df, report
+
+
+# -------------------------------------------------------------
+# Multi-process loading
+# -------------------------------------------------------------
+def _shard_bounds(path, n_shards):
+    """Split the file after its header into n_shards byte ranges on line boundaries."""
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        header = f.readline()
+        bounds = [f.tell()]
+        for i in range(1, n_shards):
+            f.seek(max(bounds[0] + (size - bounds[0]) * i // n_shards, bounds[-1]))
+            f.readline()
+            bounds.append(min(f.tell(), size))
+    bounds.append(size)
+    ranges = [(lo, hi) for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+    return header, ranges
+
+
+def _read_shard(args):
+    """Parse and clean one byte range of the export inside a worker."""
+    path, header, start, end = args
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    df, bad_lines = _parse_csv(io.BytesIO(header + data), "c", chunksize=None)
+    report = {"rows_read": len(df), "malformed": len(bad_lines)}
+    df = clean_weo(df, report)
+    return df, bad_lines, data.count(b"\n"), report
+
+
+def read_weo_sharded(path, workers=None, quarantine_path=None):
+    """Parse the WEO export in parallel, one line-aligned shard per worker.
+
+    Numeric coercion and the start/end-month filter run inside the workers,
+    so the result is already cleaned. Assumes no quoted field spans lines,
+    which holds for the WEO export. Returns (df, report) like
+    read_weo_csv + clean_weo.
+
+    On spawn platforms (macOS, Windows) call this from under
+    `if __name__ == "__main__":`, not at import time of a dashboard script.
+    """
+    workers = workers or os.cpu_count() or 1
+    header, ranges = _shard_bounds(path, workers)
+    jobs = [(path, header, lo, hi) for lo, hi in ranges]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_read_shard, jobs))
+
+    # Shard-local line numbers count the copied header as line 1
+    report = {"rows_read": 0, "malformed": 0, "non_numeric": 0, "start_end_months": 0, "rows_kept": 0}
+    bad_lines = []
+    lines_before = 1
+    for _, shard_bad, n_lines, shard_report in results:
+        bad_lines += [(lines_before + n - 1, reason) for n, reason in shard_bad]
+        lines_before += n_lines
+        for k in report:
+            report[k] += shard_report[k]
+
+    if quarantine_path is not None:
+        _write_quarantine(path, bad_lines, quarantine_path)
+
+    # Single copy into the final frame
+    df = pd.concat([r[0] for r in results])
+    return df, report
+
+
+def clean_weo(df, report=None):
+    """Keep numeric observations and drop the fiscal-year header rows."""
+    obs = pd.to_numeric(df["OBS_VALUE"], errors="coerce")
+    df = df[obs.notna()].copy()
+    df["OBS_VALUE"] = obs[obs.notna()]
+    months = df["STRUCTURE_ID"].str.contains("Start/end months", na=False)
+    df = df[~months]
+    df["TIME_PERIOD"] = pd.to_numeric(df["TIME_PERIOD"], errors="coerce")
+
+    if report is not None:
+        report["non_numeric"] = int(obs.isna().sum())
+        report["start_end_months"] = int(months.sum())
+        report["rows_kept"] = len(df)
+    return df
+
+
+def aggregate_weo(df):
+    """Average duplicate observations, keeping the first comment."""
+    return (
+        df.groupby(AGGREGATE_KEYS, as_index=False)
+        .agg({"OBS_VALUE": "mean", "COMMENT_OBS": "first"})
+    )
+
+
+def _fold(parts):
+    """Merge partial (sum, count, first comment) tables, in file order, into one."""
+    return pd.concat(parts).groupby(level=AGGREGATE_KEYS, sort=False).agg(
+        OBS_SUM=("OBS_SUM", "sum"), OBS_COUNT=("OBS_COUNT", "sum"), COMMENT_OBS=("COMMENT_OBS", "first")
+    )
+
+
+def stream_weo(path, chunksize=CHUNKSIZE, quarantine_path=None):
+    """aggregate_weo of the cleaned export, without ever holding the long table.
+
+    Each chunk is cleaned and reduced to a sum, count and first comment per
+    key; these partial tables are merged whenever they outgrow the running
+    total, so memory stays around one chunk plus the aggregated result.
+    Returns (df, report) like read_weo_csv + clean_weo, with df as
+    aggregate_weo gives it.
+    """
+    report = {"rows_read": 0, "malformed": 0, "non_numeric": 0, "start_end_months": 0, "rows_kept": 0}
+    bad_lines = []
+    total, pending = None, []
+    for chunk in _read_chunks(path, bad_lines, chunksize):
+        chunk_report = {"rows_read": len(chunk)}
+        chunk = clean_weo(chunk, chunk_report)
+        for k in chunk_report:
+            report[k] += chunk_report[k]
+        pending.append(chunk.groupby(AGGREGATE_KEYS, sort=False).agg(
+            OBS_SUM=("OBS_VALUE", "sum"), OBS_COUNT=("OBS_VALUE", "count"), COMMENT_OBS=("COMMENT_OBS", "first")
+        ))
+        del chunk  # before the next one is read
+        if sum(map(len, pending)) > max(chunksize, 0 if total is None else len(total)):
+            total, pending = _fold(([] if total is None else [total]) + pending), []
+    if pending:
+        total = _fold(([] if total is None else [total]) + pending)
+
+    report["malformed"] = len(bad_lines)
+    if quarantine_path is not None:
+        _write_quarantine(path, bad_lines, quarantine_path)
+    if total is None:
+        return pd.DataFrame(columns=AGGREGATE_KEYS + ["OBS_VALUE", "COMMENT_OBS"]), report
+
+    df = total.reset_index()
+    df.insert(len(AGGREGATE_KEYS), "OBS_VALUE", df.pop("OBS_SUM") / df.pop("OBS_COUNT"))
+    return df.sort_values(AGGREGATE_KEYS, ignore_index=True), report
+
+
+def pivot_weo(df, aggregate=False, compact=False, float_dtype="float32"):
+    """Pivot the long table to one row per (country, year).
+
+    With aggregate=True duplicate observations are averaged first, the way
+    the GDP dashboards have always done it.
+
+    With compact=True the COMMENT_OBS_* columns are left out (see
+    comments_weo), countries become categoricals, TIME_PERIOD int16 and
+    the OBS_VALUE_* columns float_dtype.
+    """
+    if aggregate:
+        df = aggregate_weo(df)
+
+    if compact:
+        df_wide = df.pivot(index=ID_COLUMNS, columns="INDICATOR_NAME", values="OBS_VALUE")
+        df_wide.columns = [f"OBS_VALUE_{col}" for col in df_wide.columns]
+        df_wide = df_wide.astype(float_dtype).reset_index()
+        df_wide["REF_AREA_ID"] = df_wide["REF_AREA_ID"].astype("category")
+        df_wide["REF_AREA_NAME"] = df_wide["REF_AREA_NAME"].astype("category")
+        df_wide["TIME_PERIOD"] = df_wide["TIME_PERIOD"].astype("int16")
+        return df_wide
+
+    # Pivot values and comments separately so the value columns stay float
+    df_wide = pd.concat(
+        {val: df.pivot(index=ID_COLUMNS, columns="INDICATOR_NAME", values=val)
+         for val in ["OBS_VALUE", "COMMENT_OBS"]},
+        axis=1
+    )
+
+    # Flatten multiindex columns
+    df_wide.columns = [f"{val}_{col}" for val, col in df_wide.columns]
+    return df_wide.reset_index()
+
+
+def comments_weo(df, aggregate=False):
+    """Side table of the non-empty comments, one row per (country, year, indicator).
+
+    Holds what the COMMENT_OBS_* columns of the full pivot hold, without
+    the mostly empty wide layout.
+    """
+    if aggregate:
+        df = aggregate_weo(df)
+    comments = df.loc[df["COMMENT_OBS"].notna(), ["REF_AREA_ID", "TIME_PERIOD", "INDICATOR_NAME", "COMMENT_OBS"]]
+    comments = comments.drop_duplicates(["REF_AREA_ID", "TIME_PERIOD", "INDICATOR_NAME"])
+    comments["TIME_PERIOD"] = comments["TIME_PERIOD"].astype("int16")
+    return comments.set_index(["REF_AREA_ID", "TIME_PERIOD", "INDICATOR_NAME"]).sort_index()
+
+
+def memory_report(frames):
+    """Deep memory use in MB of each {label: DataFrame}, one line per frame."""
+    return "\n".join(
+        f"{label:<32}{df.memory_usage(deep=True).sum() / 1e6:10.1f} MB  {df.shape}"
+        for label, df in frames.items()
+    )
+
+
+def add_twin_deficits(df_wide):
+    """Add the calculated twin-deficit columns used by the dashboards."""
+    df_wide['Net_Exports_Goods_Services'] = (
+        df_wide.get('OBS_VALUE_Volume of exports of goods and services, Percent change', 0) -
+        df_wide.get('OBS_VALUE_Volume of imports of goods and services, Percent change', 0)
+    )
+    df_wide['Capital_Account_Balance'] = (
+        df_wide.get('OBS_VALUE_Current account balance, Percent of GDP', 0) -
+        df_wide['Net_Exports_Goods_Services']
+    )
+    return df_wide
+
+
+def add_transforms(df_wide, columns=None, kinds=("diff",)):
+    """Add per-country first differences (and growth rates / log differences).
+
+    For each value column X this adds DIFF_X, GROWTH_X (percent change) or
+    LOGDIFF_X next to it, computed in one vectorized pass over the table
+    sorted by country and year. Each country's first year is NaN, so
+    nothing is differenced across country boundaries. Matches
+    df.sort_values(...).groupby("REF_AREA_NAME")[X].transform("diff").
+    """
+    if columns is None:
+        columns = [
+            col for col in df_wide.columns
+            if col not in ID_COLUMNS and pd.api.types.is_float_dtype(df_wide[col])
+            and not col.startswith(tuple(TRANSFORM_PREFIXES.values()))
+        ]
+
+    order = np.lexsort((df_wide["TIME_PERIOD"].to_numpy(), df_wide["REF_AREA_NAME"].astype(str).to_numpy()))
+    values = df_wide[columns].to_numpy()[order]
+    names = df_wide["REF_AREA_NAME"].astype(str).to_numpy()[order]
+    # First row of each country in sorted order has no previous year
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = names[1:] != names[:-1]
+
+    current, previous = values[1:], values[:-1]
+    new_columns = {}
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for kind in kinds:
+            out = np.empty_like(values)
+            if kind == "diff":
+                np.subtract(current, previous, out=out[1:])
+            elif kind == "growth":
+                out[1:] = (current / previous - 1) * 100
+            elif kind == "logdiff":
+                logs = np.log(np.where(values > 0, values, np.nan))
+                np.subtract(logs[1:], logs[:-1], out=out[1:])
+            else:
+                raise ValueError(f"Unknown transform {kind!r}")
+            out[first] = np.nan
+
+            # Back to the row order of df_wide
+            unsorted = np.empty_like(out)
+            unsorted[order] = out
+            prefix = TRANSFORM_PREFIXES[kind]
+            for j, col in enumerate(columns):
+                new_columns[prefix + col] = unsorted[:, j]
+
+    return pd.concat([df_wide, pd.DataFrame(new_columns, index=df_wide.index)], axis=1)
+
+
+# -------------------------------------------------------------
+# Indicator statistics
+# -------------------------------------------------------------
+def indicator_stats(df_wide, columns=None):
+    """Quantiles, min/max, mean/std and count of each indicator, per year and pooled.
+
+    Indexed by (INDICATOR, TIME_PERIOD); the TIME_PERIOD == ALL_YEARS rows
+    pool every year. Computed in one pass over a year x country x indicator
+    array. columns defaults to every numeric indicator column.
+    """
+    if columns is None:
+        columns = [
+            col for col in df_wide.columns
+            if col not in ID_COLUMNS and pd.api.types.is_float_dtype(df_wide[col])
+            and not col.startswith(tuple(TRANSFORM_PREFIXES.values()))
+        ]
+    year_codes, years = pd.factorize(df_wide["TIME_PERIOD"].astype(int), sort=True)
+    country_codes, countries = pd.factorize(df_wide["REF_AREA_ID"].astype(str))
+    values = np.full((len(years), len(countries), len(columns)), np.nan)
+    values[year_codes, country_codes] = df_wide[columns].to_numpy(dtype=float)
+
+    # Per year over the country axis, then pooled over every country and year
+    pooled = values.reshape(1, -1, len(columns))
+    parts = []
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # indicators without values in a year
+        for block in (values, pooled):
+            stats = {f"q{round(q * 100):02d}": v for q, v in zip(STAT_QUANTILES, np.nanquantile(block, STAT_QUANTILES, axis=1))}
+            stats.update({
+                "min": np.nanmin(block, axis=1), "max": np.nanmax(block, axis=1),
+                "mean": np.nanmean(block, axis=1), "std": np.nanstd(block, axis=1, ddof=1),
+                "count": (~np.isnan(block)).sum(axis=1),
+            })
+            parts.append(stats)
+
+    index = pd.MultiIndex.from_product([columns, np.r_[years, ALL_YEARS]], names=["INDICATOR", "TIME_PERIOD"])
+    # (year, indicator) arrays -> indicator-major rows
+    return pd.DataFrame(
+        {name: np.concatenate([parts[0][name], parts[1][name]]).T.ravel() for name in parts[0]},
+        index=index
+    )
+
+
+# -------------------------------------------------------------
+# Cache
+# -------------------------------------------------------------
+def file_hash(path, chunk_size=1 << 20):
+    """sha1 of the file contents, reusing the last result while size/mtime are unchanged."""
+    st = os.stat(path)
+    stamp = {"path": os.path.abspath(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    index_path = os.path.join(CACHE_DIR, "hashes.json")
+
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+
+    entry = index.get(stamp["path"])
+    if entry and entry["size"] == stamp["size"] and entry["mtime_ns"] == stamp["mtime_ns"]:
+        return entry["sha1"]
+
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+
+    stamp["sha1"] = h.hexdigest()
+    index[stamp["path"]] = stamp
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = index_path + f".{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path)
+    return stamp["sha1"]
+
+
+def cache_key(path, **options):
+    """Cache key from the source hash, its mtime and the ingest options.
+
+    The key is recorded against path in keys.json, so prune_cache can find
+    the entries of earlier versions of the file.
+    """
+    mtime_ns = os.stat(path).st_mtime_ns
+    parts = [file_hash(path), str(mtime_ns)]
+    parts += [f"{k}={options[k]}" for k in sorted(options)]
+    key = hashlib.sha1("|".join(parts).encode()).hexdigest()[:20]
+
+    keys = _read_keys()
+    if key not in keys.setdefault(os.path.abspath(path), {}):
+        keys[os.path.abspath(path)][key] = mtime_ns
+        _write_keys(keys)
+    return key
+
+
+def _read_keys():
+    try:
+        with open(os.path.join(CACHE_DIR, "keys.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_keys(keys):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    index_path = os.path.join(CACHE_DIR, "keys.json")
+    tmp_path = index_path + f".{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(keys, f)
+    os.replace(tmp_path, index_path)
+
+
+def prune_cache(path, keep=()):
+    """Delete the cache entries (tables, cubes, reports) of earlier versions of path.
+
+    Entries keyed by the file's current mtime, or by one of the mtimes in
+    keep, stay. Memory maps and frames already loaded from a deleted entry
+    remain valid. Returns the number of files removed.
+    """
+    keep = {os.stat(path).st_mtime_ns, *keep}
+    keys = _read_keys()
+    recorded = keys.get(os.path.abspath(path), {})
+    stale = {key for key, mtime_ns in recorded.items() if mtime_ns not in keep}
+    if not stale:
+        return 0
+    removed = 0
+    for name in os.listdir(CACHE_DIR):
+        if name.split("_", 1)[0] in stale:
+            try:
+                os.remove(os.path.join(CACHE_DIR, name))
+                removed += 1
+            except FileNotFoundError:
+                pass  # pruned by another worker
+    keys[os.path.abspath(path)] = {key: m for key, m in recorded.items() if key not in stale}
+    _write_keys(keys)
+    return removed
+
+
+def _cache_path(key, name):
+    ext = "parquet" if CACHE_FORMAT == "parquet" else "pkl"
+    return os.path.join(CACHE_DIR, f"{key}_{name}.{ext}")
+
+
+def _write_frame(df, path):
+    tmp_path = path + f".{os.getpid()}.tmp"
+    if CACHE_FORMAT == "parquet":
+        df.to_parquet(tmp_path)
+    else:
+        df.to_pickle(tmp_path)
+    # Rename into place so a concurrent worker never sees a half-written file
+    os.replace(tmp_path, path)
+
+
+def _read_frame(path):
+    if CACHE_FORMAT == "parquet":
+        return pd.read_parquet(path)
+    return pd.read_pickle(path)
+
+
+def load_weo(path=WEO_PATH, aggregate=False, use_cache=True, engine="c",
+             quarantine_path=None, return_report=False, workers=None,
+             compact=False, float_dtype="float32", stream=False):
+    """Return (df, df_wide) for a WEO export, from the cache when possible.
+
+    With return_report=True a third item is returned: the counts of rows
+    dropped while parsing and cleaning, and where the malformed lines went.
+    workers > 1 parses the file in that many processes (C engine only).
+    compact=True gives the compact df_wide layout of pivot_weo; its
+    comments are then available from load_comments.
+    stream=True (with aggregate=True) aggregates the file chunk by chunk
+    with stream_weo and never builds the long table: df is None.
+    """
+    if stream and not aggregate:
+        raise ValueError("stream=True averages duplicate observations; pass aggregate=True")
+    if use_cache:
+        key = cache_key(path, aggregate=aggregate, engine=engine, format=CACHE_FORMAT,
+                        compact=compact, float_dtype=float_dtype if compact else None,
+                        stream=stream or None)
+        long_path, wide_path = _cache_path(key, "long"), _cache_path(key, "wide")
+        report_path = os.path.join(CACHE_DIR, f"{key}_report.json")
+        if quarantine_path is None:
+            quarantine_path = os.path.join(CACHE_DIR, f"{key}_quarantine.csv")
+        needed = (wide_path, report_path) if stream else (long_path, wide_path, report_path)
+        if all(os.path.exists(p) for p in needed):
+            df, df_wide = None if stream else _read_frame(long_path), _read_frame(wide_path)
+            if not return_report:
+                return df, df_wide
+            with open(report_path) as f:
+                return df, df_wide, json.load(f)
+        os.makedirs(CACHE_DIR, exist_ok=True)
+
+    if stream:
+        df_mean, report = stream_weo(path, quarantine_path=quarantine_path)
+        df_wide = pivot_weo(df_mean, compact=compact, float_dtype=float_dtype)
+        comments = comments_weo(df_mean) if compact and use_cache else None
+        df = df_mean = None
+    else:
+        if workers and workers > 1 and engine == "c":
+            df, report = read_weo_sharded(path, workers, quarantine_path=quarantine_path)
+        else:
+            df, report = read_weo_csv(path, engine=engine, quarantine_path=quarantine_path)
+            df = clean_weo(df, report)
+        df_wide = pivot_weo(df, aggregate=aggregate, compact=compact, float_dtype=float_dtype)
+        comments = comments_weo(df, aggregate) if compact and use_cache else None
+    report["quarantine_path"] = quarantine_path
+
+    if use_cache:
+        if df is not None:
+            _write_frame(df, long_path)
+        _write_frame(df_wide, wide_path)
+        if comments is not None:
+            _write_frame(comments, _comments_path(path, aggregate))
+        _write_frame(indicator_stats(df_wide), _stats_path(path, aggregate, compact, float_dtype))
+        with open(report_path, "w") as f:
+            json.dump(report, f)
+
+    if return_report:
+        return df, df_wide, report
+    return df, df_wide
+
+
+_comments = {}
+
+
+def _comments_path(path, aggregate):
+    return _cache_path(cache_key(path, aggregate=aggregate, table="comments"), "comments")
+
+
+def load_comments(path=WEO_PATH, aggregate=False):
+    """Comment side table for a WEO export, read on first use and kept in memory until the file changes."""
+    key = (os.path.abspath(path), aggregate)
+    mtime = os.stat(path).st_mtime_ns
+    if key not in _comments or _comments[key][0] != mtime:
+        comments_path = _comments_path(path, aggregate)
+        if os.path.exists(comments_path):
+            comments = _read_frame(comments_path)
+        else:
+            df = load_weo(path, use_cache=False)[0]
+            comments = comments_weo(df, aggregate)
+        _comments[key] = (mtime, comments)
+    return _comments[key][1]
+
+
+def _stats_path(path, aggregate, compact, float_dtype):
+    # Compact tables hold float_dtype values, so their stats are kept apart
+    key = cache_key(path, aggregate=aggregate, compact=compact,
+                    float_dtype=float_dtype if compact else None, table="stats")
+    return _cache_path(key, "stats")
+
+
+def load_stats(path=WEO_PATH, aggregate=False, compact=False, float_dtype="float32"):
+    """Indicator stats table (see indicator_stats) built at ingest, from the cache.
+
+    Pass the aggregate/compact/float_dtype options the table was loaded with.
+    """
+    stats_path = _stats_path(path, aggregate, compact, float_dtype)
+    if os.path.exists(stats_path):
+        return _read_frame(stats_path)
+    stats = indicator_stats(load_weo(path, aggregate=aggregate, compact=compact, float_dtype=float_dtype)[1])
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    _write_frame(stats, stats_path)
+    return stats
+
+
+def lookup_comment(comments, country_id, year, indicator):
+    """Comment for one observation, or None. indicator may carry the OBS_VALUE_ prefix."""
+    indicator = indicator.replace("OBS_VALUE_", "", 1)
+    try:
+        return comments.at[(country_id, int(year), indicator), "COMMENT_OBS"]
+    except KeyError:
+        return None
+
+
+def format_report(report):
+    """One-line summary of a load_weo report."""
+    return (
+        f"{report['rows_kept']} of {report['rows_read']} rows kept; dropped "
+        f"{report['malformed']} malformed lines, {report['non_numeric']} non-numeric "
+        f"values, {report['start_end_months']} start/end month rows"
+    )
+
+
+def clear_cache():
+    """Delete every cached WEO table."""
+    if not os.path.isdir(CACHE_DIR):
+        return
+    for name in os.listdir(CACHE_DIR):
+        os.remove(os.path.join(CACHE_DIR, name))
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared Plotly trace helpers for the WEO dashboards.
+
+add_trendlines replaces px.scatter(..., trendline="ols"): the lines for
+every country come from one grouped fit (weo_stats) and are added as
+ready-made line traces, so statsmodels is never imported.
+
+resolve_render_mode / decimate_traces implement the builders' render_mode
+switch: large figures are drawn with Scattergl, without markers, and with
+points that land on the same screen cell of a trace dropped.
+
+figure_patch turns the figure already on the page into the new one with a
+Dash Patch, so a callback only sends the traces and attributes that changed.
+"""
+import json
+
+import numpy as np
+import plotly.graph_objects as go
+from dash import Patch
+from plotly.utils import PlotlyJSONEncoder
+
+from weo_stats import grouped_ols, grouped_robust
+
+TRENDLINES = ("ols", "huber", "lowess")
+RENDER_MODES = ("auto", "svg", "webgl")
+
+WEBGL_THRESHOLD = 2000  # points; "auto" switches to Scattergl above this
+MARKER_THRESHOLD = 5000  # points; line figures drop their markers above this
+DECIMATE_GRID = (800, 400)  # cells per subplot, about its size in pixels
+
+
+def _line_trace(name, xs, ys, color, hover):
+    return go.Scatter(
+        x=xs, y=ys, mode="lines", name=name, legendgroup=name, showlegend=False,
+        line=dict(color=color), hovertemplate=hover + "<extra></extra>",
+    )
+
+
+def add_trendlines(fig, groups, x, y, method="ols", colors=None, executor=None):
+    """Add one fitted line per group to fig, like px trendline traces.
+
+    groups may be None for a single line over all points (group ""). colors
+    maps a group to its marker colour. For method "ols" the fit table from
+    weo_stats.grouped_ols is returned (slope, intercept, standard errors,
+    r2); "huber" and "lowess" are fitted in a process pool and return None.
+    """
+    if method not in TRENDLINES:
+        raise ValueError(f"unknown trendline {method!r}, expected one of {TRENDLINES}")
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    if groups is None:
+        groups = np.full(len(x), "", dtype=object)
+    colors = colors or {}
+    traces = []
+
+    if method == "ols":
+        fits = grouped_ols(groups, x, y)
+        for group, fit in fits.iterrows():
+            if fit["n"] < 2 or not np.isfinite(fit["slope"]):
+                continue
+            xs = np.array([fit["x_min"], fit["x_max"]])
+            hover = (
+                f"<b>OLS trendline</b><br>y = {fit['slope']:.4g} * x + {fit['intercept']:.4g}"
+                f"<br>slope SE = {fit['slope_se']:.3g}<br>R<sup>2</sup>={fit['r2']:.6f}"
+            )
+            traces.append(_line_trace(str(group), xs, fit["intercept"] + fit["slope"] * xs,
+                                      colors.get(group), hover))
+        fig.add_traces(traces)
+        return fits
+
+    label = "Huber trendline" if method == "huber" else "LOWESS trendline"
+    for group, (xs, ys) in grouped_robust(groups, x, y, method, executor).items():
+        traces.append(_line_trace(str(group), xs, ys, colors.get(group), f"<b>{label}</b>"))
+    fig.add_traces(traces)
+    return None
+
+
+
+# -------------------------------------------------------------
+# Render mode
+# -------------------------------------------------------------
+def resolve_render_mode(render_mode, n_points):
+    """"svg" or "webgl" for a figure of n_points; "auto" picks by WEBGL_THRESHOLD."""
+    if render_mode not in RENDER_MODES:
+        raise ValueError(f"unknown render_mode {render_mode!r}, expected one of {RENDER_MODES}")
+    if render_mode == "auto":
+        return "webgl" if n_points > WEBGL_THRESHOLD else "svg"
+    return render_mode
+
+
+def show_markers(n_points):
+    return n_points <= MARKER_THRESHOLD
+
+
+def decimate_traces(fig, grid=DECIMATE_GRID):
+    """Drop the points of each trace that fall on a screen cell it already covers.
+
+    Cells are a grid over the data range of each subplot (traces sharing
+    the same x and y axes), so what is drawn looks the same at that
+    resolution. Point order is kept. Returns the number of points dropped.
+    """
+    # Data range of every subplot
+    ranges = {}
+    for trace in fig.data:
+        if trace.x is None or trace.y is None or len(trace.x) == 0:
+            continue
+        x, y = np.asarray(trace.x, dtype=float), np.asarray(trace.y, dtype=float)
+        axes = (trace.xaxis, trace.yaxis)
+        lo, hi = ranges.get(axes, ([np.inf, np.inf], [-np.inf, -np.inf]))
+        ranges[axes] = (
+            [min(lo[0], np.nanmin(x)), min(lo[1], np.nanmin(y))],
+            [max(hi[0], np.nanmax(x)), max(hi[1], np.nanmax(y))],
+        )
+
+    dropped = 0
+    for trace in fig.data:
+        if trace.x is None or trace.y is None or len(trace.x) < 3:
+            continue
+        x, y = np.asarray(trace.x, dtype=float), np.asarray(trace.y, dtype=float)
+        lo, hi = ranges[(trace.xaxis, trace.yaxis)]
+        span = np.maximum(np.subtract(hi, lo), 1e-12)
+        with np.errstate(invalid="ignore"):
+            ix = np.nan_to_num((x - lo[0]) / span[0] * (grid[0] - 1), nan=-1).round().astype(np.int64)
+            iy = np.nan_to_num((y - lo[1]) / span[1] * (grid[1] - 1), nan=-1).round().astype(np.int64)
+        cell = ix * (grid[1] + 1) + iy
+        if "lines" in (trace.mode or ""):
+            # Lines keep the first point of each run in one cell, and the last point
+            keep = np.r_[True, cell[1:] != cell[:-1]]
+            keep[-1] = True
+        else:
+            keep = np.zeros(len(cell), dtype=bool)
+            keep[np.unique(cell, return_index=True)[1]] = True
+        if keep.all():
+            continue
+        dropped += int((~keep).sum())
+        update = {"x": np.asarray(trace.x)[keep], "y": np.asarray(trace.y)[keep]}
+        for attr in ("customdata", "hovertext", "text"):
+            value = getattr(trace, attr)
+            if value is not None and not isinstance(value, str) and len(value) == len(keep):
+                update[attr] = np.asarray(value)[keep]
+        trace.update(update)
+    return dropped
+
+
+# -------------------------------------------------------------
+# Partial updates
+# -------------------------------------------------------------
+def _encode(value):
+    return json.dumps(value, cls=PlotlyJSONEncoder, sort_keys=True)
+
+
+def _trace_key(trace):
+    # px names a trace after its colour group and places it with its facet axes
+    return trace.get("name"), trace.get("xaxis"), trace.get("yaxis")
+
+
+def _patch_attrs(patch, old, new):
+    """Assign the keys of dict new that differ from old, delete the ones it lacks."""
+    for attr in old.keys() - new.keys():
+        del patch[attr]
+    for attr, value in new.items():
+        if attr not in old or _encode(value) != _encode(old[attr]):
+            patch[attr] = value
+
+
+def figure_patch(old, new):
+    """Dash Patch turning figure dict old into new, or None to send new whole.
+
+    Traces are matched by name and axes. Traces only in old are deleted,
+    traces only in new are inserted at their place, and matched traces and
+    the layout get just the attributes that changed (e.g. only "y" when the
+    data type is switched). None if the traces were reordered.
+    """
+    old_keys = [_trace_key(t) for t in old["data"]]
+    new_keys = [_trace_key(t) for t in new["data"]]
+    if len(set(old_keys)) < len(old_keys) or len(set(new_keys)) < len(new_keys):
+        return None
+    old_pos = {k: i for i, k in enumerate(old_keys)}
+    new_set = set(new_keys)
+    if [k for k in old_keys if k in new_set] != [k for k in new_keys if k in old_pos]:
+        return None
+
+    # Operations run in order in the browser: deletes, inserts, then updates by final position
+    patch = Patch()
+    for i in reversed(range(len(old_keys))):
+        if old_keys[i] not in new_set:
+            del patch["data"][i]
+    for j, key in enumerate(new_keys):
+        if key not in old_pos:
+            patch["data"].insert(j, new["data"][j])
+    for j, key in enumerate(new_keys):
+        if key in old_pos:
+            _patch_attrs(patch["data"][j], old["data"][old_pos[key]], new["data"][j])
+    _patch_attrs(patch["layout"], old.get("layout", {}), new.get("layout", {}))
+    return patch
+
+
+def patch_size(patch):
+    """Bytes of a Patch on the wire."""
+    return len(_encode(patch.to_plotly_json()))
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Country polygons for the choropleth map, simplified once per zoom level.
+
+The GeoJSON is read once, split into arcs between the points where
+neighbouring countries' borders meet, and each arc is simplified once
+(Douglas-Peucker) and shared by both countries, so borders never open gaps
+or overlaps. Each level is serialized once, cached on disk next to the WEO
+tables, and served to the browser as a static layer; map figures only
+reference it by URL and carry the country ids and values.
+"""
+import hashlib
+import json
+import math
+import os
+
+import numpy as np
+
+from weo_data import CACHE_DIR, cache_key
+
+GEO_PATH = os.environ.get("WEO_GEO_PATH", "/Users/katedamato/Downloads/ne_50m_admin_0_countries.geojson")
+
+# Simplification tolerance in degrees per zoom level, coarsest first
+LEVELS = {"low": 0.25, "medium": 0.05, "high": 0.01}
+
+# Properties tried, in order, for a feature's ISO-3 code when it has no id
+ID_PROPERTIES = ("ISO_A3", "ADM0_A3", "iso_a3", "REF_AREA_ID")
+
+
+def level_for_scale(scale):
+    """Zoom level for a geo projection scale (1 = whole world)."""
+    if scale is None or scale < 2:
+        return "low"
+    return "medium" if scale < 6 else "high"
+
+
+# -------------------------------------------------------------
+# Simplification
+# -------------------------------------------------------------
+def douglas_peucker(points, tolerance):
+    """Mask of the points of a polyline kept by Douglas-Peucker; both ends are kept."""
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j <= i + 1:
+            continue
+        a, seg = points[i], points[i + 1:j]
+        d = points[j] - a
+        norm = math.hypot(d[0], d[1])
+        if norm > 0:
+            dist = np.abs(d[0] * (seg[:, 1] - a[1]) - d[1] * (seg[:, 0] - a[0])) / norm
+        else:
+            dist = np.hypot(seg[:, 0] - a[0], seg[:, 1] - a[1])
+        k = int(np.argmax(dist))
+        if dist[k] > tolerance:
+            keep[i + 1 + k] = True
+            stack += [(i, i + 1 + k), (i + 1 + k, j)]
+    return keep
+
+
+def _polygons(geometry):
+    """List of polygons (each a list of rings) of a Polygon or MultiPolygon."""
+    if geometry is None:
+        return []
+    if geometry["type"] == "Polygon":
+        return [geometry["coordinates"]]
+    if geometry["type"] == "MultiPolygon":
+        return geometry["coordinates"]
+    return []
+
+
+def _ring_area(ring):
+    x, y = ring[:, 0], ring[:, 1]
+    return 0.5 * abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+
+
+class _Topology:
+    """Rings as vertex ids into one table of unique points, with junctions marked."""
+
+    def __init__(self, features):
+        self.features = []  # (id, [[ring vertex ids, ...] per polygon])
+        rings, coords = [], []
+        for feature_id, geometry in features:
+            polygons = []
+            for polygon in _polygons(geometry):
+                ring_ids = []
+                for ring in polygon:
+                    ring = np.asarray(ring, dtype=float)[:, :2]
+                    if len(ring) > 1 and np.array_equal(ring[0], ring[-1]):
+                        ring = ring[:-1]  # drop the closing point
+                    if len(ring) < 3:
+                        continue
+                    ring_ids.append(len(rings))
+                    rings.append(len(ring))
+                    coords.append(ring)
+                if ring_ids:
+                    polygons.append(ring_ids)
+            self.features.append((feature_id, polygons))
+
+        all_coords = np.concatenate(coords) if coords else np.empty((0, 2))
+        self.points, vertex_ids = np.unique(all_coords, axis=0, return_inverse=True)
+        vertex_ids = vertex_ids.ravel()
+        offsets = np.r_[0, np.cumsum(rings)]
+        self.rings = [vertex_ids[lo:hi] for lo, hi in zip(offsets[:-1], offsets[1:])]
+
+        # A junction is a point whose neighbours differ between the rings it is on:
+        # where a shared border starts or ends
+        prev = np.concatenate([np.roll(r, 1) for r in self.rings]) if self.rings else vertex_ids
+        nxt = np.concatenate([np.roll(r, -1) for r in self.rings]) if self.rings else vertex_ids
+        pairs = np.unique(np.column_stack([vertex_ids, np.minimum(prev, nxt), np.maximum(prev, nxt)]), axis=0)
+        self.junction = np.bincount(pairs[:, 0], minlength=len(self.points)) > 1
+
+    def simplify_ring(self, ring, tolerance, arcs):
+        """Simplified vertex ids of one ring; arcs caches results shared with neighbours."""
+        fixed = np.flatnonzero(self.junction[ring])
+        if len(fixed) == 0:
+            # Island: split at its first point and the point farthest from it
+            far = int(np.argmax(np.hypot(*(self.points[ring] - self.points[ring[0]]).T)))
+            fixed = np.array([0, far]) if far else np.array([0])
+        ring = np.roll(ring, -fixed[0])
+        fixed = np.r_[fixed - fixed[0], len(ring)]
+        ring = np.r_[ring, ring[:1]]
+
+        out = []
+        for lo, hi in zip(fixed[:-1], fixed[1:]):
+            arc = ring[lo:hi + 1]
+            # Simplify each border once, in a fixed direction, so both sides get the same points
+            forward = (arc[0], arc[-1]) <= (arc[-1], arc[0])
+            key = tuple(arc if forward else arc[::-1])
+            if key not in arcs:
+                canonical = np.asarray(key)
+                arcs[key] = canonical[douglas_peucker(self.points[canonical], tolerance)]
+            kept = arcs[key] if forward else arcs[key][::-1]
+            out.append(kept[:-1])
+        return np.concatenate(out)
+
+    def simplify(self, tolerance):
+        """GeoJSON FeatureCollection of every feature simplified at tolerance."""
+        decimals = max(0, math.ceil(-math.log10(tolerance)) + 1)
+        arcs = {}
+        features = []
+        for feature_id, polygons in self.features:
+            simplified = []
+            for ring_ids in polygons:
+                rings = []
+                for n, r in enumerate(ring_ids):
+                    ring = self.simplify_ring(self.rings[r], tolerance, arcs)
+                    if len(np.unique(ring)) < 3:
+                        if n == 0:
+                            break  # exterior collapsed: drop the polygon
+                        continue
+                    xy = np.round(self.points[np.r_[ring, ring[:1]]], decimals)
+                    rings.append(xy.tolist())
+                if rings:
+                    simplified.append(rings)
+            if not simplified and polygons:
+                # Keep the largest polygon's exterior unsimplified rather than lose the country
+                largest = max((p[0] for p in polygons), key=lambda r: _ring_area(self.points[self.rings[r]]))
+                ring = self.rings[largest]
+                simplified.append([np.round(self.points[np.r_[ring, ring[:1]]], decimals).tolist()])
+            if simplified:
+                features.append({
+                    "type": "Feature", "id": feature_id, "properties": {},
+                    "geometry": {"type": "MultiPolygon", "coordinates": simplified},
+                })
+        return {"type": "FeatureCollection", "features": features}
+
+
+# -------------------------------------------------------------
+# Layers
+# -------------------------------------------------------------
+def _feature_id(feature):
+    if feature.get("id") not in (None, "", "-99"):
+        return str(feature["id"])
+    properties = feature.get("properties") or {}
+    for name in ID_PROPERTIES:
+        if properties.get(name) not in (None, "", "-99"):
+            return str(properties[name])
+    return None
+
+
+class WorldGeometry:
+    """Country polygons simplified per zoom level, serialized once each.
+
+    layer(level) returns the level's GeoJSON as bytes, with feature ids set
+    to the ISO-3 codes used as REF_AREA_ID.
+    """
+
+    def __init__(self, path=GEO_PATH, use_cache=True):
+        self.path = path
+        self.use_cache = use_cache
+        self._topology = None
+        self._layers = {}
+        self.etags = {}
+
+    def _load_topology(self):
+        with open(self.path) as f:
+            collection = json.load(f)
+        features = [(_feature_id(f), f.get("geometry")) for f in collection["features"]]
+        return _Topology([(i, g) for i, g in features if i is not None])
+
+    def layer(self, level):
+        """Serialized GeoJSON of one level, from memory, the disk cache, or simplified now."""
+        if level not in self._layers:
+            cache_path = None
+            if self.use_cache:
+                key = cache_key(self.path, tolerance=LEVELS[level], table="geometry")
+                cache_path = os.path.join(CACHE_DIR, f"{key}_geometry_{level}.json")
+            if cache_path and os.path.exists(cache_path):
+                with open(cache_path, "rb") as f:
+                    data = f.read()
+            else:
+                if self._topology is None:
+                    self._topology = self._load_topology()
+                data = json.dumps(self._topology.simplify(LEVELS[level]), separators=(",", ":")).encode()
+                if cache_path:
+                    os.makedirs(CACHE_DIR, exist_ok=True)
+                    tmp_path = cache_path + f".{os.getpid()}.tmp"
+                    with open(tmp_path, "wb") as f:
+                        f.write(data)
+                    os.replace(tmp_path, cache_path)
+            self._layers[level] = data
+            self.etags[level] = hashlib.sha1(data).hexdigest()[:16]
+        return self._layers[level]
+
+    def ids(self):
+        """Feature ids in the coarsest layer."""
+        return [f["id"] for f in json.loads(self.layer("low"))["features"]]
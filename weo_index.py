@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Row lookups for df_wide.
+
+Built once at load so callbacks can take the rows for a country, a year or
+an ISO code directly instead of scanning the whole table with a mask.
+"""
+import numpy as np
+
+from weo_data import TRANSFORM_PREFIXES
+
+
+def _row_offsets(column):
+    """{value: sorted row positions} for one column."""
+    groups = column.groupby(column, observed=True, sort=False).indices
+    return {k: np.asarray(v, dtype=np.intp) for k, v in groups.items()}
+
+
+class WideIndex:
+    """Positional index of df_wide by country name, year and country id."""
+
+    def __init__(self, df_wide):
+        self.df_wide = df_wide
+        self.by_country = _row_offsets(df_wide["REF_AREA_NAME"])
+        self.by_id = _row_offsets(df_wide["REF_AREA_ID"])
+        self.by_year = {int(y): rows for y, rows in _row_offsets(df_wide["TIME_PERIOD"]).items()}
+
+    def _take(self, positions):
+        return self.df_wide.take(positions)
+
+    def countries(self, names):
+        """Rows for the named countries, in table order (like isin)."""
+        parts = [self.by_country[n] for n in dict.fromkeys(names) if n in self.by_country]
+        if not parts:
+            return self._take(np.empty(0, dtype=np.intp))
+        return self._take(np.sort(np.concatenate(parts)))
+
+    def year(self, year):
+        """Rows for one year."""
+        return self._take(self.by_year.get(int(year), np.empty(0, dtype=np.intp)))
+
+    def country_id(self, country_id):
+        """Rows for one REF_AREA_ID."""
+        return self._take(self.by_id.get(country_id, np.empty(0, dtype=np.intp)))
+
+    # Same selections as WeoCube, so the plot functions can use either
+    def select(self, countries, variables, data_type="level"):
+        """Rows for the countries sorted by country and year, transformed per country if asked.
+
+        data_type "diff", "growth" or "logdiff" switches to the columns
+        precomputed by weo_data.add_transforms; without them "diff" falls
+        back to a groupby.
+        """
+        if data_type != "level" and data_type not in TRANSFORM_PREFIXES:
+            raise ValueError(f"Unknown data_type {data_type!r}")
+        dff = self.countries(countries).sort_values(["REF_AREA_NAME", "TIME_PERIOD"])
+        if data_type in TRANSFORM_PREFIXES:
+            transformed = [TRANSFORM_PREFIXES[data_type] + v for v in variables]
+            if all(col in dff.columns for col in transformed):
+                dff[variables] = dff[transformed].to_numpy()
+            elif data_type == "diff":
+                dff[variables] = dff.groupby("REF_AREA_NAME", observed=True)[variables].transform('diff')
+            else:
+                raise KeyError(f"{data_type} columns missing; call weo_data.add_transforms at load")
+        return dff
+
+    def map_frame(self, variable, year):
+        """Rows for one year with a value for variable."""
+        return self.year(year).dropna(subset=[variable])
+
+    def country_series(self, country_id, variable):
+        """Rows for one country with a value for variable, sorted by year."""
+        return self.country_id(country_id).dropna(subset=[variable]).sort_values("TIME_PERIOD")
+
+    def year_matrix(self, variable):
+        """variable for every country and year: DataFrame indexed by REF_AREA_ID, one column per year."""
+        matrix = self.df_wide.pivot_table(index="REF_AREA_ID", columns="TIME_PERIOD", values=variable,
+                                          aggfunc="first", observed=True, dropna=False)
+        matrix.index = matrix.index.astype(str)
+        return matrix
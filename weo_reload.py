@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Hot reload of the WEO data behind a dashboard.
+
+A DatasetManager owns everything a dashboard derives from the csv (the
+wide table, the cube, dropdown options, ...), built by one function into
+a Vintage. A daemon thread watches the file; when it changes (and has
+stopped changing) the next vintage is built in that thread and swapped in
+with one assignment, after which the on_swap hooks clear the caches of the
+old one. A callback pins the vintage it started with:
+
+    @app.callback(...)
+    @dataset.pin()
+    def update(...):
+        data = dataset.get()
+
+so it finishes on the old data even if a swap happens meanwhile. The
+on_release hooks run once the last such callback has finished, e.g. to
+delete the old vintage's files.
+"""
+import contextvars
+import os
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+import serve
+
+
+class Vintage:
+    """One build of the dataset; the items returned by build are its attributes."""
+
+    def __init__(self, version, stamp, items):
+        self.__dict__.update(items)
+        self.version = version
+        self.stamp = stamp
+        self.pins = 0  # callbacks running on this vintage
+        self.retired = False  # swapped out; released once pins drops to 0
+
+
+def file_stamp(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+class DatasetManager:
+    """Current Vintage of build(path), rebuilt in the background when path changes."""
+
+    def __init__(self, path, build, interval=5.0):
+        self.path = path
+        self.build = build
+        self.interval = interval
+        self._hooks = []
+        self._release_hooks = []
+        self._lock = threading.Lock()
+        self._pinned = contextvars.ContextVar(f"dataset_{id(self)}", default=None)
+        self._seen = None  # stamp at the previous poll
+        self._failed = None  # stamp whose build raised; not retried until the file changes again
+        stamp = file_stamp(path)
+        self._current = Vintage(1, stamp, build(path))
+
+    @property
+    def current(self):
+        return self._current
+
+    def get(self):
+        """The vintage pinned by the running callback, else the current one."""
+        return self._pinned.get() or self._current
+
+    @contextmanager
+    def pin(self):
+        """Keep get() on the current vintage for the block (or, as a decorator, the call)."""
+        if self._pinned.get() is not None:
+            yield self._pinned.get()
+            return
+        with self._lock:
+            vintage = self._current
+            vintage.pins += 1
+        token = self._pinned.set(vintage)
+        try:
+            yield vintage
+        finally:
+            self._pinned.reset(token)
+            with self._lock:
+                vintage.pins -= 1
+                released = vintage.retired and vintage.pins == 0
+            if released:
+                self._release(vintage)
+
+    def on_swap(self, hook):
+        """Call hook(new, old) after every swap; usable as a decorator."""
+        self._hooks.append(hook)
+        return hook
+
+    def on_release(self, hook):
+        """Call hook(old) once a swapped-out vintage is no longer pinned; usable as a decorator."""
+        self._release_hooks.append(hook)
+        return hook
+
+    def _release(self, old):
+        for hook in self._release_hooks:
+            try:
+                hook(old)
+            except Exception:
+                traceback.print_exc()
+
+    def reload(self, stamp=None):
+        """Build a new vintage from the file now and swap it in."""
+        stamp = stamp or file_stamp(self.path)
+        items = self.build(self.path)
+        with self._lock:
+            old = self._current
+            self._current = new = Vintage(old.version + 1, stamp, items)
+        for hook in self._hooks:
+            hook(new, old)
+        with self._lock:
+            old.retired = True
+            released = old.pins == 0
+        if released:
+            self._release(old)
+        return new
+
+    def check(self):
+        """Reload if the file changed and has kept the same size and mtime since the last poll."""
+        try:
+            stamp = file_stamp(self.path)
+        except OSError:
+            return False  # mid-replace; try again next poll
+        settled, self._seen = stamp == self._seen, stamp
+        if stamp == self._current.stamp or stamp == self._failed or not settled:
+            return False
+        try:
+            vintage = self.reload(stamp)
+        except Exception:
+            self._failed = stamp
+            print(f"Reloading {self.path} failed; keeping version {self._current.version}")
+            traceback.print_exc()
+            return False
+        print(f"Reloaded {self.path}: now version {vintage.version}")
+        return True
+
+    def _watch(self):
+        while True:
+            time.sleep(self.interval)
+            self.check()
+
+    def start(self):
+        """Watch the file from a daemon thread in each process that serves the app (see serve.launch).
+
+        Not in a gunicorn preload master, nor in pool or background-job
+        processes forked from a worker: they would rebuild the dataset too.
+        """
+        serve.in_serving_process(
+            lambda: threading.Thread(target=self._watch, name="dataset-watch", daemon=True).start()
+        )
+        return self
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Grouped statistics for the correlation panels.
+
+Per-country Pearson correlations and least-squares lines are computed for
+every country at once from group sums over the rows sorted by country,
+instead of filtering the frame (or fitting a statsmodels OLS) once per
+country. Robust (Huber) and LOWESS lines are fitted per country in a
+process pool.
+"""
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import serve
+
+try:
+    from scipy import special
+except ImportError:
+    special = None
+
+
+def _group_offsets(groups):
+    """Stable sort order of the rows by group, the group labels and the start of each group."""
+    codes, labels = pd.factorize(np.asarray(groups), sort=False)
+    order = np.argsort(codes, kind="stable")
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    return order, labels[sorted_codes[starts]], starts
+
+
+def t_pvalue(t, df):
+    """Two-sided p-value of a Student t statistic; NaN without scipy."""
+    t, df = np.asarray(t, dtype=float), np.asarray(df, dtype=float)
+    if special is None:
+        return np.full(np.broadcast(t, df).shape, np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return special.betainc(df / 2, 0.5, df / (df + t ** 2))
+
+
+def pearson_from_sums(n, sx, sy, sxx, syy, sxy):
+    """Pearson r, and its p-value, from raw sums over paired observations."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = n * sxy - sx * sy
+        var_x = n * sxx - sx ** 2
+        var_y = n * syy - sy ** 2
+        r = cov / np.sqrt(var_x * var_y)
+        r = np.clip(r, -1.0, 1.0)
+        t = r * np.sqrt((n - 2) / (1 - r ** 2))
+    p = np.where(n > 2, t_pvalue(t, n - 2), np.nan)
+    return r, p
+
+
+def _grouped_moments(groups, x, y):
+    """Centred sums of x and y per group, dropping rows with a missing x or y."""
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    keep = ~(np.isnan(x) | np.isnan(y))
+    groups, x, y = np.asarray(groups)[keep], x[keep], y[keep]
+    if len(x) == 0:
+        return None
+
+    order, labels, starts = _group_offsets(groups)
+    x, y = x[order], y[order]
+    counts = np.diff(np.r_[starts, len(x)])
+    n = counts.astype(float)
+    mean_x = np.add.reduceat(x, starts) / n
+    mean_y = np.add.reduceat(y, starts) / n
+
+    # Centre on the group means before summing squares, for precision
+    x_c = x - np.repeat(mean_x, counts)
+    y_c = y - np.repeat(mean_y, counts)
+    return {
+        "labels": labels, "n": n, "mean_x": mean_x, "mean_y": mean_y,
+        "sxx": np.add.reduceat(x_c * x_c, starts),
+        "syy": np.add.reduceat(y_c * y_c, starts),
+        "sxy": np.add.reduceat(x_c * y_c, starts),
+        "x_min": np.minimum.reduceat(x, starts),
+        "x_max": np.maximum.reduceat(x, starts),
+    }
+
+
+def grouped_pearson(groups, x, y):
+    """Pearson r, n and p-value of x vs y within each group.
+
+    Rows with a missing x or y are dropped first, as Series.corr does.
+    Returns a DataFrame indexed by group with columns n, r and p.
+    """
+    m = _grouped_moments(groups, x, y)
+    if m is None:
+        return pd.DataFrame(columns=["n", "r", "p"])
+
+    zeros = np.zeros_like(m["n"])
+    r, p = pearson_from_sums(m["n"], zeros, zeros, m["sxx"], m["syy"], m["sxy"])
+    return pd.DataFrame({"n": m["n"].astype(int), "r": r, "p": p}, index=pd.Index(m["labels"], name="group"))
+
+
+def grouped_ols(groups, x, y):
+    """Closed-form least-squares line of y on x within each group.
+
+    Returns a DataFrame indexed by group with n, slope, intercept, their
+    standard errors, r2 and the x range of the group (x_min, x_max).
+    """
+    columns = ["n", "slope", "intercept", "slope_se", "intercept_se", "r2", "x_min", "x_max"]
+    m = _grouped_moments(groups, x, y)
+    if m is None:
+        return pd.DataFrame(columns=columns)
+
+    n, sxx, syy, sxy = m["n"], m["sxx"], m["syy"], m["sxy"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = sxy / sxx
+        intercept = m["mean_y"] - slope * m["mean_x"]
+        rss = np.maximum(syy - slope * sxy, 0.0)
+        sigma2 = np.where(n > 2, rss / (n - 2), np.nan)
+        slope_se = np.sqrt(sigma2 / sxx)
+        intercept_se = np.sqrt(sigma2 * (1 / n + m["mean_x"] ** 2 / sxx))
+        r2 = np.where(syy > 0, sxy ** 2 / (sxx * syy), np.nan)
+
+    return pd.DataFrame({
+        "n": n.astype(int), "slope": slope, "intercept": intercept,
+        "slope_se": slope_se, "intercept_se": intercept_se, "r2": r2,
+        "x_min": m["x_min"], "x_max": m["x_max"],
+    }, index=pd.Index(m["labels"], name="group"))
+
+
+# -------------------------------------------------------------
+# Robust and LOWESS lines
+# -------------------------------------------------------------
+def huber_fit(x, y, k=1.345, max_iter=50, tol=1e-8):
+    """Huber M-estimate (intercept, slope) by iteratively reweighted least squares."""
+    w = np.ones_like(x)
+    beta = np.array([np.nan, np.nan])
+    X = np.column_stack([np.ones_like(x), x])
+    for _ in range(max_iter):
+        sw = np.sqrt(w)
+        new_beta = np.linalg.lstsq(X * sw[:, None], y * sw, rcond=None)[0]
+        resid = y - X @ new_beta
+        # Robust scale from the median absolute deviation
+        scale = np.median(np.abs(resid - np.median(resid))) / 0.6745
+        if scale == 0:
+            return tuple(new_beta)
+        u = np.abs(resid) / (k * scale)
+        w = np.where(u <= 1, 1.0, 1.0 / np.maximum(u, 1e-12))
+        if np.allclose(new_beta, beta, atol=tol, rtol=0):
+            break
+        beta = new_beta
+    return tuple(new_beta)
+
+
+def lowess_fit(x, y, frac=2 / 3, iterations=3):
+    """LOWESS smooth of y on x (tricube weights, local lines); returns (x sorted, fitted y)."""
+    order = np.argsort(x)
+    x, y = x[order], y[order]
+    n = len(x)
+    k = min(n, max(2, int(np.ceil(frac * n))))
+
+    # Distance of every point to every other, and each point's k-th nearest
+    dist = np.abs(x[:, None] - x[None, :])
+    h = np.maximum(np.sort(dist, axis=1)[:, k - 1], 1e-12)
+    weights = np.clip(1 - (dist / h[:, None]) ** 3, 0, None) ** 3
+
+    robustness = np.ones(n)
+    fitted = y.copy()
+    for _ in range(iterations + 1):
+        w = weights * robustness[None, :]
+        sw, swx, swy = w.sum(1), w @ x, w @ y
+        swxx, swxy = w @ (x * x), w @ (x * y)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            denom = sw * swxx - swx ** 2
+            slope = np.where(np.abs(denom) > 1e-12, (sw * swxy - swx * swy) / denom, 0.0)
+            intercept = (swy - slope * swx) / sw
+        fitted = intercept + slope * x
+
+        resid = y - fitted
+        s = np.median(np.abs(resid))
+        if s == 0:
+            break
+        robustness = np.clip(1 - (resid / (6 * s)) ** 2, 0, None) ** 2
+    return x, fitted
+
+
+def _fit_group(args):
+    """Worker: one robust line as (label, xs, ys)."""
+    label, x, y, method = args
+    if method == "huber":
+        intercept, slope = huber_fit(x, y)
+        xs = np.array([x.min(), x.max()])
+        return label, xs, intercept + slope * xs
+    return (label,) + lowess_fit(x, y)
+
+
+_pool = None
+
+
+def get_pool():
+    """Process pool shared by the robust fits, created on first use."""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor()
+    return _pool
+
+
+def _reset_pool():
+    global _pool
+    _pool = None
+
+
+# A forked server worker cannot use its parent's pool
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_pool)
+
+
+def grouped_robust(groups, x, y, method="huber", executor=None):
+    """Huber or LOWESS line per group, fitted in a process pool.
+
+    Returns {group: (xs, ys)}. Groups with fewer than three points are
+    skipped. Pass executor=None to use the shared pool, or any executor
+    with .map (e.g. a ThreadPoolExecutor).
+    """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    keep = ~(np.isnan(x) | np.isnan(y))
+    groups, x, y = np.asarray(groups)[keep], x[keep], y[keep]
+    if len(x) == 0:
+        return {}
+
+    order, labels, starts = _group_offsets(groups)
+    x, y = x[order], y[order]
+    bounds = np.r_[starts, len(x)]
+    jobs = [
+        (label, x[lo:hi], y[lo:hi], method)
+        for label, lo, hi in zip(labels, bounds[:-1], bounds[1:]) if hi - lo >= 3
+    ]
+    results = (executor or get_pool()).map(_fit_group, jobs)
+    return {label: (xs, ys) for label, xs, ys in results}
+
+
+class PairCorrelations:
+    """Per-country correlation of every pair of cube indicators, level and diff.
+
+    compute() fills r[kind] and n[kind] with arrays of shape
+    (country, indicator, indicator), using the years where both indicators
+    are present. start() runs it in a daemon thread; lookup() returns None
+    until it has finished.
+    """
+
+    def __init__(self, cube):
+        self.cube = cube
+        self.r = {}
+        self.n = {}
+        self.ready = threading.Event()
+        self._thread = None
+
+    def start(self):
+        global _started
+        _started = self
+        self._thread = threading.Thread(target=self.compute, name="pair-correlations", daemon=True)
+        self._thread.start()
+        return self
+
+    def _restart(self):
+        # A thread copied by a fork is no longer alive in the child
+        if not self.ready.is_set() and not self._thread.is_alive():
+            self.start()
+
+    def compute(self):
+        for kind, values in (("level", self.cube.values), ("diff", self.cube.diff())):
+            present = ~np.isnan(values)
+            m = present.astype(float)
+            # Centre each (country, indicator) series on its mean: r is unchanged, but raw
+            # sums of series at large levels (1e9) cancel catastrophically in n*sxy - sx*sy
+            count = m.sum(axis=1, keepdims=True)
+            mean = np.where(present, values, 0.0).sum(axis=1, keepdims=True, dtype=float) / np.maximum(count, 1)
+            x = np.where(present, values - mean, 0.0)
+
+            n = np.einsum("cyi,cyj->cij", m, m)
+            sx = np.einsum("cyi,cyj->cij", x, m)
+            sxx = np.einsum("cyi,cyj->cij", x * x, m)
+            sxy = np.einsum("cyi,cyj->cij", x, x)
+            r, _ = pearson_from_sums(n, sx, sx.transpose(0, 2, 1), sxx, sxx.transpose(0, 2, 1), sxy)
+            self.r[kind], self.n[kind] = r, n.astype(int)
+        self.ready.set()
+
+    def lookup(self, countries, var_x, var_y, data_type="level"):
+        """DataFrame of n, r, p per country like grouped_pearson, or None if not computed yet."""
+        if not self.ready.is_set():
+            return None
+        cube = self.cube
+        kind = "diff" if data_type == "diff" else "level"
+        i, j = cube.indicator_pos[var_x], cube.indicator_pos[var_y]
+        names = [c for c in countries if c in cube.country_pos]
+        ci = [cube.country_pos[c] for c in names]
+
+        n = self.n[kind][ci, i, j]
+        r = self.r[kind][ci, i, j]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = r * np.sqrt((n - 2) / (1 - r ** 2))
+        p = np.where(n > 2, t_pvalue(t, n - 2), np.nan)
+        result = pd.DataFrame({"n": n, "r": r, "p": p}, index=pd.Index(names, name="group"))
+        return result[result["n"] > 0]
+
+
+# Threads do not survive a fork: a serving worker forked before compute() finished
+# restarts it. One hook for the module, for the instance started last (the current
+# data's), so reloads neither pile up hooks nor keep the matrices of old data alive
+_started = None
+
+
+@serve.in_serving_process
+def _restart_started():
+    if _started is not None:
+        _started._restart()